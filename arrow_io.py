@@ -0,0 +1,296 @@
+"""Typed Arrow IPC / Parquet transfer of the Watch catalog.
+
+export_watches() streams Watch rows (joined to their brand name) out of
+Postgres with COPY ... TO STDOUT straight into a pyarrow CSV reader, and
+writes the resulting record batches to a Parquet or Arrow IPC file.
+import_watches() reads such a file batch by batch and loads each batch
+with COPY ... FROM STDIN into a temporary table, then merges it into Brand
+and Watch. Neither direction holds more than one batch in memory.
+
+CaseDiameter and WaterResistance travel as numbers (millimetres and
+metres), not as "40mm"/"300m" text. The file format follows the extension:
+.parquet/.pq for Parquet, anything else for Arrow IPC.
+"""
+import io
+import os
+import threading
+
+import pyarrow as pa  # type: ignore
+import pyarrow.csv as pa_csv  # type: ignore
+import pyarrow.ipc as pa_ipc  # type: ignore
+import pyarrow.parquet as pq  # type: ignore
+
+from sketches import update_catalog_sketches
+from watches import (
+    BRAND_LOCK_SQL,
+    CASE_DIAMETER_TEXT_SQL,
+    brand_key,
+    brand_lock_key,
+    connect_to_db,
+    watch_sql,
+)
+
+WATCH_SCHEMA = pa.schema([
+    ('watch_id', pa.int64()),
+    ('brand_id', pa.int64()),
+    ('brand_name', pa.string()),
+    ('model_name', pa.string()),
+    ('dial_color', pa.string()),
+    ('movement_type', pa.string()),
+    ('movement_caliber', pa.string()),
+    ('case_material', pa.string()),
+    ('case_diameter', pa.float64()),
+    ('water_resistance', pa.int32()),
+])
+
+EXPORT_WATCHES_SQL = """
+    SELECT w.WatchID, w.BrandID, b.BrandName, w.ModelName, w.DialColor, w.MovementType,
+           w.MovementCaliber, w.CaseMaterial, w.CaseDiameterMM, w.WaterResistanceM
+    FROM Watch w
+    LEFT JOIN Brand b ON b.BrandID = w.BrandID
+    ORDER BY w.WatchID
+"""
+
+# Columns loaded by import_watches(), in staging-table order; brand_key is
+# computed from brand_name on the way in.
+IMPORT_COLUMNS = ('brand_name', 'brand_key', 'model_name', 'dial_color', 'movement_type',
+                  'movement_caliber', 'case_material', 'case_diameter', 'water_resistance')
+
+CREATE_IMPORT_TABLE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS watch_import (
+        BrandName VARCHAR(100),
+        BrandKey VARCHAR(100),
+        ModelName VARCHAR(100),
+        DialColor VARCHAR(50),
+        MovementType VARCHAR(50),
+        MovementCaliber VARCHAR(50),
+        CaseMaterial VARCHAR(50),
+        CaseDiameter NUMERIC,
+        WaterResistance INTEGER
+    ) ON COMMIT DELETE ROWS
+"""
+
+# Keys of the brands a batch would create. import_watches() takes their
+# advisory locks (BRAND_LOCK_SQL) in sorted order before merging, as the
+# row importers do one brand at a time.
+NEW_IMPORT_BRAND_KEYS_SQL = """
+    SELECT DISTINCT s.BrandKey
+    FROM watch_import s
+    WHERE s.BrandKey <> ''
+      AND NOT EXISTS (SELECT 1 FROM Brand b WHERE b.BrandKey = s.BrandKey)
+      AND NOT EXISTS (SELECT 1 FROM BrandAlias a WHERE a.AliasKey = s.BrandKey)
+"""
+
+# Brands are matched on their normalised key, including aliases; one new
+# brand per unknown key. Sorted inserts keep concurrent importers taking
+# locks in the same order.
+MERGE_IMPORT_BRANDS_SQL = """
+    INSERT INTO Brand (BrandName, BrandKey)
+    SELECT DISTINCT ON (s.BrandKey) s.BrandName, s.BrandKey
+    FROM watch_import s
+    WHERE s.BrandKey <> ''
+      AND NOT EXISTS (SELECT 1 FROM BrandAlias a WHERE a.AliasKey = s.BrandKey)
+    ORDER BY s.BrandKey, s.BrandName
+    ON CONFLICT DO NOTHING
+"""
+
+MERGE_IMPORT_WATCHES_SQL = f"""
+    INSERT INTO Watch (BrandID, ModelName, DialColor, MovementType, MovementCaliber, CaseMaterial, CaseDiameter, WaterResistance)
+    SELECT b.BrandID, s.ModelName, s.DialColor, s.MovementType, s.MovementCaliber,
+           s.CaseMaterial, {CASE_DIAMETER_TEXT_SQL.format('s.CaseDiameter')},
+           s.WaterResistance::text
+    FROM watch_import s
+    JOIN (
+        SELECT BrandKey AS Key, BrandID FROM Brand
+        UNION ALL
+        SELECT AliasKey, BrandID FROM BrandAlias
+    ) b ON b.Key = s.BrandKey
+    WHERE s.ModelName IS NOT NULL
+    ORDER BY s.ModelName
+    ON CONFLICT (ModelName) DO NOTHING
+"""
+
+# Rows MERGE_IMPORT_WATCHES_SQL leaves out because no brand matches them,
+# typically an empty brand_name.
+UNMATCHED_IMPORT_WATCHES_SQL = """
+    SELECT s.ModelName, s.BrandName
+    FROM watch_import s
+    WHERE s.ModelName IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM Brand b WHERE b.BrandKey = s.BrandKey)
+      AND NOT EXISTS (SELECT 1 FROM BrandAlias a WHERE a.AliasKey = s.BrandKey)
+    ORDER BY s.ModelName
+"""
+
+DEFAULT_BATCH_SIZE = 65536
+
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+
+
+def _copy_out_reader(conn, query, block_size):
+    """Stream COPY (query) TO STDOUT as CSV into a pyarrow streaming CSV reader.
+
+    COPY runs on a helper thread that writes into a pipe; the returned
+    reader parses the other end block by block. Returns (reader, finish),
+    where finish() joins the thread and, unless told otherwise, re-raises
+    any COPY error. The reader yields nothing when COPY writes nothing
+    (no rows, or COPY failed), as pyarrow rejects an empty CSV stream.
+    """
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def copy_out():
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe, conn.cursor() as cur:
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", pipe)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=copy_out, daemon=True)
+    thread.start()
+
+    pipe = os.fdopen(read_fd, 'rb')
+    source = pa.PythonFile(pipe, mode='r')
+
+    def finish(raise_errors=True):
+        source.close()
+        thread.join()
+        if errors and raise_errors:
+            raise errors[0]
+
+    try:
+        if not pipe.peek(1):
+            return iter(()), finish
+        reader = pa_csv.open_csv(
+            source,
+            read_options=pa_csv.ReadOptions(column_names=WATCH_SCHEMA.names,
+                                            block_size=block_size),
+            # COPY writes NULL as an empty field and '' as a quoted empty field.
+            convert_options=pa_csv.ConvertOptions(
+                column_types=WATCH_SCHEMA, strings_can_be_null=True,
+                quoted_strings_can_be_null=False),
+        )
+    except BaseException:
+        finish(raise_errors=False)
+        raise
+    return reader, finish
+
+
+def export_watches(path, batch_size=DEFAULT_BATCH_SIZE, compression='zstd', conn=None):
+    """Write the Watch catalog to a Parquet or Arrow IPC file; returns the row count.
+
+    An empty catalog gives a file with the schema and no rows.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_to_db(readonly=True)
+
+    rows = 0
+    try:
+        # Roughly 100 bytes per CSV row, so a block holds about batch_size rows.
+        reader, finish = _copy_out_reader(conn, EXPORT_WATCHES_SQL, block_size=batch_size * 100)
+        try:
+            if _is_parquet(path):
+                writer = pq.ParquetWriter(path, WATCH_SCHEMA, compression=compression)
+            else:
+                writer = pa_ipc.new_file(
+                    path, WATCH_SCHEMA,
+                    options=pa_ipc.IpcWriteOptions(compression=compression))
+            with writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+        except BaseException:
+            # The COPY thread fails with a broken pipe once we stop reading;
+            # report the original error instead.
+            finish(raise_errors=False)
+            raise
+        finish()
+    finally:
+        if own_conn:
+            conn.close()
+
+    print(f"Exported {rows} watches to {path}.")
+    return rows
+
+
+def _read_batches(path, batch_size):
+    if _is_parquet(path):
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_size)
+        return
+    with pa.memory_map(path) as source:
+        try:
+            reader = pa_ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            source.seek(0)
+            batches = pa_ipc.open_stream(source)
+        yield from batches
+
+
+def _batch_to_csv(batch):
+    """Render the IMPORT_COLUMNS of a batch as header-less CSV for COPY FROM."""
+    columns = []
+    for name in IMPORT_COLUMNS:
+        if name == 'brand_key':
+            brand_names = columns[-1].to_pylist()
+            columns.append(pa.array([brand_key(' '.join(brand_name.split())) if brand_name else None
+                                     for brand_name in brand_names], pa.string()))
+            continue
+        index = batch.schema.get_field_index(name)
+        if index == -1:
+            columns.append(pa.nulls(batch.num_rows, WATCH_SCHEMA.field(name).type))
+        else:
+            columns.append(batch.column(index))
+    table = pa.Table.from_arrays(columns, names=list(IMPORT_COLUMNS))
+
+    buf = io.BytesIO()
+    pa_csv.write_csv(table, buf, write_options=pa_csv.WriteOptions(include_header=False))
+    buf.seek(0)
+    return buf
+
+
+def import_watches(path, batch_size=DEFAULT_BATCH_SIZE, conn=None):
+    """Load a Parquet or Arrow IPC file written by export_watches() into the catalog.
+
+    Brands are matched by name and created when missing; watches whose
+    ModelName already exists are left alone, and watches with no usable
+    brand name are reported and skipped. Each batch is committed on its
+    own. Returns (rows read, watches inserted), or None if path does not
+    exist.
+    """
+    if not os.path.exists(path):
+        print(f"Error: File {path} not found.")
+        return
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_to_db()
+    rows = inserted = skipped = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_IMPORT_TABLE_SQL)
+            for batch in _read_batches(path, batch_size):
+                cur.copy_expert("COPY watch_import FROM STDIN WITH (FORMAT csv)",
+                                _batch_to_csv(batch))
+                cur.execute(NEW_IMPORT_BRAND_KEYS_SQL)
+                for key in sorted(key for key, in cur.fetchall()):
+                    cur.execute(BRAND_LOCK_SQL, brand_lock_key(key))
+                cur.execute(MERGE_IMPORT_BRANDS_SQL)
+                cur.execute(UNMATCHED_IMPORT_WATCHES_SQL)
+                for model_name, brand_name in cur.fetchall():
+                    print(f"An error occurred while importing watch {model_name}: "
+                          f"no brand matches {brand_name or ''!r}")
+                    skipped += 1
+                cur.execute(watch_sql(conn, MERGE_IMPORT_WATCHES_SQL))
+                inserted += cur.rowcount
+                conn.commit()
+                rows += batch.num_rows
+        update_catalog_sketches(conn)
+    finally:
+        if own_conn:
+            conn.close()
+
+    print(f"Imported {inserted} of {rows} watches from {path}, {skipped} skipped.")
+    return rows, inserted
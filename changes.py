@@ -0,0 +1,135 @@
+"""Change feed of the Brand and Watch tables.
+
+create_tables() gives both tables UpdatedAt and Version columns, stamped
+by a trigger on every insert and update (see TOUCH_FUNCTION_SQL). Version
+is the ID of the writing transaction. read_changes() returns the rows
+written since a watermark, streamed from a server-side cursor, plus the
+watermark to pass next time:
+
+    watermark, changes = read_changes(since=0)    # 0: everything
+    for change in changes:
+        apply(change.table, change.record)
+    save(watermark)
+
+Each call costs time in proportion to the rows changed since the
+watermark, not to the catalog size. The watermark is the oldest
+transaction still running when the call starts, and only rows written
+before it are returned. A transaction that commits late therefore
+cannot slip in behind a consumer's watermark; it shows up in a later
+call. The flip side is that a long-open transaction holds the watermark
+back until it ends. A row may be delivered twice, so consumers should
+apply changes as upserts. Deletes are not part of the feed.
+"""
+import json
+
+from watches import Brand, Watch, _Record, connect_to_db
+
+# Oldest transaction ID still running; every Version below it is final.
+WATERMARK_SQL = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+BRAND_CHANGES_SQL = """
+    SELECT BrandID, BrandName, FoundingYear, CountryOfOrigin, Version, UpdatedAt
+    FROM Brand
+    WHERE Version >= %s AND Version < %s
+    ORDER BY Version, BrandID
+"""
+
+WATCH_CHANGES_SQL = """
+    SELECT WatchID, BrandID, ModelName, DialColor, MovementType, MovementCaliber,
+           CaseMaterial, CaseDiameter, WaterResistance, Version, UpdatedAt
+    FROM Watch
+    WHERE Version >= %s AND Version < %s
+    ORDER BY Version, WatchID
+"""
+
+# Upper bound for reading every row; Version is a 64-bit transaction ID.
+MAX_VERSION = 2 ** 63 - 1
+
+# Rows fetched per round trip from the server-side cursor.
+DEFAULT_FETCH_SIZE = 10000
+
+
+class Change(_Record):
+    """A Brand or Watch record as last written, with its Version and UpdatedAt."""
+    __slots__ = ('table', 'version', 'updated_at', 'record')
+
+    def to_json(self):
+        """One line of JSON: the record's fields plus table, version and updated_at."""
+        fields = dict(zip(self.record.__slots__, self.record))
+        fields.update(table=self.table, version=self.version,
+                      updated_at=self.updated_at.isoformat() if self.updated_at else None)
+        return json.dumps(fields, default=str)
+
+
+def read_changes(since=0, conn=None, fetch_size=DEFAULT_FETCH_SIZE):
+    """Brand and Watch rows written at or after watermark since, as (watermark, changes).
+
+    changes is an iterator of Change records: brands first so that watches
+    can refer to them, each table in (Version, key) order. Pass watermark
+    as since on the next call once changes is exhausted. Reads go to a
+    replica when one is configured. A replica that lags behind since
+    yields nothing and hands since back. Without conn the iterator closes
+    its own connection when it finishes.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_to_db(readonly=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(WATERMARK_SQL)
+            watermark = max(since, cur.fetchone()[0])
+    except BaseException:
+        if own_conn:
+            conn.close()
+        raise
+    return watermark, _stream_changes(conn, since, watermark, fetch_size, own_conn)
+
+
+def read_snapshot(conn=None, fetch_size=DEFAULT_FETCH_SIZE):
+    """Every Brand and Watch row from one consistent snapshot, as (watermark, changes).
+
+    Same shape as read_changes(), for bootstrapping a consumer before it
+    follows the feed from watermark. Rows in the snapshot that were written
+    at or after watermark come through the feed again. A conn passed in
+    should be in REPEATABLE READ mode, as the one opened here is.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_to_db(readonly=True)
+        conn.set_session(isolation_level='REPEATABLE READ')
+    try:
+        # The first statement fixes the snapshot, so the watermark and the
+        # rows below come from the same one.
+        with conn.cursor() as cur:
+            cur.execute(WATERMARK_SQL)
+            watermark = cur.fetchone()[0]
+    except BaseException:
+        if own_conn:
+            conn.close()
+        raise
+    return watermark, _stream_changes(conn, 0, MAX_VERSION, fetch_size, own_conn)
+
+
+def _stream_changes(conn, since, until, fetch_size, own_conn):
+    try:
+        for table, sql, record_type in (('Brand', BRAND_CHANGES_SQL, Brand),
+                                        ('Watch', WATCH_CHANGES_SQL, Watch)):
+            # A named (server-side) cursor streams the rows instead of
+            # loading them whole.
+            with conn.cursor(name=f'{table.lower()}_changes') as cur:
+                cur.itersize = fetch_size
+                cur.execute(sql, (since, until))
+                for *fields, version, updated_at in cur:
+                    yield Change(table, version, updated_at, record_type(*fields))
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def print_changes(since=0):
+    """Write the changes since a watermark to stdout as JSON lines; returns the new watermark."""
+    watermark, changes = read_changes(since)
+    for change in changes:
+        print(change.to_json())
+    return watermark
@@ -0,0 +1,135 @@
+"""In-process replica of the Brand and Watch tables.
+
+LocalReplica copies both tables into dicts once, from a consistent
+snapshot (changes.read_snapshot()). It then follows the change feed
+(changes.read_changes()) from the snapshot's watermark. Lookups are
+plain dict reads with no database round trip:
+
+    replica = LocalReplica.bootstrap()
+    replica.start()                        # poll every POLL_INTERVAL seconds
+    replica.get_brand(12)
+    replica.get_watch("Rolex Submariner 116610LN")
+
+Each refresh applies its whole batch of changes under a lock, and
+brands() / watches() copy their lists under the same lock. Iteration
+therefore always sees the catalog as of a single watermark. A lookup
+can land between the brand and watch halves of a refresh. Rows deleted
+upstream stay in the replica, as the feed does not carry deletes.
+"""
+import logging
+import threading
+
+from changes import read_changes, read_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Seconds between polls of the change feed by start().
+POLL_INTERVAL = 5.0
+
+
+class LocalReplica:
+    """Brand and Watch records kept in step with the database; see the module docstring."""
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.watermark = None
+        # Watermark of the last refresh that changed anything, so it only
+        # moves when the data may have; usable as an ETag.
+        self.version = None
+        self._brands = {}  # BrandID -> Brand
+        self._watches = {}  # WatchID -> Watch
+        self._by_model_name = {}  # ModelName -> Watch
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def bootstrap(cls, conn=None, interval=POLL_INTERVAL):
+        """A replica loaded from a full snapshot of the catalog."""
+        replica = cls(interval)
+        watermark, changes = read_snapshot(conn)
+        replica._apply(watermark, changes)
+        return replica
+
+    def __len__(self):
+        return len(self._watches)
+
+    def _apply(self, watermark, changes):
+        # Fetch the whole batch first, so the lock is held only while the
+        # dicts change.
+        changes = list(changes)
+        with self._lock:
+            for change in changes:
+                record = change.record
+                if change.table == 'Brand':
+                    self._brands[record.brand_id] = record
+                    continue
+                previous = self._watches.get(record.watch_id)
+                if previous is not None and previous.model_name != record.model_name:
+                    self._by_model_name.pop(previous.model_name, None)
+                self._watches[record.watch_id] = record
+                self._by_model_name[record.model_name] = record
+            self.watermark = watermark
+            if changes or self.version is None:
+                self.version = watermark
+        return len(changes)
+
+    def refresh(self, conn=None):
+        """Apply the changes since the last refresh; returns how many rows changed."""
+        watermark, changes = read_changes(self.watermark, conn)
+        return self._apply(watermark, changes)
+
+    def get_brand(self, brand_id):
+        """The Brand with this BrandID, or None."""
+        return self._brands.get(brand_id)
+
+    def get_watch(self, model_name):
+        """The Watch with this ModelName, or None."""
+        return self._by_model_name.get(model_name)
+
+    def get_watch_by_id(self, watch_id):
+        return self._watches.get(watch_id)
+
+    def brands(self):
+        """All Brand records as of the current watermark, in BrandID order."""
+        with self._lock:
+            brands = list(self._brands.values())
+        return sorted(brands, key=lambda brand: brand.brand_id)
+
+    def watches(self):
+        """All Watch records as of the current watermark, in WatchID order."""
+        with self._lock:
+            watches = list(self._watches.values())
+        return sorted(watches, key=lambda watch: watch.watch_id)
+
+    def snapshot(self):
+        """(version, brands, watches) as of one refresh, in BrandID / WatchID order."""
+        with self._lock:
+            version = self.version
+            brands = list(self._brands.values())
+            watches = list(self._watches.values())
+        return (version, sorted(brands, key=lambda brand: brand.brand_id),
+                sorted(watches, key=lambda watch: watch.watch_id))
+
+    def start(self):
+        """Refresh every interval seconds on a daemon thread until stop()."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, name='LocalReplica', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the last good state; the next poll catches up.
+                logger.warning("Replica refresh failed at watermark %s: %s", self.watermark, e)
@@ -0,0 +1,245 @@
+"""Read-only JSON HTTP service over the watch catalog.
+
+Requests are answered from a LocalReplica (replica.py), so serving
+never touches the database; the replica follows the change feed in the
+background. Endpoints:
+
+    GET /brands                  brands in BrandID order
+    GET /brands/<id>             one brand
+    GET /watches                 watches in WatchID order; filters:
+                                   q=<text in model name>, brand_id=<id>,
+                                   movement_type=<type>
+    GET /watches/<model name>    one watch (URL-encoded)
+    GET /stats                   same figures as watches.py stats
+
+Lists are keyset-paginated: ?limit=N (default DEFAULT_PAGE_SIZE, at most
+MAX_PAGE_SIZE) and ?after=<last id of the previous page>. Each page
+carries the id to pass as "next", or null on the last page.
+
+Every response has an ETag built from the replica's version, which only
+moves when a refresh changes data. A matching If-None-Match gets 304 Not
+Modified. Response bodies are kept in an LRU cache keyed by URL, and the
+cache is emptied when the version moves. The sorted lists behind the
+endpoints are rebuilt only then as well.
+
+    python watches.py serve --port 8080
+"""
+import bisect
+import collections
+import json
+import logging
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from replica import POLL_INTERVAL, LocalReplica
+from watches import spec_number
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Response bodies kept per catalog version.
+CACHE_SIZE = 4096
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _as_dict(record):
+    return dict(zip(record.__slots__, record))
+
+
+def _int_param(params, name, default=None, maximum=None):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer, not {value!r}")
+    return min(value, maximum) if maximum is not None else value
+
+
+class _CatalogView:
+    """The replica's records at one version, sorted for keyset pagination."""
+
+    def __init__(self, replica):
+        self.version, self.brands, self.watches = replica.snapshot()
+        self.brand_ids = [brand.brand_id for brand in self.brands]
+        self.watch_ids = [watch.watch_id for watch in self.watches]
+        self._stats = None
+
+    def brand_page(self, after, limit):
+        start = bisect.bisect_right(self.brand_ids, after) if after is not None else 0
+        page = self.brands[start:start + limit]
+        more = start + limit < len(self.brands)
+        return page, page[-1].brand_id if page and more else None
+
+    def watch_page(self, after, limit, predicate=None):
+        start = bisect.bisect_right(self.watch_ids, after) if after is not None else 0
+        page = []
+        # Stops at the first match past a full page, so a page costs the
+        # rows scanned to fill it rather than the whole catalog.
+        for position in range(start, len(self.watches)):
+            watch = self.watches[position]
+            if predicate is None or predicate(watch):
+                if len(page) == limit:
+                    return page, page[-1].watch_id
+                page.append(watch)
+        return page, None
+
+    def stats(self):
+        if self._stats is None:
+            brand_names = {brand.brand_id: brand.brand_name for brand in self.brands}
+            per_brand = collections.Counter(watch.brand_id for watch in self.watches
+                                            if watch.brand_id in brand_names)
+            diameters = [diameter
+                         for diameter in map(spec_number, (watch.case_diameter for watch in self.watches))
+                         if diameter is not None]
+            self._stats = {
+                "brand_count": len(self.brands),
+                "watch_count": len(self.watches),
+                "top_brands": [(brand_names[brand_id], count)
+                               for brand_id, count in per_brand.most_common(5)],
+                "avg_case_diameter": sum(diameters) / len(diameters) if diameters else None,
+                "movement_types": collections.Counter(
+                    watch.movement_type for watch in self.watches).most_common(),
+            }
+        return self._stats
+
+
+class CatalogService:
+    """Routing, caching and ETags for the handler below; usable without a server."""
+
+    def __init__(self, replica, cache_size=CACHE_SIZE):
+        self.replica = replica
+        self.cache_size = cache_size
+        self._view = None
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def view(self):
+        """The current _CatalogView, rebuilt when the replica's version has moved."""
+        view = self._view
+        if view is None or view.version != self.replica.version:
+            with self._lock:
+                view = self._view
+                if view is None or view.version != self.replica.version:
+                    view = self._view = _CatalogView(self.replica)
+                    self._cache.clear()
+        return view
+
+    def get(self, url):
+        """(status, body bytes, etag) for a GET of url."""
+        view = self.view()
+        etag = f'"{view.version}"'
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached is not None and cached[0] == view.version:
+                self._cache.move_to_end(url)
+                return 200, cached[1], etag
+
+        try:
+            payload = self._route(view, url)
+        except HTTPError as e:
+            return e.status, json.dumps({"error": str(e)}).encode('utf-8'), etag
+        body = json.dumps(payload, default=str).encode('utf-8')
+
+        with self._lock:
+            if self._view is view:
+                self._cache[url] = (view.version, body)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return 200, body, etag
+
+    def _route(self, view, url):
+        parsed = urllib.parse.urlsplit(url)
+        parts = [urllib.parse.unquote(part) for part in parsed.path.strip('/').split('/')]
+        params = dict(urllib.parse.parse_qsl(parsed.query))
+        limit = max(1, _int_param(params, 'limit', DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+        if parts == ['brands']:
+            page, after = view.brand_page(_int_param(params, 'after'), limit)
+            return {"items": [_as_dict(brand) for brand in page], "next": after}
+        if len(parts) == 2 and parts[0] == 'brands':
+            brand = self.replica.get_brand(_int_param({'id': parts[1]}, 'id'))
+            if brand is None:
+                raise HTTPError(404, f"brand {parts[1]} not found")
+            return _as_dict(brand)
+        if parts == ['watches']:
+            page, after = view.watch_page(_int_param(params, 'after'), limit,
+                                          self._watch_filter(params))
+            return {"items": [_as_dict(watch) for watch in page], "next": after}
+        if len(parts) == 2 and parts[0] == 'watches':
+            watch = self.replica.get_watch(parts[1])
+            if watch is None:
+                raise HTTPError(404, f"watch {parts[1]!r} not found")
+            return _as_dict(watch)
+        if parts == ['stats']:
+            return view.stats()
+        raise HTTPError(404, f"no such endpoint: {parsed.path}")
+
+    def _watch_filter(self, params):
+        text = params.get('q', '').casefold()
+        brand_id = _int_param(params, 'brand_id')
+        movement_type = params.get('movement_type')
+        if not text and brand_id is None and movement_type is None:
+            return None
+
+        def predicate(watch):
+            return ((not text or text in (watch.model_name or '').casefold())
+                    and (brand_id is None or watch.brand_id == brand_id)
+                    and (movement_type is None or watch.movement_type == movement_type))
+        return predicate
+
+
+class CatalogRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections; every response sets Content-Length.
+    protocol_version = 'HTTP/1.1'
+    service = None  # CatalogService, set by make_server()
+
+    def do_GET(self):
+        status, body, etag = self.service.get(self.path)
+        if status == 200 and etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One stderr line per request would cap throughput.
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def make_server(replica, host='127.0.0.1', port=8080):
+    """A ThreadingHTTPServer answering from replica; call serve_forever() on it."""
+    handler = type('Handler', (CatalogRequestHandler,), {'service': CatalogService(replica)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(host='127.0.0.1', port=8080, interval=POLL_INTERVAL):
+    """Bootstrap a replica from the database and serve it until interrupted."""
+    replica = LocalReplica.bootstrap(interval=interval)
+    replica.start()
+    server = make_server(replica, host, port)
+    print(f"Serving {len(replica)} watches on http://{host}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        replica.stop()
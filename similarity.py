@@ -0,0 +1,251 @@
+"""Nearest-neighbour search for "similar watches".
+
+SimilarityIndex ranks watches by case diameter and water resistance. Both
+specs are normalised, and water resistance is log-scaled so that 100m vs
+200m counts for more than 1000m vs 1100m. Watches are partitioned by
+(movement type, case material). Each partition has its own 2-d tree, and
+a mismatch on either category adds CATEGORY_PENALTY to the distance.
+Partitions are searched in order of their penalty, and the search stops
+once no remaining partition can beat the current k-th result. In a
+catalog-sized index a query usually touches a handful of tree leaves.
+
+    index = SimilarityIndex.load()           # or .from_snapshot(snapshot)
+    index.attach()                           # follow watches.add_watch()
+    index.similar("Rolex Submariner 116610LN", k=5)
+
+Watches are keyed by ModelName. add() puts new watches in a small
+per-partition buffer that is scanned linearly, and folds the buffer into
+a rebuilt tree once it grows past the square root of the partition size.
+"""
+import heapq
+import math
+
+import numpy as np  # type: ignore
+
+import watches
+from snapshot import CatalogSnapshot
+
+# Distance added per mismatched category (movement type, case material),
+# in units of the normalised specs (about one standard deviation).
+CATEGORY_PENALTY = 1.0
+
+# Points per tree leaf; leaves are scanned with one vectorised distance.
+LEAF_SIZE = 16
+
+# Smallest pending buffer that triggers a rebuild of a partition's tree.
+MIN_REBUILD = 64
+
+
+class _KDTree:
+    """Static balanced 2-d tree stored as a reordering of its points.
+
+    The node covering positions [lo, hi) splits at mid = (lo + hi) // 2 on
+    axis depth % 2; smaller coordinates sit left of mid, larger ones right.
+    """
+
+    def __init__(self, points, names):
+        self.points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        self.names = list(names)
+        order = np.arange(len(self.names))
+        self._build(order, 0, len(order), 0)
+        self.points = self.points[order]
+        self.names = [self.names[position] for position in order]
+
+    def __len__(self):
+        return len(self.names)
+
+    def _build(self, order, lo, hi, depth):
+        if hi - lo <= LEAF_SIZE:
+            return
+        axis = depth % 2
+        mid = (lo + hi) // 2
+        segment = order[lo:hi]
+        order[lo:hi] = segment[np.argpartition(self.points[segment, axis], mid - lo)]
+        self._build(order, lo, mid, depth + 1)
+        self._build(order, mid + 1, hi, depth + 1)
+
+    def search(self, point, results, offset, exclude):
+        if len(self):
+            self._search(point, results, offset, exclude, 0, len(self), 0)
+
+    def _search(self, point, results, offset, exclude, lo, hi, depth):
+        if hi - lo <= LEAF_SIZE:
+            _scan(self.points[lo:hi], self.names[lo:hi], point, results, offset, exclude)
+            return
+        axis = depth % 2
+        mid = (lo + hi) // 2
+        delta = point[axis] - self.points[mid, axis]
+        near, far = ((lo, mid), (mid + 1, hi)) if delta < 0 else ((mid + 1, hi), (lo, mid))
+
+        _scan(self.points[mid:mid + 1], self.names[mid:mid + 1], point, results, offset, exclude)
+        self._search(point, results, offset, exclude, *near, depth + 1)
+        if not results.full() or offset + abs(delta) < results.worst():
+            self._search(point, results, offset, exclude, *far, depth + 1)
+
+
+class _Results:
+    """Bounded max-heap of the k best (distance, model name) pairs seen so far."""
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+
+    def full(self):
+        return len(self._heap) >= self.k
+
+    def worst(self):
+        """Distance a candidate must beat; infinite until k results are in."""
+        return -self._heap[0][0] if self.full() else math.inf
+
+    def offer(self, distance, name):
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (-distance, name))
+        elif distance < -self._heap[0][0]:
+            heapq.heapreplace(self._heap, (-distance, name))
+
+    def sorted(self):
+        return sorted(((name, -negated) for negated, name in self._heap),
+                      key=lambda pair: pair[1])
+
+
+def _scan(points, names, point, results, offset, exclude):
+    if not len(names):
+        return
+    distances = np.sqrt(((points - point) ** 2).sum(axis=1)) + offset
+    for position in np.flatnonzero(distances < results.worst()):
+        if names[position] != exclude:
+            results.offer(float(distances[position]), names[position])
+
+
+class _Partition:
+    """The watches of one (movement type, case material): a tree plus a pending buffer."""
+
+    def __init__(self, points=(), names=()):
+        self.tree = _KDTree(points, names)
+        self.pending_points = []
+        self.pending_names = []
+
+    def __len__(self):
+        return len(self.tree) + len(self.pending_names)
+
+    def add(self, point, name):
+        self.pending_points.append(point)
+        self.pending_names.append(name)
+        if len(self.pending_names) > max(MIN_REBUILD, math.isqrt(len(self.tree))):
+            self._rebuild()
+
+    def remove(self, name):
+        if name in self.pending_names:
+            position = self.pending_names.index(name)
+            del self.pending_names[position], self.pending_points[position]
+        else:
+            keep = [position for position, other in enumerate(self.tree.names) if other != name]
+            self.tree = _KDTree(self.tree.points[keep], [self.tree.names[p] for p in keep])
+
+    def _rebuild(self):
+        points = np.concatenate([self.tree.points, np.array(self.pending_points).reshape(-1, 2)])
+        self.tree = _KDTree(points, self.tree.names + self.pending_names)
+        self.pending_points = []
+        self.pending_names = []
+
+    def search(self, point, results, offset, exclude):
+        self.tree.search(point, results, offset, exclude)
+        if self.pending_names:
+            _scan(np.array(self.pending_points), self.pending_names, point, results, offset,
+                  exclude)
+
+
+class SimilarityIndex:
+    """Top-k similar watches by specs; see the module docstring."""
+
+    def __init__(self, scales, fill):
+        # Per-feature divisors and the values used for missing specs, fixed
+        # when the index is built so later additions are placed consistently.
+        self.scales = scales
+        self.fill = fill
+        self._partitions = {}
+        self._watches = {}  # model name -> (partition key, point)
+
+    @classmethod
+    def load(cls, conn=None):
+        """Build from the database, via a CatalogSnapshot."""
+        return cls.from_snapshot(CatalogSnapshot.load(conn))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        diameters = snapshot.column('case_diameter')
+        water = np.log1p(snapshot.column('water_resistance'))
+        features = np.column_stack([diameters, water])
+
+        fill = np.nan_to_num(np.nanmedian(features, axis=0)) if len(snapshot) else np.zeros(2)
+        scales = np.nanstd(features, axis=0) if len(snapshot) else np.ones(2)
+        scales = np.where(np.isfinite(scales) & (scales > 0), scales, 1.0)
+        index = cls(scales, fill)
+
+        features = np.where(np.isnan(features), fill, features) / scales
+        keys = list(zip(snapshot.column('movement_type').values(),
+                        snapshot.column('case_material').values()))
+        names = list(snapshot.column('model_name'))
+
+        grouped = {}
+        for position, key in enumerate(keys):
+            grouped.setdefault(key, []).append(position)
+        for key, positions in grouped.items():
+            index._partitions[key] = _Partition(features[positions],
+                                                [names[position] for position in positions])
+            for position in positions:
+                index._watches[names[position]] = (key, features[position])
+        return index
+
+    def __len__(self):
+        return len(self._watches)
+
+    def _point(self, case_diameter, water_resistance):
+        diameter = watches.spec_number(case_diameter)
+        water = watches.spec_number(water_resistance)
+        raw = np.array([self.fill[0] if diameter is None else diameter,
+                        self.fill[1] if water is None else math.log1p(water)])
+        return raw / self.scales
+
+    def add(self, watch):
+        """Index a Watch record, replacing an earlier entry with the same ModelName."""
+        if watch.model_name in self._watches:
+            self.remove(watch.model_name)
+        key = (watch.movement_type, watch.case_material)
+        point = self._point(watch.case_diameter, watch.water_resistance)
+        self._partitions.setdefault(key, _Partition()).add(point, watch.model_name)
+        self._watches[watch.model_name] = (key, point)
+
+    def remove(self, model_name):
+        key, _ = self._watches.pop(model_name)
+        self._partitions[key].remove(model_name)
+
+    def attach(self):
+        """Keep the index current with every watch added through watches.add_watch()."""
+        watches.watch_added_hooks.append(self.add)
+
+    def nearest(self, case_diameter=None, water_resistance=None, movement_type=None,
+                case_material=None, k=5, exclude=None):
+        """[(model name, distance)] of the k watches closest to the given specs."""
+        return self._search(self._point(case_diameter, water_resistance), movement_type,
+                            case_material, k, exclude)
+
+    def _search(self, point, movement_type, case_material, k, exclude):
+        def mismatches(key):
+            return (key[0] != movement_type) + (key[1] != case_material)
+
+        results = _Results(k)
+        for key in sorted(self._partitions, key=mismatches):
+            offset = mismatches(key) * CATEGORY_PENALTY
+            if results.full() and offset >= results.worst():
+                break
+            self._partitions[key].search(point, results, offset, exclude)
+        return results.sorted()
+
+    def similar(self, model_name, k=5):
+        """[(model name, distance)] of the k watches most like model_name, excluding it.
+
+        Raises KeyError for an unknown model name.
+        """
+        (movement_type, case_material), point = self._watches[model_name]
+        return self._search(point, movement_type, case_material, k, exclude=model_name)
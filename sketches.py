@@ -0,0 +1,368 @@
+"""Approximate catalog statistics from streaming sketches.
+
+CatalogSketches bundles the sketches behind get_catalog_stats(approximate=True):
+
+    watches          HyperLogLog over ModelName      -> watch_count
+    brands           HyperLogLog over BrandID        -> brand_count
+    brand_counts     count-min sketch of watches per BrandID
+    top_brands       space-saving summary of BrandID -> top_brands
+    movement_types   space-saving summary            -> movement_types
+    diameter_sum/n   running sum and count           -> avg_case_diameter
+
+The stored sketches carry a watermark from the change feed (see
+changes.py) and cover every Brand and Watch row created before it,
+whichever path inserted it. update_catalog_sketches() folds in the rows
+created since, found through the CreatedVersion column that the
+catalog_touch trigger stamps on insert, and moves the watermark on. The
+importers run it when they finish and add_watch() every
+SKETCH_UPDATE_INTERVAL watches; readers fold in whatever is newer in
+memory. Reading the stats is one primary-key lookup plus the rows
+created since the last update. Errors are about 1% for the distinct
+counts; the top-k lists are exact while the number of distinct keys
+stays within SPACE_SAVING_CAPACITY.
+
+Updates, including those that move a watch to another brand, and deletes
+are not tracked; rebuild_catalog_sketches() recomputes everything with
+one pass over Watch.
+"""
+import array
+import base64
+import hashlib
+import json
+import math
+import threading
+import zlib
+
+from changes import WATERMARK_SQL
+from watches import Watch, connect_to_db, spec_number
+
+HLL_PRECISION = 14  # 2**14 registers, about 0.8% standard error
+
+COUNT_MIN_WIDTH = 2048
+COUNT_MIN_DEPTH = 4
+
+SPACE_SAVING_CAPACITY = 256
+
+SKETCH_NAME = 'catalog'
+
+# add_watch() calls per process between updates of the stored sketches.
+SKETCH_UPDATE_INTERVAL = 1000
+
+CREATE_SKETCH_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS CatalogSketch (
+        Name VARCHAR(50) PRIMARY KEY,
+        Data BYTEA NOT NULL
+    )
+"""
+
+SELECT_SKETCH_SQL = "SELECT Data FROM CatalogSketch WHERE Name = %s"
+
+UPSERT_SKETCH_SQL = """
+    INSERT INTO CatalogSketch (Name, Data) VALUES (%s, %s)
+    ON CONFLICT (Name) DO UPDATE SET Data = EXCLUDED.Data
+"""
+
+CREATED_BRANDS_SQL = """
+    SELECT BrandID FROM Brand WHERE CreatedVersion >= %s AND CreatedVersion < %s
+"""
+
+CREATED_WATCHES_SQL = """
+    SELECT ModelName, BrandID, MovementType, CaseDiameterMM
+    FROM Watch
+    WHERE CreatedVersion >= %s AND CreatedVersion < %s
+"""
+
+# The sketches need the CreatedVersion column that create_tables() adds.
+SKETCHES_SUPPORTED_SQL = """
+    SELECT to_regclass('catalogsketch') IS NOT NULL
+       AND EXISTS (SELECT 1 FROM pg_attribute
+                   WHERE attrelid = to_regclass('watch') AND attname = 'createdversion')
+"""
+
+
+def _hash64(key):
+    return int.from_bytes(
+        hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class HyperLogLog:
+    """Distinct-count estimator in 2**precision one-byte registers."""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = bytearray(registers) if registers else bytearray(1 << precision)
+
+    def add(self, key):
+        value = _hash64(key)
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty.
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class CountMinSketch:
+    """Frequency estimates that never undercount, overcounting by about total * e / width."""
+
+    def __init__(self, width=COUNT_MIN_WIDTH, depth=COUNT_MIN_DEPTH, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = array.array('q', table if table is not None else bytes(8 * width * depth))
+
+    def _cells(self, key):
+        digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        for cell in self._cells(key):
+            self.table[cell] += count
+
+    def estimate(self, key):
+        return min(self.table[cell] for cell in self._cells(key))
+
+    def merge(self, other):
+        for cell, count in enumerate(other.table):
+            if count:
+                self.table[cell] += count
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in a fixed number of counters.
+
+    Counts are exact while at most capacity distinct keys have been seen;
+    beyond that a new key takes over the smallest counter, so counts are
+    upper bounds, off by at most total / capacity.
+    """
+
+    def __init__(self, capacity=SPACE_SAVING_CAPACITY, counts=()):
+        self.capacity = capacity
+        self.counts = dict(counts)
+
+    def add(self, key, count=1):
+        if key in self.counts or len(self.counts) < self.capacity:
+            self.counts[key] = self.counts.get(key, 0) + count
+            return
+        smallest = min(self.counts, key=self.counts.get)
+        self.counts[key] = self.counts.pop(smallest) + count
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        if len(self.counts) > self.capacity:
+            kept = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+            self.counts = dict(kept[:self.capacity])
+
+    def top(self, n):
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+def _encode(data):
+    return base64.b64encode(bytes(data)).decode('ascii')
+
+
+class CatalogSketches:
+    """The sketches behind the approximate stats; see the module docstring."""
+
+    def __init__(self):
+        self.watches = HyperLogLog()
+        self.brands = HyperLogLog()
+        self.brand_counts = CountMinSketch()
+        self.top_brands = SpaceSaving()
+        self.movement_types = SpaceSaving()
+        self.diameter_sum = 0.0
+        self.diameter_count = 0
+        # Rows created before this change-feed watermark are counted; None
+        # for sketches stored before watermarks were kept.
+        self.watermark = 0
+
+    def add_brand(self, brand_id):
+        self.brands.add(brand_id)
+
+    def add_watch(self, watch):
+        """Count a newly inserted Watch record."""
+        self.watches.add(watch.model_name)
+        if watch.brand_id is not None:
+            self.brands.add(watch.brand_id)
+            self.brand_counts.add(watch.brand_id)
+            self.top_brands.add(watch.brand_id)
+        self.movement_types.add(watch.movement_type)
+        diameter = spec_number(watch.case_diameter)
+        if diameter is not None:
+            self.diameter_sum += diameter
+            self.diameter_count += 1
+
+    def merge(self, other):
+        self.watches.merge(other.watches)
+        self.brands.merge(other.brands)
+        self.brand_counts.merge(other.brand_counts)
+        self.top_brands.merge(other.top_brands)
+        self.movement_types.merge(other.movement_types)
+        self.diameter_sum += other.diameter_sum
+        self.diameter_count += other.diameter_count
+
+    def to_bytes(self):
+        return zlib.compress(json.dumps({
+            'watches': _encode(self.watches.registers),
+            'brands': _encode(self.brands.registers),
+            'brand_counts': _encode(self.brand_counts.table.tobytes()),
+            'top_brands': list(self.top_brands.counts.items()),
+            'movement_types': list(self.movement_types.counts.items()),
+            'diameter_sum': self.diameter_sum,
+            'diameter_count': self.diameter_count,
+            'watermark': self.watermark,
+        }).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, data):
+        state = json.loads(zlib.decompress(bytes(data)))
+        sketches = cls()
+        sketches.watches = HyperLogLog(registers=base64.b64decode(state['watches']))
+        sketches.brands = HyperLogLog(registers=base64.b64decode(state['brands']))
+        sketches.brand_counts.table = array.array('q', base64.b64decode(state['brand_counts']))
+        sketches.top_brands = SpaceSaving(counts=state['top_brands'])
+        sketches.movement_types = SpaceSaving(counts=state['movement_types'])
+        sketches.diameter_sum = state['diameter_sum']
+        sketches.diameter_count = state['diameter_count']
+        sketches.watermark = state.get('watermark')
+        return sketches
+
+    def stats(self, brand_names):
+        """Same shape as watches.get_catalog_stats(); brand_names maps BrandID to name."""
+        top_brands = [(brand_names.get(brand_id, f"Brand {brand_id}"),
+                       min(count, self.brand_counts.estimate(brand_id)))
+                      for brand_id, count in self.top_brands.top(5)]
+        return {
+            "brand_count": self.brands.count(),
+            "watch_count": self.watches.count(),
+            "top_brands": sorted(top_brands, key=lambda item: item[1], reverse=True),
+            "avg_case_diameter": (self.diameter_sum / self.diameter_count
+                                  if self.diameter_count else None),
+            "movement_types": self.movement_types.top(SPACE_SAVING_CAPACITY),
+        }
+
+
+def _sketches_supported(cur):
+    cur.execute(SKETCHES_SUPPORTED_SQL)
+    return cur.fetchone()[0]
+
+
+def _add_created_rows(conn, sketches, until, fetch_size):
+    """Add the rows created between sketches.watermark and until, and move the watermark."""
+    with conn.cursor() as cur:
+        cur.execute(CREATED_BRANDS_SQL, (sketches.watermark, until))
+        for (brand_id,) in cur:
+            sketches.add_brand(brand_id)
+    # A named (server-side) cursor streams Watch instead of loading it whole.
+    with conn.cursor(name='catalog_sketch_rows') as cur:
+        cur.itersize = fetch_size
+        cur.execute(CREATED_WATCHES_SQL, (sketches.watermark, until))
+        for model_name, brand_id, movement_type, diameter in cur:
+            sketches.add_watch(Watch(None, brand_id, model_name, None, movement_type,
+                                     None, None, diameter, None))
+    sketches.watermark = until
+
+
+def update_catalog_sketches(conn=None, rebuild=False, fetch_size=10000):
+    """Bring the stored sketches up to the current watermark and return them.
+
+    The stored row is locked for the read-update-write, so concurrent
+    callers update one after another. rebuild=True (or stored sketches
+    without a watermark) starts from empty sketches. Returns None, and
+    stores nothing, on databases that create_tables() has not upgraded yet.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_to_db()
+    try:
+        with conn.cursor() as cur:
+            if not _sketches_supported(cur):
+                conn.commit()
+                return None
+            cur.execute(SELECT_SKETCH_SQL + " FOR UPDATE", (SKETCH_NAME,))
+            row = cur.fetchone()
+            cur.execute(WATERMARK_SQL)
+            until = cur.fetchone()[0]
+        sketches = CatalogSketches.from_bytes(row[0]) if row and not rebuild else None
+        if sketches is None or sketches.watermark is None:
+            sketches = CatalogSketches()
+        if sketches.watermark < until:
+            _add_created_rows(conn, sketches, until, fetch_size)
+            with conn.cursor() as cur:
+                cur.execute(UPSERT_SKETCH_SQL, (SKETCH_NAME, sketches.to_bytes()))
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+    return sketches
+
+
+_added_watches = 0
+_added_watches_lock = threading.Lock()
+
+
+def count_added_watch():
+    """Count one add_watch() insert; True when the stored sketches are due an update."""
+    global _added_watches
+    with _added_watches_lock:
+        _added_watches += 1
+        if _added_watches < SKETCH_UPDATE_INTERVAL:
+            return False
+        _added_watches = 0
+        return True
+
+
+def load_catalog_sketches(conn, fetch_size=10000):
+    """The stored CatalogSketches with newer rows added in memory, or None if none are stored."""
+    with conn.cursor() as cur:
+        if not _sketches_supported(cur):
+            return None
+        cur.execute(SELECT_SKETCH_SQL, (SKETCH_NAME,))
+        row = cur.fetchone()
+        cur.execute(WATERMARK_SQL)
+        until = cur.fetchone()[0]
+    sketches = CatalogSketches.from_bytes(row[0]) if row else None
+    if sketches is None or sketches.watermark is None:
+        return None
+    if sketches.watermark < until:
+        _add_created_rows(conn, sketches, until, fetch_size)
+    return sketches
+
+
+def get_approximate_stats(conn=None):
+    """get_catalog_stats() from the stored sketches; None if none are stored."""
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_to_db(readonly=True)
+    try:
+        sketches = load_catalog_sketches(conn)
+        if sketches is None:
+            return None
+        brand_ids = [brand_id for brand_id, _ in sketches.top_brands.top(5)]
+        with conn.cursor() as cur:
+            cur.execute("SELECT BrandID, BrandName FROM Brand WHERE BrandID = ANY(%s)",
+                        (brand_ids,))
+            brand_names = dict(cur.fetchall())
+    finally:
+        if own_conn:
+            conn.close()
+    return sketches.stats(brand_names)
+
+
+def rebuild_catalog_sketches(conn=None, fetch_size=10000):
+    """Recompute the stored sketches from the Watch and Brand tables in one pass."""
+    return update_catalog_sketches(conn, rebuild=True, fetch_size=fetch_size)
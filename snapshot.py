@@ -0,0 +1,560 @@
+"""Columnar in-process snapshot of the watch catalog.
+
+CatalogSnapshot.load() copies the Brand and Watch tables out of Postgres
+once (COPY ... TO STDOUT) into NumPy columns. Text columns are
+dictionary-encoded as Categorical (int32 codes plus a category list).
+Counts, group-bys, means and filters then run as vectorised array
+operations without touching the database again.
+
+Filters are keyword arguments of the form column[__op]=value, e.g.
+
+    snap = CatalogSnapshot.load()
+    snap.count(movement_type="Automatic", water_resistance__gte=200)
+    snap.group_count("brand_name", case_diameter__between=(38, 41))
+    snap.group_mean("case_diameter", by="movement_type")
+
+Supported ops: eq (default), ne, in, lt, lte, gt, gte, between, isnull.
+
+Range filters (lt, lte, gt, gte, between) on case_diameter and
+water_resistance are served by binary search over a sorted index of the
+column, built on first use and stored with the snapshot file. The most
+selective such filter picks the candidate rows, and the other filters are
+checked on those rows only:
+
+    snap.watches(water_resistance__gte=200, case_diameter__between=(38, 41))
+
+A snapshot can be written to a versioned binary file with save() (or
+export_snapshot() straight from the database) and reopened with
+CatalogSnapshot.open(). Opening maps the file read-only and builds
+columns as views over the mapping. Many worker processes then share one
+page-cached copy, and startup costs no parsing beyond a small JSON header.
+"""
+import json
+import mmap
+
+import numpy as np  # type: ignore
+
+from watches import Watch, connect_to_db, copy_rows
+
+BRAND_SNAPSHOT_SQL = """
+    SELECT BrandID, BrandName, FoundingYear, CountryOfOrigin
+    FROM Brand
+    ORDER BY BrandID
+"""
+
+WATCH_SNAPSHOT_SQL = """
+    SELECT WatchID, BrandID, ModelName, DialColor, MovementType, MovementCaliber,
+           CaseMaterial, CaseDiameterMM, WaterResistanceM
+    FROM Watch
+    ORDER BY WatchID
+"""
+
+# Code used for NULL in a Categorical, and returned by Categorical.code()
+# for values that never occur (so comparisons match nothing).
+NULL_CODE = -1
+MISSING_CODE = -2
+
+# Binary snapshot layout, all little-endian:
+#   8 bytes  SNAPSHOT_MAGIC
+#   uint32   SNAPSHOT_VERSION
+#   uint32   length of the JSON header that follows
+#   JSON     column directory: dtype, byte offset and count of every array
+#   ...      data section, starting on the next 8-byte boundary; array
+#            offsets are relative to it and 8-byte aligned
+# Text columns are stored as an int64 offsets array (n + 1 entries) into a
+# UTF-8 heap; categoricals as int32 codes plus such a text column.
+SNAPSHOT_MAGIC = b'WCATSNAP'
+SNAPSHOT_VERSION = 1
+_PREAMBLE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('header_length', '<u4')])
+_ALIGNMENT = 8
+
+
+def _data_start(header_length):
+    end = _PREAMBLE.itemsize + header_length
+    return end + -end % _ALIGNMENT
+
+
+class StringColumn:
+    """Non-null strings packed into one UTF-8 heap, indexed by an offsets array."""
+    __slots__ = ('offsets', 'heap')
+
+    def __init__(self, offsets, heap):
+        self.offsets = offsets
+        self.heap = heap
+
+    @classmethod
+    def encode(cls, values):
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        heap = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(offsets, heap)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _get(self, position):
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.heap[start:end].tobytes().decode('utf-8')
+
+    def __getitem__(self, index):
+        """A str for an integer index, an object array for a mask or index array."""
+        if isinstance(index, (int, np.integer)):
+            return self._get(int(index))
+        positions = np.arange(len(self))[index]
+        return np.array([self._get(position) for position in positions], dtype=object)
+
+    def __iter__(self):
+        return (self._get(position) for position in range(len(self)))
+
+    def equals(self, value):
+        """Boolean array marking entries equal to value; only same-length entries are decoded."""
+        target = value.encode('utf-8')
+        mask = np.zeros(len(self), dtype=bool)
+        for position in np.flatnonzero(np.diff(self.offsets) == len(target)):
+            start = self.offsets[position]
+            mask[position] = self.heap[start:start + len(target)].tobytes() == target
+        return mask
+
+
+class Categorical:
+    """A dictionary-encoded text column: codes[i] indexes categories."""
+    __slots__ = ('codes', 'categories', '_index')
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = list(categories)
+        self._index = {value: code for code, value in enumerate(self.categories)}
+
+    @classmethod
+    def encode(cls, values):
+        index = {}
+        codes = np.fromiter(
+            (NULL_CODE if value is None else index.setdefault(value, len(index))
+             for value in values),
+            dtype=np.int32, count=len(values))
+        return cls(codes, index)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def code(self, value):
+        if value is None:
+            return NULL_CODE
+        return self._index.get(value, MISSING_CODE)
+
+    def decode(self, code):
+        return None if code == NULL_CODE else self.categories[code]
+
+    def values(self):
+        """The column as an object array of str/None."""
+        lookup = np.array(self.categories + [None], dtype=object)
+        return lookup[self.codes]
+
+
+# Numeric columns with a sorted index for range filters.
+RANGE_INDEXED_COLUMNS = ('case_diameter', 'water_resistance')
+
+_RANGE_OPS = ('lt', 'lte', 'gt', 'gte', 'between')
+
+
+def _subset(column, positions):
+    if isinstance(column, Categorical):
+        return Categorical(column.codes[positions], column.categories)
+    if isinstance(column, StringColumn):
+        return StringColumn.encode(column[positions])
+    return column[positions]
+
+
+def _float_column(values):
+    return np.array([np.nan if value is None else float(value) for value in values],
+                    dtype=np.float64)
+
+
+def _int_column(values):
+    return np.array([-1 if value is None else int(value) for value in values],
+                    dtype=np.int64)
+
+
+class CatalogSnapshot:
+    """Read-only columnar copy of the watch catalog, one entry per Watch row.
+
+    Watch columns: watch_id, brand_id (int64; -1 for NULL), case_diameter and
+    water_resistance (float64; NaN for NULL), model_name (StringColumn) and
+    the Categoricals brand_name, dial_color, movement_type,
+    movement_caliber, case_material. The Brand table is kept in self.brands
+    with brand_id, brand_name, founding_year and country_of_origin.
+    """
+
+    NUMERIC_COLUMNS = ('watch_id', 'brand_id', 'case_diameter', 'water_resistance')
+    CATEGORICAL_COLUMNS = ('brand_name', 'dial_color', 'movement_type',
+                           'movement_caliber', 'case_material')
+
+    def __init__(self, columns, brands, mapping=None, sorted_indexes=None):
+        self.columns = columns
+        self.brands = brands
+        # Keeps the file mapping alive for snapshots returned by open().
+        self._mapping = mapping
+        # column name -> (row positions, values) in ascending value order, NULLs left out.
+        self._sorted = dict(sorted_indexes or {})
+
+    @classmethod
+    def load(cls, conn=None):
+        """Copy Brand and Watch out of the database in one read-only snapshot."""
+        own_conn = conn is None
+        if own_conn:
+            conn = connect_to_db(readonly=True)
+            conn.set_session(isolation_level='REPEATABLE READ')
+        try:
+            brand_rows = list(copy_rows(conn, BRAND_SNAPSHOT_SQL))
+            watch_rows = list(copy_rows(conn, WATCH_SNAPSHOT_SQL))
+        finally:
+            if own_conn:
+                conn.close()
+        return cls.from_rows(brand_rows, watch_rows)
+
+    @classmethod
+    def from_rows(cls, brand_rows, watch_rows):
+        """Build a snapshot from rows in BRAND_SNAPSHOT_SQL / WATCH_SNAPSHOT_SQL order."""
+        brand_ids, brand_names, founding_years, countries = (
+            zip(*brand_rows) if brand_rows else ((),) * 4)
+        brands = {
+            'brand_id': _int_column(brand_ids),
+            'brand_name': StringColumn.encode(brand_names),
+            'founding_year': _float_column(founding_years),
+            'country_of_origin': Categorical.encode(countries),
+        }
+
+        (watch_ids, watch_brand_ids, model_names, dial_colors, movement_types,
+         movement_calibers, case_materials, case_diameters, water_resistances) = (
+            zip(*watch_rows) if watch_rows else ((),) * 9)
+
+        # The Brand join is done once here: brand_name is a Categorical whose
+        # categories are the brand table, in BrandID order.
+        brand_position = {int(brand_id): position
+                          for position, brand_id in enumerate(brands['brand_id'])}
+        watch_brand_ids = _int_column(watch_brand_ids)
+        brand_codes = np.fromiter(
+            (brand_position.get(int(brand_id), NULL_CODE) for brand_id in watch_brand_ids),
+            dtype=np.int32, count=len(watch_brand_ids))
+
+        columns = {
+            'watch_id': _int_column(watch_ids),
+            'brand_id': watch_brand_ids,
+            'brand_name': Categorical(brand_codes, brands['brand_name']),
+            'model_name': StringColumn.encode(model_names),
+            'dial_color': Categorical.encode(dial_colors),
+            'movement_type': Categorical.encode(movement_types),
+            'movement_caliber': Categorical.encode(movement_calibers),
+            'case_material': Categorical.encode(case_materials),
+            'case_diameter': _float_column(case_diameters),
+            'water_resistance': _float_column(water_resistances),
+        }
+        return cls(columns, brands)
+
+    def __len__(self):
+        return len(self.columns['watch_id'])
+
+    def column(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise KeyError(f"Unknown snapshot column {name!r}") from None
+
+    def sorted_index(self, name):
+        """(positions, values) of the non-NULL entries of a numeric column, by value."""
+        if name not in self._sorted:
+            column = self.column(name)
+            if isinstance(column, (Categorical, StringColumn)):
+                raise ValueError(f"Cannot build a sorted index on text column {name!r}")
+            positions = np.argsort(column, kind='stable')
+            if column.dtype.kind == 'f':
+                # NaNs sort last.
+                positions = positions[:len(column) - int(np.count_nonzero(np.isnan(column)))]
+            self._sorted[name] = (positions, column[positions])
+        return self._sorted[name]
+
+    def _range_positions(self, name, op, value):
+        positions, values = self.sorted_index(name)
+        lo, hi = 0, len(values)
+        if op == 'lt':
+            hi = np.searchsorted(values, value, 'left')
+        elif op == 'lte':
+            hi = np.searchsorted(values, value, 'right')
+        elif op == 'gt':
+            lo = np.searchsorted(values, value, 'right')
+        elif op == 'gte':
+            lo = np.searchsorted(values, value, 'left')
+        else:
+            low, high = value
+            if low is not None:
+                lo = np.searchsorted(values, low, 'left')
+            if high is not None:
+                hi = np.searchsorted(values, high, 'right')
+        return positions[lo:max(lo, hi)]
+
+    def _predicate(self, name, op, value, positions=None):
+        column = self.column(name)
+        if positions is not None:
+            column = _subset(column, positions)
+
+        if isinstance(column, Categorical):
+            codes = column.codes
+            if op == 'isnull':
+                return (codes == NULL_CODE) == bool(value)
+            if op == 'eq':
+                return codes == column.code(value)
+            if op == 'ne':
+                return codes != column.code(value)
+            if op == 'in':
+                return np.isin(codes, [column.code(item) for item in value])
+            raise ValueError(f"Filter {name}__{op} is not supported on a categorical column")
+
+        if isinstance(column, StringColumn):
+            if op == 'isnull':
+                return np.full(len(column), not value)
+            if op == 'eq':
+                return column.equals(value)
+            if op == 'ne':
+                return ~column.equals(value)
+            if op == 'in':
+                mask = np.zeros(len(column), dtype=bool)
+                for item in value:
+                    mask |= column.equals(item)
+                return mask
+            raise ValueError(f"Filter {name}__{op} is not supported on a text column")
+
+        if op == 'isnull':
+            nulls = np.isnan(column) if column.dtype.kind == 'f' else column == -1
+            return nulls == bool(value)
+        if op == 'eq':
+            return column == value
+        if op == 'ne':
+            return column != value
+        if op == 'in':
+            return np.isin(column, list(value))
+        if op == 'lt':
+            return column < value
+        if op == 'lte':
+            return column <= value
+        if op == 'gt':
+            return column > value
+        if op == 'gte':
+            return column >= value
+        if op == 'between':
+            low, high = value
+            mask = np.ones(len(column), dtype=bool)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+            return mask
+        raise ValueError(f"Unknown filter operator {op!r}")
+
+    def mask(self, **filters):
+        """Boolean array selecting the watches that match every filter."""
+        mask = np.ones(len(self), dtype=bool)
+        for key, value in filters.items():
+            name, _, op = key.partition('__')
+            mask &= self._predicate(name, op or 'eq', value)
+        return mask
+
+    def select(self, **filters):
+        """Ascending positions of the watches that match every filter.
+
+        Uses the sorted index of the most selective range filter on a
+        RANGE_INDEXED_COLUMNS column when there is one, else mask().
+        """
+        best_key, best = None, None
+        for key, value in filters.items():
+            name, _, op = key.partition('__')
+            if name in RANGE_INDEXED_COLUMNS and op in _RANGE_OPS:
+                positions = self._range_positions(name, op, value)
+                if best is None or len(positions) < len(best):
+                    best_key, best = key, positions
+        if best is None:
+            return np.flatnonzero(self.mask(**filters))
+
+        positions = np.sort(best)
+        keep = np.ones(len(positions), dtype=bool)
+        for key, value in filters.items():
+            if key != best_key:
+                name, _, op = key.partition('__')
+                keep &= self._predicate(name, op or 'eq', value, positions)
+        return positions[keep]
+
+    def count(self, **filters):
+        if not filters:
+            return len(self)
+        return len(self.select(**filters))
+
+    def group_count(self, column, **filters):
+        """[(value, count), ...] for the matching watches, largest group first."""
+        mask = self.mask(**filters)
+        values = self.column(column)
+
+        if isinstance(values, StringColumn):
+            raise ValueError(f"Cannot group by text column {column!r}")
+        if isinstance(values, Categorical):
+            codes = values.codes[mask]
+            counts = np.bincount(codes[codes >= 0], minlength=len(values.categories))
+            groups = [(values.categories[code], int(counts[code]))
+                      for code in np.flatnonzero(counts)]
+            null_count = int(np.count_nonzero(codes == NULL_CODE))
+            if null_count:
+                groups.append((None, null_count))
+        else:
+            selected = values[mask]
+            if selected.dtype.kind == 'f':
+                selected = selected[~np.isnan(selected)]
+            uniques, counts = np.unique(selected, return_counts=True)
+            groups = [(unique.item(), int(count)) for unique, count in zip(uniques, counts)]
+
+        groups.sort(key=lambda group: group[1], reverse=True)
+        return groups
+
+    def top(self, column, n=5, **filters):
+        return [group for group in self.group_count(column, **filters)
+                if group[0] is not None][:n]
+
+    def mean(self, column, **filters):
+        values = self.column(column)[self.mask(**filters)]
+        values = values[~np.isnan(values)]
+        return float(values.mean()) if len(values) else None
+
+    def group_mean(self, column, by, **filters):
+        """{group value: mean of column} over the matching watches."""
+        groups = self.column(by)
+        if not isinstance(groups, Categorical):
+            raise ValueError(f"group_mean() needs a categorical 'by' column, not {by!r}")
+
+        values = self.column(column)
+        mask = self.mask(**filters) & (groups.codes >= 0) & ~np.isnan(values)
+        codes = groups.codes[mask]
+        size = len(groups.categories)
+        sums = np.bincount(codes, weights=values[mask], minlength=size)
+        counts = np.bincount(codes, minlength=size)
+        return {groups.categories[code]: float(sums[code] / counts[code])
+                for code in np.flatnonzero(counts)}
+
+    def watches(self, **filters):
+        """Matching rows materialised as Watch records."""
+        names = Watch.__slots__
+        selected = self.select(**filters)
+        columns = []
+        for name in names:
+            column = self.columns[name]
+            if isinstance(column, Categorical):
+                column = column.values()
+            columns.append(column[selected])
+
+        records = []
+        for row in zip(*columns):
+            record = Watch(*(value.item() if isinstance(value, np.generic) else value
+                             for value in row))
+            # Undo the NULL sentinels used by the numeric columns.
+            if record.brand_id == -1:
+                record.brand_id = None
+            if np.isnan(record.case_diameter):
+                record.case_diameter = None
+            record.water_resistance = (None if np.isnan(record.water_resistance)
+                                       else int(record.water_resistance))
+            records.append(record)
+        return records
+
+    def stats(self):
+        """Same shape as watches.get_catalog_stats(), computed locally."""
+        return {
+            "brand_count": len(self.brands['brand_id']),
+            "watch_count": len(self),
+            "top_brands": self.top('brand_name', 5),
+            "avg_case_diameter": self.mean('case_diameter'),
+            "movement_types": self.group_count('movement_type'),
+        }
+
+    def save(self, path):
+        """Write the snapshot in the binary format described at SNAPSHOT_MAGIC."""
+        arrays = []
+        position = 0
+
+        def add_array(array, dtype):
+            nonlocal position
+            array = np.ascontiguousarray(array, dtype=dtype)
+            position += -position % _ALIGNMENT
+            spec = {'dtype': array.dtype.str, 'offset': position, 'count': len(array)}
+            arrays.append((spec, array))
+            position += array.nbytes
+            return spec
+
+        def add_column(column):
+            if isinstance(column, Categorical):
+                return {'kind': 'categorical', 'codes': add_array(column.codes, '<i4'),
+                        'categories': add_column(StringColumn.encode(column.categories))}
+            if isinstance(column, StringColumn):
+                return {'kind': 'string', 'offsets': add_array(column.offsets, '<i8'),
+                        'heap': add_array(column.heap, 'u1')}
+            dtype = '<f8' if column.dtype.kind == 'f' else '<i8'
+            return {'kind': 'array', 'data': add_array(column, dtype)}
+
+        directory = {
+            'watches': {name: add_column(column) for name, column in self.columns.items()},
+            'brands': {name: add_column(column) for name, column in self.brands.items()},
+            'sorted': {},
+        }
+        for name in RANGE_INDEXED_COLUMNS:
+            positions, values = self.sorted_index(name)
+            directory['sorted'][name] = {'positions': add_array(positions, '<i8'),
+                                         'values': add_array(values, '<f8')}
+
+        header = json.dumps(directory).encode('utf-8')
+        data_start = _data_start(len(header))
+        preamble = np.array([(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header))], dtype=_PREAMBLE)
+        with open(path, 'wb') as f:
+            f.write(preamble.tobytes())
+            f.write(header)
+            for spec, array in arrays:
+                f.write(b'\0' * (data_start + spec['offset'] - f.tell()))
+                f.write(array.tobytes())
+
+    @classmethod
+    def open(cls, path):
+        """Map a file written by save() read-only; columns are zero-copy views."""
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        preamble = np.frombuffer(mapping, dtype=_PREAMBLE, count=1)[0]
+        if preamble['magic'] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        if preamble['version'] != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} has snapshot version {preamble['version']}, "
+                             f"expected {SNAPSHOT_VERSION}")
+        header_length = int(preamble['header_length'])
+        start = _PREAMBLE.itemsize
+        directory = json.loads(bytes(mapping[start:start + header_length]))
+        data_start = _data_start(header_length)
+
+        def load_array(spec):
+            return np.frombuffer(mapping, dtype=spec['dtype'], count=spec['count'],
+                                 offset=data_start + spec['offset'])
+
+        def load_column(spec):
+            if spec['kind'] == 'categorical':
+                return Categorical(load_array(spec['codes']), load_column(spec['categories']))
+            if spec['kind'] == 'string':
+                return StringColumn(load_array(spec['offsets']), load_array(spec['heap']))
+            return load_array(spec['data'])
+
+        # Files written before sorted indexes existed have no 'sorted' entry;
+        # their indexes are built on first use instead.
+        sorted_indexes = {name: (load_array(spec['positions']), load_array(spec['values']))
+                          for name, spec in directory.get('sorted', {}).items()}
+        return cls({name: load_column(spec) for name, spec in directory['watches'].items()},
+                   {name: load_column(spec) for name, spec in directory['brands'].items()},
+                   mapping, sorted_indexes)
+
+
+def export_snapshot(path, conn=None):
+    """Copy the catalog out of the database into a binary snapshot file at path."""
+    snapshot = CatalogSnapshot.load(conn)
+    snapshot.save(path)
+    return snapshot
@@ -0,0 +1,417 @@
+"""Storage backends for the watch catalog.
+
+StorageBackend is the small interface the backend-neutral importers and
+reports below are written against: create_schema(), brand_keys(),
+add_brands(), add_alias(), write_watches(), list_brands() and
+catalog_stats(). PostgresBackend runs the SQL from watches.py over a
+RetryingConnection. SQLiteBackend keeps the whole catalog in one SQLite
+file with no server: the database runs in WAL mode and every bulk call is
+a single transaction.
+
+open_backend() picks one from a URL, by default the WATCH_DB environment
+variable:
+
+    sqlite:///var/lib/watches.db    SQLite file (absolute path)
+    sqlite://watches.db             SQLite file (relative path)
+    sqlite://:memory:               throwaway in-memory SQLite database
+    postgres (or unset)             Postgres, configured by the DB_* settings
+"""
+import abc
+import csv
+import os
+import sqlite3
+
+from sketches import update_catalog_sketches
+from watches import (
+    BATCH_SIZE,
+    BRAND_CSV_COLUMNS,
+    DEDUP_POLICIES,
+    DEFAULT_BRAND_ALIASES,
+    INSERT_BRAND_ALIAS_SQL,
+    INSERT_WATCHES_SQL,
+    SELECT_ALL_BRANDS_SQL,
+    SELECT_BRAND_BY_KEY_SQL,
+    SELECT_BRAND_KEYS_SQL,
+    UPSERT_WATCHES_SQL,
+    WATCH_CSV_COLUMNS,
+    Brand,
+    BrandResolver,
+    RetryingConnection,
+    SeenSet,
+    _catalog_stats,
+    _create_schema,
+    _csv_columns,
+    _get_or_create_brand,
+    _last_row_numbers,
+    _write_watch_batch,
+    brand_key,
+    connect_to_db,
+    open_input,
+    parse_brand_row,
+    parse_watch_row,
+)
+
+
+class StorageBackend(abc.ABC):
+    """Operations the catalog needs from a database.
+
+    Bulk methods take lists of Brand / Watch records and commit before
+    returning. Backends are context managers that close on exit.
+    """
+
+    @abc.abstractmethod
+    def create_schema(self):
+        """Create the Brand, BrandAlias and Watch tables if missing."""
+
+    @abc.abstractmethod
+    def brand_keys(self):
+        """(brand key, BrandID) pairs for every brand and alias, for BrandResolver."""
+
+    @abc.abstractmethod
+    def add_brands(self, brands):
+        """Insert Brand records whose key is new; returns [(brand_id, created)] in order."""
+
+    @abc.abstractmethod
+    def add_alias(self, alias, brand_id):
+        """Make alias another spelling of brand_id."""
+
+    @abc.abstractmethod
+    def write_watches(self, watches, dedup='first'):
+        """Insert Watch records, at most one per ModelName; returns the number written.
+
+        dedup='first' leaves stored watches alone, 'last' overwrites them.
+        """
+
+    @abc.abstractmethod
+    def list_brands(self):
+        """All brands as Brand records, ordered by name."""
+
+    @abc.abstractmethod
+    def catalog_stats(self):
+        """Same dict as watches.get_catalog_stats()."""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _pg_create_schema(conn):
+    with conn.cursor() as cur:
+        _create_schema(cur)
+    conn.commit()
+
+
+def _pg_fetch_all(conn, sql):
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def _pg_add_brands(conn, brands):
+    # Brand locks are taken in key order so concurrent loaders cannot deadlock.
+    results = {}
+    with conn.cursor() as cur:
+        for brand in sorted(brands, key=lambda brand: brand_key(brand.brand_name)):
+            results[id(brand)] = _get_or_create_brand(
+                cur, brand.brand_name, brand.founding_year, brand.country_of_origin)
+    conn.commit()
+    return [results[id(brand)] for brand in brands]
+
+
+def _pg_add_alias(conn, alias, brand_id):
+    with conn.cursor() as cur:
+        cur.execute(INSERT_BRAND_ALIAS_SQL, (brand_key(alias), brand_id, alias))
+    conn.commit()
+
+
+def _pg_catalog_stats(conn):
+    with conn.cursor() as cur:
+        stats = _catalog_stats(cur)
+    conn.commit()
+    return stats
+
+
+class PostgresBackend(StorageBackend):
+    """The catalog in Postgres, written the way watches.py's importers write it.
+
+    Every call goes through a RetryingConnection, watches go through
+    _write_watch_batch() (which handles a partitioned Watch), and the
+    catalog sketches are brought up to date after each write that added
+    rows.
+    """
+
+    def __init__(self, conn=None):
+        self.db = RetryingConnection()
+        self.db.conn = conn if conn is not None else connect_to_db()
+
+    @property
+    def conn(self):
+        return self.db.conn
+
+    def create_schema(self):
+        self.db.run(_pg_create_schema)
+
+    def brand_keys(self):
+        return self.db.run(_pg_fetch_all, SELECT_BRAND_KEYS_SQL)
+
+    def add_brands(self, brands):
+        results = self.db.run(_pg_add_brands, brands)
+        if any(created for _, created in results):
+            self.db.run(update_catalog_sketches)
+        return results
+
+    def add_alias(self, alias, brand_id):
+        self.db.run(_pg_add_alias, alias, brand_id)
+
+    def write_watches(self, watches, dedup='first'):
+        if not watches:
+            return 0
+        sql = INSERT_WATCHES_SQL if dedup == 'first' else UPSERT_WATCHES_SQL
+        written = self.db.run(_write_watch_batch, watches, sql)
+        if written:
+            self.db.run(update_catalog_sketches)
+        return written
+
+    def list_brands(self):
+        return [Brand(*row) for row in self.db.run(_pg_fetch_all, SELECT_ALL_BRANDS_SQL)]
+
+    def catalog_stats(self):
+        return self.db.run(_pg_catalog_stats)
+
+    def close(self):
+        self.db.close()
+
+
+# SQLite keeps CaseDiameter and WaterResistance as numbers, so the stats
+# need no unit stripping.
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS Brand (
+        BrandID INTEGER PRIMARY KEY,
+        BrandName TEXT NOT NULL UNIQUE,
+        BrandKey TEXT NOT NULL UNIQUE,
+        FoundingYear INTEGER,
+        CountryOfOrigin TEXT
+    );
+    CREATE TABLE IF NOT EXISTS BrandAlias (
+        AliasKey TEXT PRIMARY KEY,
+        BrandID INTEGER NOT NULL REFERENCES Brand(BrandID),
+        Alias TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS Watch (
+        WatchID INTEGER PRIMARY KEY,
+        BrandID INTEGER REFERENCES Brand(BrandID),
+        ModelName TEXT NOT NULL UNIQUE,
+        DialColor TEXT,
+        MovementType TEXT,
+        MovementCaliber TEXT,
+        CaseMaterial TEXT,
+        CaseDiameter REAL,
+        WaterResistance INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS watch_specs_idx ON Watch (CaseDiameter, WaterResistance);
+"""
+
+SQLITE_INSERT_BRAND_SQL = """
+    INSERT INTO Brand (BrandName, BrandKey, FoundingYear, CountryOfOrigin)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT DO NOTHING
+"""
+
+# The Postgres statements with sqlite3's qmark placeholders.
+SQLITE_SELECT_BRAND_BY_KEY_SQL = SELECT_BRAND_BY_KEY_SQL.replace("%s", "?")
+SQLITE_INSERT_ALIAS_SQL = INSERT_BRAND_ALIAS_SQL.replace("%s", "?")
+SQLITE_INSERT_WATCHES_SQL = INSERT_WATCHES_SQL.replace("VALUES %s", "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+SQLITE_UPSERT_WATCHES_SQL = UPSERT_WATCHES_SQL.replace("VALUES %s", "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+SQLITE_AVG_CASE_DIAMETER_SQL = "SELECT AVG(CaseDiameter) FROM Watch"
+
+
+class SQLiteBackend(StorageBackend):
+    def __init__(self, path):
+        # Transactions are opened explicitly, one per bulk call.
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        # With WAL, NORMAL only risks the last transactions on power loss,
+        # never corruption, and skips an fsync per commit.
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA foreign_keys = ON")
+
+    def _write(self, run, *args):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = run(*args)
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return result
+
+    def create_schema(self):
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def brand_keys(self):
+        return self.conn.execute(SELECT_BRAND_KEYS_SQL).fetchall()
+
+    def _add_brands(self, brands):
+        results = []
+        for brand in brands:
+            brand_name = ' '.join(brand.brand_name.split())
+            key = brand_key(brand_name)
+            if not key:
+                raise ValueError(f"brand name {brand_name!r} has no letters or digits")
+            row = self.conn.execute(SQLITE_SELECT_BRAND_BY_KEY_SQL, (key, key)).fetchone()
+            if row is not None:
+                results.append((row[0], False))
+                continue
+            cur = self.conn.execute(SQLITE_INSERT_BRAND_SQL, (
+                brand_name, key, brand.founding_year, brand.country_of_origin))
+            if cur.rowcount:
+                results.append((cur.lastrowid, True))
+            else:
+                # Same name, different key: an older spelling won the name.
+                row = self.conn.execute("SELECT BrandID FROM Brand WHERE BrandName = ?",
+                                        (brand_name,)).fetchone()
+                results.append((row[0], False))
+        return results
+
+    def add_brands(self, brands):
+        return self._write(self._add_brands, brands)
+
+    def add_alias(self, alias, brand_id):
+        self._write(self.conn.execute, SQLITE_INSERT_ALIAS_SQL,
+                    (brand_key(alias), brand_id, alias))
+
+    def write_watches(self, watches, dedup='first'):
+        if not watches:
+            return 0
+        sql = SQLITE_INSERT_WATCHES_SQL if dedup == 'first' else SQLITE_UPSERT_WATCHES_SQL
+        rows = [watch.insert_values() for watch in watches]
+        return self._write(self.conn.executemany, sql, rows).rowcount
+
+    def list_brands(self):
+        return [Brand(*row) for row in self.conn.execute(SELECT_ALL_BRANDS_SQL)]
+
+    def catalog_stats(self):
+        return _catalog_stats(self.conn.cursor(), SQLITE_AVG_CASE_DIAMETER_SQL)
+
+    def close(self):
+        self.conn.close()
+
+
+def open_backend(url=None):
+    """Backend for url (default: $WATCH_DB); see the module docstring for the forms."""
+    if url is None:
+        url = os.getenv('WATCH_DB', '')
+    if url.startswith('sqlite:'):
+        path = url[len('sqlite:'):]
+        if path.startswith('//'):
+            path = path[2:]
+        return SQLiteBackend(path)
+    if url in ('', 'postgres', 'postgresql'):
+        return PostgresBackend()
+    raise ValueError(f"unsupported database URL {url!r}")
+
+
+def import_brands(backend, filename):
+    """Load a brand CSV through backend in batches; returns (rows, created).
+
+    Also seeds DEFAULT_BRAND_ALIASES, like watches.import_brands_from_csv().
+    Raises KeyError if the header lacks one of BRAND_CSV_COLUMNS.
+    """
+    rows = created = 0
+    with open_input(filename) as csvfile:
+        csvreader = csv.reader(csvfile)
+        columns = _csv_columns(next(csvreader, []), BRAND_CSV_COLUMNS)
+        batch = []
+        for fields in csvreader:
+            rows += 1
+            brand = parse_brand_row(fields, columns)
+            if brand is not None:
+                batch.append(brand)
+            if len(batch) >= BATCH_SIZE:
+                created += sum(new for _, new in backend.add_brands(batch))
+                batch = []
+        if batch:
+            created += sum(new for _, new in backend.add_brands(batch))
+
+    resolver = BrandResolver(backend.brand_keys())
+    for alias, brand_name in DEFAULT_BRAND_ALIASES.items():
+        brand_id = resolver.resolve(brand_name)
+        if brand_id is not None and resolver.resolve(alias) is None:
+            backend.add_alias(alias, brand_id)
+    return rows, created
+
+
+def import_watches(backend, filename, dedup='first'):
+    """Load a watch CSV through backend; returns the same counts as watches._import_watch_file().
+
+    Rows are parsed, deduplicated and matched to brands exactly as the
+    Postgres importer does, and written BATCH_SIZE at a time. Raises
+    KeyError if the header lacks one of WATCH_CSV_COLUMNS.
+    """
+    if dedup not in DEDUP_POLICIES:
+        raise ValueError(f"dedup must be one of {DEDUP_POLICIES}, not {dedup!r}")
+    resolver = BrandResolver(backend.brand_keys())
+    seen = SeenSet()
+    last_rows = _last_row_numbers(filename) if dedup == 'last' else None
+    stats = {"rows": 0, "imported": 0, "skipped": 0, "duplicates": 0}
+    batch = []
+
+    with open_input(filename) as csvfile:
+        csvreader = csv.reader(csvfile)
+        columns = _csv_columns(next(csvreader, []), WATCH_CSV_COLUMNS)
+        for number, fields in enumerate(csvreader):
+            stats["rows"] += 1
+            try:
+                brand_name, watch = parse_watch_row(fields, columns)
+                if dedup == 'first' and watch.model_name in seen:
+                    stats["duplicates"] += 1
+                    continue
+                if dedup == 'last' and last_rows[watch.model_name] != number:
+                    stats["duplicates"] += 1
+                    continue
+                watch.brand_id = resolver.resolve_model(watch.model_name)
+                if watch.brand_id is None:
+                    watch.brand_id = resolver.resolve(brand_name)
+                if watch.brand_id is None:
+                    [(watch.brand_id, _)] = backend.add_brands([Brand(None, brand_name)])
+                    resolver.remember(brand_name, watch.brand_id)
+            except Exception as e:
+                model_name = fields[columns[0]] if columns[0] < len(fields) else 'Unknown'
+                print(f"An error occurred while importing watch {model_name}: {e}")
+                stats["skipped"] += 1
+                continue
+
+            if dedup == 'first':
+                seen.add(watch.model_name)
+            batch.append(watch)
+            if len(batch) >= BATCH_SIZE:
+                stats["imported"] += _write_watches(backend, batch, dedup, stats)
+                batch = []
+
+    if batch:
+        stats["imported"] += _write_watches(backend, batch, dedup, stats)
+    return stats
+
+
+def _write_watches(backend, watches, dedup, stats):
+    """backend.write_watches(), retried one row at a time if the batch is rejected."""
+    try:
+        return backend.write_watches(watches, dedup)
+    except Exception:
+        pass
+    written = 0
+    for watch in watches:
+        try:
+            written += backend.write_watches([watch], dedup)
+        except Exception as e:
+            print(f"An error occurred while importing watch {watch.model_name}: {e}")
+            stats["skipped"] += 1
+    return written
@@ -0,0 +1,116 @@
+"""Streaming NDJSON and CSV export of Brand and Watch.
+
+export_rows() reads a server-side cursor fetch_size rows at a time and
+writes each batch as one chunk of NDJSON (one JSON object per line) or
+CSV. The output can be a path, a binary file object or a connected
+socket. Memory stays at one batch whatever the catalog size.
+
+    export_rows('watches.ndjson')                          # Watch rows
+    export_rows('catalog.csv', 'joined', fmt='csv')        # with BrandName
+    export_rows(sock, 'brands')                            # over a socket
+"""
+import csv
+import io
+import json
+import os
+import sys
+
+from watches import connect_to_db
+
+EXPORT_QUERIES = {
+    'brands': (
+        ('brand_id', 'brand_name', 'founding_year', 'country_of_origin'),
+        """
+        SELECT BrandID, BrandName, FoundingYear, CountryOfOrigin
+        FROM Brand
+        ORDER BY BrandID
+        """,
+    ),
+    'watches': (
+        ('watch_id', 'brand_id', 'model_name', 'dial_color', 'movement_type',
+         'movement_caliber', 'case_material', 'case_diameter', 'water_resistance'),
+        """
+        SELECT WatchID, BrandID, ModelName, DialColor, MovementType, MovementCaliber,
+               CaseMaterial, CaseDiameter, WaterResistance
+        FROM Watch
+        ORDER BY WatchID
+        """,
+    ),
+    'joined': (
+        ('watch_id', 'brand_id', 'brand_name', 'model_name', 'dial_color', 'movement_type',
+         'movement_caliber', 'case_material', 'case_diameter', 'water_resistance'),
+        """
+        SELECT w.WatchID, w.BrandID, b.BrandName, w.ModelName, w.DialColor, w.MovementType,
+               w.MovementCaliber, w.CaseMaterial, w.CaseDiameter, w.WaterResistance
+        FROM Watch w
+        LEFT JOIN Brand b ON b.BrandID = w.BrandID
+        ORDER BY w.WatchID
+        """,
+    ),
+}
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+# Rows per server-side cursor fetch, and so per chunk written.
+DEFAULT_FETCH_SIZE = 10000
+
+
+def _ndjson_chunk(columns, rows):
+    return ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in rows)
+
+
+def _csv_chunk(rows):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator='\n').writerows(rows)
+    return buf.getvalue()
+
+
+def _writer(out):
+    """(write, close) for a path, '-' (stdout), a socket or a binary file object."""
+    if isinstance(out, (str, os.PathLike)):
+        if out == '-':
+            return sys.stdout.buffer.write, sys.stdout.buffer.flush
+        file = open(out, 'wb')
+        return file.write, file.close
+    if hasattr(out, 'sendall'):
+        return out.sendall, lambda: None
+    return out.write, out.flush
+
+
+def export_rows(out, table='watches', fmt='ndjson', conn=None, fetch_size=DEFAULT_FETCH_SIZE):
+    """Stream table ('brands', 'watches' or 'joined') to out as NDJSON or CSV.
+
+    CSV output starts with a header row and writes NULL as an empty field.
+    Returns the number of rows written.
+    """
+    if table not in EXPORT_QUERIES:
+        raise ValueError(f"table must be one of {tuple(EXPORT_QUERIES)}, not {table!r}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"fmt must be one of {EXPORT_FORMATS}, not {fmt!r}")
+    columns, query = EXPORT_QUERIES[table]
+
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_to_db(readonly=True)
+    write, close = _writer(out)
+    rows = 0
+    try:
+        if fmt == 'csv':
+            write(_csv_chunk([columns]).encode('utf-8'))
+        # A named (server-side) cursor streams the rows instead of loading
+        # them whole.
+        with conn.cursor(name=f'export_{table}') as cur:
+            cur.execute(query)
+            while True:
+                batch = cur.fetchmany(fetch_size)
+                if not batch:
+                    break
+                chunk = _csv_chunk(batch) if fmt == 'csv' else _ndjson_chunk(columns, batch)
+                write(chunk.encode('utf-8'))
+                rows += len(batch)
+        conn.commit()
+    finally:
+        close()
+        if own_conn:
+            conn.close()
+    return rows
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA_DIR = os.path.join(ROOT, 'data')
+BRANDS_CSV = os.path.join(DATA_DIR, 'watch_brands.csv')
+MODELS_CSV = os.path.join(DATA_DIR, 'watch_models.csv')
+
+# A small synthetic catalog for snapshot, similarity and CLI tests.
+BRANDS = [(1, 'Rolex', 1905, 'Switzerland'), (2, 'Seiko', 1881, 'Japan')]
+MOVEMENTS = ('Automatic', 'Quartz', 'Manual')
+MATERIALS = ('Steel', 'Gold', None)
+
+
+def watch_rows(n=300):
+    rows = []
+    for i in range(n):
+        rows.append((i + 1, 1 + i % 2, f"Model {i}", 'Black', MOVEMENTS[i % 3], None,
+                     MATERIALS[i % 3 if i % 5 else 2], None if i % 11 == 0 else 34 + i % 12,
+                     None if i % 7 == 0 else 30 * (1 + i % 20)))
+    return rows
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    return f"sqlite://{tmp_path / 'watches.db'}"
+
+
+@pytest.fixture
+def backend(sqlite_url):
+    from storage import open_backend
+
+    with open_backend(sqlite_url) as backend:
+        backend.create_schema()
+        yield backend
+
+
+@pytest.fixture
+def snapshot():
+    from snapshot import CatalogSnapshot
+
+    return CatalogSnapshot.from_rows(BRANDS, watch_rows())
@@ -0,0 +1,16 @@
+from watches import BrandResolver, brand_key
+
+
+def test_brand_key_folds_spelling():
+    assert brand_key('A.Lange & Söhne') == brand_key(' A. Lange & Sohne') == 'alangesohne'
+    assert brand_key('NOMOS Glashütte') == 'nomosglashutte'
+
+
+def test_brand_resolver_prefers_longest_prefix():
+    resolver = BrandResolver.from_brands([(1, 'Grand Seiko'), (2, 'Seiko'),
+                                          (3, 'NOMOS Glashütte'), (4, 'A.Lange & Söhne')])
+    assert resolver.resolve_model('Grand Seiko SBGA211') == 1
+    assert resolver.resolve_model('Seiko Presage') == 2
+    assert resolver.resolve_model('Nomos Club Campus') == 3
+    assert resolver.resolve_model('A. Lange & Söhne Saxonia Thin') == 4
+    assert resolver.resolve_model('Unknown Watch') is None
@@ -0,0 +1,46 @@
+import pytest
+
+from conftest import BRANDS, BRANDS_CSV, watch_rows
+from snapshot import CatalogSnapshot
+from watches import main
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    CatalogSnapshot.from_rows(BRANDS, watch_rows()).save(path)
+    return path
+
+
+@pytest.mark.parametrize('argv', [
+    ['import-brands', '/nonexistent/brands.csv'],
+    ['import-watches', '/nonexistent/models.csv'],
+    ['import-watches', '/nonexistent/models.csv', '--dry-run', '--brands', BRANDS_CSV],
+])
+def test_missing_files_fail(argv):
+    assert main(argv) == 1
+
+
+def test_snapshot_commands(snapshot_path, capsys):
+    assert main(['stats', '--snapshot', snapshot_path]) == 0
+    assert main(['find', '--snapshot', snapshot_path, '--diameter', '38:41']) == 0
+    assert main(['similar', 'Model 3', '--snapshot', snapshot_path]) == 0
+    assert main(['similar', 'No Such Model', '--snapshot', snapshot_path]) == 1
+    assert "Watch 'No Such Model' not found" in capsys.readouterr().out
+
+
+def test_handler_errors_exit_1(tmp_path, capsys):
+    assert main(['stats', '--snapshot', str(tmp_path / 'missing.snap')]) == 1
+    assert 'An error occurred' in capsys.readouterr().out
+
+
+def test_db_default_is_read_after_dotenv(tmp_path, monkeypatch):
+    import watches
+
+    path = tmp_path / 'from_env.db'
+    monkeypatch.delenv('WATCH_DB', raising=False)
+    # Stands in for load_dotenv() finding WATCH_DB in .env.
+    monkeypatch.setattr(watches, 'get_db_params',
+                        lambda: monkeypatch.setenv('WATCH_DB', f"sqlite://{path}"))
+    assert main(['init-db']) == 0
+    assert path.exists()
@@ -0,0 +1,62 @@
+from conftest import BRANDS_CSV
+from watches import BloomFilter, SeenSet
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    keys = [f"model {i}" for i in range(1000)]
+    assert not any(bloom.add(key) for key in keys[:1]) and bloom.add(keys[0])
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other {i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_seen_set_switches_to_bloom_filter():
+    seen = SeenSet(max_exact=10, bloom_capacity=1000)
+    assert [seen.add(key) for key in 'aab'] == [False, True, False]
+    for i in range(50):
+        seen.add(str(i))
+    assert seen._exact is None
+    assert seen.add('a') and seen.add('42')
+
+
+def test_last_row_wins_across_batches(backend, tmp_path, monkeypatch):
+    import storage
+    from test_storage import write_models
+
+    monkeypatch.setattr(storage, 'BATCH_SIZE', 2)
+    path = write_models(tmp_path / 'models.csv', [
+        ('Rolex Test', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+        ('Rolex Other', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+        ('Rolex Third', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+        ('Rolex Test', 'Blue', 'Automatic', '3135', 'Steel', '41mm', '100m'),
+        ('Rolex Test', 'Green', 'Automatic', '3135', 'Steel', 'bad', '100m')])
+    storage.import_brands(backend, BRANDS_CSV)
+    stats = storage.import_watches(backend, path, dedup='last')
+    assert (stats['imported'], stats['duplicates'], stats['skipped']) == (3, 1, 1)
+    assert backend.conn.execute(
+        "SELECT DialColor FROM Watch WHERE ModelName = 'Rolex Test'").fetchall() == [('Blue',)]
+
+
+def test_rejected_row_does_not_claim_its_name(backend, tmp_path, monkeypatch):
+    import storage
+    from test_storage import write_models
+
+    path = write_models(tmp_path / 'models.csv', [
+        ('Newbrand One', 'Black', 'Automatic', '1', 'Steel', '40mm', '300m'),
+        ('Newbrand One', 'Blue', 'Automatic', '1', 'Steel', '40mm', '300m')])
+    add_brands = backend.add_brands
+    calls = []
+
+    def fail_once(brands):
+        calls.append(brands)
+        if len(calls) == 1:
+            raise ValueError("brand insert failed")
+        return add_brands(brands)
+
+    monkeypatch.setattr(backend, 'add_brands', fail_once)
+    stats = storage.import_watches(backend, path)
+    assert (stats['imported'], stats['duplicates'], stats['skipped']) == (1, 0, 1)
+    assert backend.conn.execute("SELECT DialColor FROM Watch").fetchall() == [('Blue',)]
@@ -0,0 +1,135 @@
+import pytest
+
+from watches import WATCH_CSV_COLUMNS, parse_watch_row
+
+COLUMNS = tuple(range(len(WATCH_CSV_COLUMNS)))
+
+
+def row(model_name='Rolex Submariner', dial_color='Black', case_diameter='40mm',
+        water_resistance='300m'):
+    return [model_name, dial_color, 'Automatic', '3135', 'Steel', case_diameter,
+            water_resistance]
+
+
+def test_parse_watch_row():
+    brand_name, watch = parse_watch_row(row(), COLUMNS)
+    assert brand_name == 'Rolex'
+    assert (watch.model_name, watch.case_diameter, watch.water_resistance) == (
+        'Rolex Submariner', 40.0, 300)
+
+
+@pytest.mark.parametrize('case_diameter, water_resistance', [
+    ('', ''), ('n/a', 'N/A'), (' ', ' ')])
+def test_parse_watch_row_blank_measurements(case_diameter, water_resistance):
+    _, watch = parse_watch_row(row(case_diameter=case_diameter,
+                                   water_resistance=water_resistance), COLUMNS)
+    assert watch.case_diameter is None and watch.water_resistance is None
+
+
+@pytest.mark.parametrize('fields, message', [
+    (row(model_name='  '), 'missing model name'),
+    (row(model_name='Rolex ' + 'x' * 100), 'model name longer than 100'),
+    (row(dial_color='x' * 51), 'dial color longer than 50'),
+    (row(case_diameter='40-42mm'), 'invalid case diameter'),
+    (row(case_diameter='..'), 'invalid case diameter'),
+    (row(case_diameter='inf'), 'invalid case diameter'),
+    (row(case_diameter='-40mm'), 'invalid case diameter'),
+    (row(case_diameter='1' * 11), 'invalid case diameter'),
+    (row(water_resistance='300.5m'), 'invalid water resistance'),
+    (row(water_resistance='9' * 10), 'invalid water resistance'),
+    (row()[:3], 'expected 7 fields'),
+])
+def test_parse_watch_row_rejects(fields, message):
+    with pytest.raises(ValueError, match=message):
+        parse_watch_row(fields, COLUMNS)
+
+
+def test_dry_run_skips_what_the_import_would(tmp_path, capsys):
+    from conftest import BRANDS_CSV
+    from test_storage import write_models
+    from watches import main
+
+    path = write_models(tmp_path / 'models.csv', [
+        row(), row(model_name='Rolex Long', dial_color='x' * 51),
+        row(model_name='Rolex Nan', case_diameter='nanmm'),
+        row(model_name='Rolex Deep', water_resistance='1' * 30 + 'm')])
+    assert main(['import-watches', path, '--dry-run', '--brands', BRANDS_CSV]) == 1
+    out = capsys.readouterr().out
+    assert '4 rows, 1 accepted, 3 skipped' in out
+    assert 'dial color longer than 50 characters' in out
+    assert "invalid case diameter 'nanmm'" in out
+    assert 'invalid water resistance' in out
+
+
+def test_csv_copy_source_quotes_embedded_quotes():
+    import csv
+    import io
+
+    from watches import _CsvCopySource
+
+    text = 'Grand Seiko SBGA211G "Snowflake",White\n\nRolex "Hulk",Green\n'
+    source = _CsvCopySource(csv.reader(io.StringIO(text)), 2)
+    chunks = iter(lambda: source.read(8), '')
+    copied = ''.join(chunks)
+    assert copied == '"Grand Seiko SBGA211G ""Snowflake""",White,2\n"Rolex ""Hulk""",Green,2\n'
+
+
+def test_csv_copy_source_fits_rows_to_the_header():
+    import csv
+    import io
+
+    from watches import _CsvCopySource
+
+    source = _CsvCopySource(csv.reader(io.StringIO('Rolex A\nRolex B,Black,x,y\n')), 2)
+    assert source.read() == 'Rolex A,,1\nRolex B,Black,4\n'
+
+
+@pytest.mark.parametrize('error, transient', [
+    ("server closed the connection unexpectedly", True),
+    ("connection already closed", True),
+    ('FATAL:  password authentication failed for user "watches"', False),
+    ('could not translate host name "db.example" to address', False),
+    ('FATAL:  database "watches" does not exist', False),
+])
+def test_transient_errors_without_sqlstate(error, transient):
+    import psycopg2
+
+    from watches import is_transient_error
+
+    assert is_transient_error(psycopg2.OperationalError(error)) is transient
+
+
+@pytest.mark.parametrize('pgcode, transient', [
+    ('40001', True), ('40P01', True), ('08006', True), ('08P01', True), ('57P01', True),
+    ('23505', False), ('42P01', False), ('28P01', False),
+])
+def test_transient_errors_by_sqlstate(pgcode, transient):
+    import psycopg2
+
+    from watches import is_transient_error
+
+    class Error(psycopg2.OperationalError):
+        pass
+
+    Error.pgcode = pgcode
+    assert is_transient_error(Error()) is transient
+
+
+@pytest.mark.parametrize('value, number', [
+    (40, 40.0), ('40mm', 40.0), (' 42.5 MM ', 42.5), ('300 m', 300.0), ('300', 300.0),
+    (None, None), ('', None), ('n/a', None), ('40-42mm', None), ('..', None), ('4x0mm', None),
+])
+def test_spec_number_reads_like_the_typed_columns(value, number):
+    from watches import spec_number
+
+    assert spec_number(value) == number
+
+
+def test_loggable_params_hides_binary_values():
+    from watches import _loggable_params
+
+    params = ('catalog', b'\x00' * 4096)
+    assert _loggable_params(params) == ('catalog', '<4096 bytes>')
+    assert _loggable_params({'data': memoryview(b'ab')}) == {'data': '<2 bytes>'}
+    plain = ('catalog', 1)
+    assert _loggable_params(plain) is plain
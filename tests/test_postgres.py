@@ -0,0 +1,427 @@
+"""Tests against a real Postgres; set TEST_DB_NAME to a scratch database to run them.
+
+The other DB_* variables (or .env) give the server. Every test drops and
+recreates the catalog tables in that database.
+"""
+import os
+
+import pytest
+
+from conftest import BRANDS_CSV, MODELS_CSV
+
+pytestmark = pytest.mark.skipif(not os.getenv('TEST_DB_NAME'),
+                                reason="TEST_DB_NAME not set")
+
+
+def clear_settings_cache():
+    import watches
+
+    watches.get_db_params.cache_clear()
+    watches.get_read_hosts.cache_clear()
+    watches._watch_partitioned.clear()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    import watches
+
+    monkeypatch.setenv('DB_NAME', os.environ['TEST_DB_NAME'])
+    monkeypatch.setenv('DB_READ_HOSTS', '')
+    clear_settings_cache()
+    conn = watches.connect_to_db()
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS Watch, WatchModelName, BrandAlias, Brand, CatalogSketch CASCADE")
+    conn.commit()
+    yield conn
+    conn.close()
+    clear_settings_cache()
+
+
+def import_catalog(*flags):
+    from watches import main
+
+    assert main(['import-brands', BRANDS_CSV]) == 0
+    assert main(['import-watches', MODELS_CSV, *flags]) == 0
+
+
+def scalar(conn, sql, params=()):
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        value = cur.fetchone()[0]
+    conn.commit()
+    return value
+
+
+@pytest.mark.parametrize('init_flags', [[], ['--partitions', '4']])
+def test_import(db, init_flags):
+    from sketches import get_approximate_stats
+    from watches import main
+
+    assert main(['init-db', *init_flags]) == 0
+    import_catalog()
+    assert scalar(db, "SELECT count(*) FROM Watch") == 100
+    import_catalog()
+    import_catalog('--dedup', 'last')
+    assert scalar(db, "SELECT count(*) FROM Watch") == 100
+    # Only the first import inserted anything, so the sketches count each watch once.
+    assert get_approximate_stats()['watch_count'] == 100
+    assert sum(count for _, count in get_approximate_stats()['movement_types']) == 100
+
+
+def test_change_feed_and_replica(db):
+    from changes import read_changes
+    from replica import LocalReplica
+    from watches import add_watch, create_tables
+
+    create_tables()
+    import_catalog()
+    replica = LocalReplica.bootstrap()
+    assert len(replica) == 100
+    assert replica.refresh() == 0
+
+    watermark, changes = read_changes(replica.watermark)
+    assert list(changes) == []
+
+    add_watch(scalar(db, "SELECT BrandID FROM Brand WHERE BrandName = 'Rolex'"), 'Rolex Test Model', 'Black', 'Automatic', '3135',
+              'Steel', 40, 100)
+    assert replica.refresh() == 1
+    assert replica.get_watch('Rolex Test Model').dial_color == 'Black'
+    assert replica.refresh() == 0
+
+
+def test_async_add_watch_across_event_loops(db):
+    import asyncio
+
+    import watches_async
+    from watches import create_tables, watch_added_hooks
+
+    create_tables()
+    import_catalog()
+    rolex = scalar(db, "SELECT BrandID FROM Brand WHERE BrandName = 'Rolex'")
+    added = []
+    watch_added_hooks.append(added.append)
+    try:
+        # The second asyncio.run() must not reuse the first loop's pool or lock.
+        for name in ['Rolex Async One', 'Rolex Async Two', 'Rolex Async One']:
+            asyncio.run(watches_async.add_watch(rolex, name, 'Black', 'Automatic', '3135',
+                                                'Steel', 40, 100))
+        asyncio.run(watches_async.close_pool())
+    finally:
+        watch_added_hooks.remove(added.append)
+    assert [watch.model_name for watch in added] == ['Rolex Async One', 'Rolex Async Two']
+    assert scalar(db, "SELECT count(*) FROM Watch WHERE ModelName LIKE 'Rolex Async %%'") == 2
+
+
+@pytest.mark.parametrize('flags', [[], ['--staged']])
+def test_partitioned_model_names_stay_unique(db, tmp_path, capsys, flags):
+    from test_storage import write_models
+    from watches import add_watch, main
+
+    def stored():
+        with db.cursor() as cur:
+            cur.execute("SELECT BrandID, DialColor FROM Watch WHERE ModelName = 'Rolex Pro Diver'")
+            rows = cur.fetchall()
+        db.commit()
+        return rows
+
+    assert main(['init-db', '--partitions', '4']) == 0
+    assert main(['import-brands', BRANDS_CSV]) == 0
+    rolex, omega = (scalar(db, "SELECT BrandID FROM Brand WHERE BrandName = %s", (name,))
+                    for name in ('Rolex', 'Omega'))
+    path = write_models(tmp_path / 'models.csv', [
+        ('Rolex Pro Diver', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m')])
+    assert main(['import-watches', path, *flags]) == 0
+    add_watch(omega, 'Rolex Pro Diver', 'White', 'Automatic', '3135', 'Steel', 40, 300)
+    assert stored() == [(rolex, 'Black')]
+
+    # The same row now resolves to Omega through the longer alias.
+    assert main(['add-alias', 'Rolex Pro', 'Omega']) == 0
+    assert main(['import-watches', path, *flags]) == 0
+    assert stored() == [(rolex, 'Black')]
+    capsys.readouterr()
+    assert main(['import-watches', path, '--dedup', 'last', *flags]) == 0
+    # Moved once, not counted again by the upsert.
+    assert '1 of 1 rows imported' in capsys.readouterr().out
+    assert stored() == [(omega, 'Black')]
+    assert scalar(db, "SELECT BrandID FROM WatchModelName WHERE ModelName = 'Rolex Pro Diver'") == omega
+
+    with db.cursor() as cur:
+        cur.execute("DELETE FROM Watch WHERE ModelName = 'Rolex Pro Diver'")
+    db.commit()
+    add_watch(rolex, 'Rolex Pro Diver', 'Blue', 'Automatic', '3135', 'Steel', 40, 300)
+    assert stored() == [(rolex, 'Blue')]
+
+
+@pytest.mark.parametrize('flags', [[], ['--staged']])
+def test_sketches_count_every_insert_path(db, monkeypatch, flags):
+    import sketches
+    from watches import add_watch, create_tables
+
+    def movement_total():
+        return sum(count for _, count in sketches.get_approximate_stats()['movement_types'])
+
+    def stored():
+        return scalar(db, "SELECT Data FROM CatalogSketch").tobytes()
+
+    create_tables()
+    import_catalog(*flags)
+    imported = scalar(db, "SELECT count(*) FROM Watch")
+    assert sketches.get_approximate_stats()['watch_count'] == imported
+    assert movement_total() == imported
+
+    monkeypatch.setattr(sketches, 'SKETCH_UPDATE_INTERVAL', 3)
+    monkeypatch.setattr(sketches, '_added_watches', 0)
+    brand_id = scalar(db, "SELECT BrandID FROM Brand WHERE BrandName = 'Rolex'")
+    before = stored()
+    for i in range(2):
+        add_watch(brand_id, f'Rolex Added {i}', 'Black', 'Automatic', '3135', 'Steel', 40, 100)
+    # Readers add the rows created since the last update...
+    assert movement_total() == imported + 2
+    assert stored() == before
+    # ...and every SKETCH_UPDATE_INTERVAL add_watch() calls store them.
+    add_watch(brand_id, 'Rolex Added 2', 'Black', 'Automatic', '3135', 'Steel', 40, 100)
+    assert stored() != before
+
+    # Rows written by any other path count too, and updates do not.
+    with db.cursor() as cur:
+        cur.execute("INSERT INTO Brand (BrandName, BrandKey) VALUES ('Zzz', 'zzz')")
+        cur.execute("""
+            INSERT INTO Watch (BrandID, ModelName, MovementType)
+            SELECT BrandID, 'Zzz One', 'Quartz' FROM Brand WHERE BrandKey = 'zzz'
+        """)
+        cur.execute("UPDATE Watch SET DialColor = 'Red' WHERE ModelName = 'Rolex Added 0'")
+    db.commit()
+    assert movement_total() == imported + 4
+    assert sketches.update_catalog_sketches().brands.count() == scalar(
+        db, "SELECT count(*) FROM Brand")
+    assert movement_total() == imported + 4
+    sketches.rebuild_catalog_sketches()
+    assert movement_total() == imported + 4
+
+
+@pytest.mark.parametrize('init_flags', [[], ['--partitions', '4']])
+def test_postgres_backend_import(db, init_flags):
+    import storage
+    from sketches import get_approximate_stats
+    from watches import main
+
+    assert main(['init-db', *init_flags]) == 0
+    with storage.PostgresBackend() as backend:
+        storage.import_brands(backend, BRANDS_CSV)
+        stats = storage.import_watches(backend, MODELS_CSV)
+        assert storage.import_watches(backend, MODELS_CSV, dedup='last')['imported'] == 0
+    assert stats['imported'] == scalar(db, "SELECT count(*) FROM Watch") > 0
+    assert get_approximate_stats()['watch_count'] == stats['imported']
+
+
+def test_find_by_brand_scans_one_partition(db):
+    from watches import FIND_WATCHES_SQL, find_watches, main
+
+    assert main(['init-db', '--partitions', '4']) == 0
+    import_catalog()
+    rolex = scalar(db, "SELECT BrandID FROM Brand WHERE BrandName = 'Rolex'")
+    watches = find_watches(brand='rolex')
+    assert watches and {watch.brand_id for watch in watches} == {rolex}
+    assert find_watches(brand='No Such Brand') == []
+    assert main(['find', '--brand', 'Rolex']) == 0
+
+    with db.cursor() as cur:
+        cur.execute("EXPLAIN " + FIND_WATCHES_SQL.format(conditions="BrandID = %s"), (rolex,))
+        plan = '\n'.join(line for line, in cur)
+    db.commit()
+    assert plan.count(' on watch_p') == 1
+
+
+@pytest.mark.parametrize('flags', [[], ['--staged']])
+def test_last_row_wins_across_batches(db, tmp_path, monkeypatch, capsys, flags):
+    import watches
+    from test_storage import write_models
+
+    monkeypatch.setattr(watches, 'BATCH_SIZE', 2)
+    path = write_models(tmp_path / 'models.csv', [
+        ('Rolex Test', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+        ('Rolex Other', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+        ('Rolex Third', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+        ('Rolex Test', 'Blue', 'Automatic', '3135', 'Steel', '41mm', '100m'),
+        ('Rolex Test', 'Green', 'Automatic', '3135', 'Steel', 'bad', '100m')])
+    assert watches.main(['init-db']) == 0
+    assert watches.main(['import-brands', BRANDS_CSV]) == 0
+    capsys.readouterr()
+    watches.main(['import-watches', path, '--dedup', 'last', *flags])
+    assert '3 of 5 rows imported, 1 skipped, 1 duplicates dropped' in capsys.readouterr().out
+    assert scalar(db, "SELECT count(*) FROM Watch") == 3
+    assert scalar(db, "SELECT DialColor FROM Watch WHERE ModelName = 'Rolex Test'") == 'Blue'
+
+
+def test_staged_import_skips_bad_rows(db, tmp_path):
+    from test_storage import write_models
+    from watches import create_tables, main
+
+    create_tables()
+    assert main(['import-brands', BRANDS_CSV]) == 0
+    path = write_models(tmp_path / 'models.csv', [
+        ('Rolex Good', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+        ('Rolex Long', 'x' * 51, 'Automatic', '3135', 'Steel', '40mm', '300m'),
+        ('Rolex Wide', 'Black', 'Automatic', '3135', 'Steel', '1' * 11 + 'mm', '300m'),
+        ('Rolex Deep', 'Black', 'Automatic', '3135', 'Steel', '40mm', '1' * 10 + 'm')])
+    assert main(['import-watches', path, '--staged']) == 0
+    assert scalar(db, "SELECT array_agg(ModelName) FROM Watch") == ['Rolex Good']
+
+
+@pytest.mark.parametrize('flags', [[], ['--staged']])
+def test_ragged_rows_are_skipped(db, tmp_path, capsys, flags):
+    from test_storage import write_models
+    from watches import create_tables, main
+
+    create_tables()
+    assert main(['import-brands', BRANDS_CSV]) == 0
+    path = write_models(tmp_path / 'models.csv', [
+        ('Rolex Short', 'Black'),
+        ('Rolex Good', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+        ('Rolex Long', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m', 'extra')])
+    assert main(['import-watches', path, *flags]) == 0
+    assert 'expected 7 fields, got 2' in capsys.readouterr().out
+    assert scalar(db, "SELECT array_agg(ModelName ORDER BY ModelName) FROM Watch") == [
+        'Rolex Good', 'Rolex Long']
+
+
+@pytest.mark.parametrize('filename', ['watches.parquet', 'watches.arrow'])
+def test_arrow_export_round_trip(db, tmp_path, filename):
+    import arrow_io
+    from watches import create_tables
+
+    path = str(tmp_path / filename)
+    create_tables()
+    assert arrow_io.export_watches(path) == 0
+    assert sum(batch.num_rows for batch in arrow_io._read_batches(path, 1000)) == 0
+
+    import_catalog()
+    assert arrow_io.export_watches(path) == 100
+    with db.cursor() as cur:
+        cur.execute("DELETE FROM Watch")
+    db.commit()
+    assert arrow_io.import_watches(path) == (100, 100)
+
+
+def test_arrow_import_skips_rows_without_a_brand(db, tmp_path, capsys):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    import arrow_io
+    from watches import main
+
+    assert main(['init-db', '--partitions', '4']) == 0
+    path = str(tmp_path / 'watches.parquet')
+    pq.write_table(pa.table({
+        'brand_name': ['Newbrand', '', None, 'Newbrand'],
+        'model_name': ['Newbrand One', 'Nobrand One', 'Nobrand Two', 'Newbrand Two'],
+        'case_diameter': [40.0, 41.0, None, 38.5],
+    }), path)
+    assert arrow_io.import_watches(path) == (4, 2)
+    out = capsys.readouterr().out
+    assert 'Nobrand One' in out and 'Nobrand Two' in out and '2 skipped' in out
+    assert scalar(db, "SELECT count(*) FROM Brand WHERE BrandName = 'Newbrand'") == 1
+    assert scalar(db, "SELECT count(*) FROM Watch") == 2
+    assert arrow_io.import_watches(str(tmp_path / 'missing.parquet')) is None
+
+
+def test_staged_and_row_imports_agree(db):
+    from watches import create_tables
+
+    watches_sql = "SELECT array_agg((ModelName, BrandID)::text ORDER BY ModelName) FROM Watch"
+    create_tables()
+    import_catalog()
+    expected = scalar(db, watches_sql)
+    assert '("Grand Seiko SBGA211G ""Snowflake""",' in ' '.join(expected)
+    import_catalog('--staged')
+    assert scalar(db, watches_sql) == expected
+
+    # Brands created by the first import are known now, so a staged import
+    # into an empty Watch files every model under the same brand.
+    with db.cursor() as cur:
+        cur.execute("DELETE FROM Watch")
+    db.commit()
+    import_catalog('--staged')
+    assert scalar(db, watches_sql) == expected
+
+
+def test_exit_codes(db, monkeypatch):
+    from watches import main
+
+    assert main(['init-db']) == 0
+    assert main(['import-brands', BRANDS_CSV]) == 0
+    assert main(['add-alias', 'Rollie', 'Rolex']) == 0
+    assert main(['add-alias', 'Nobody', 'No Such Brand']) == 1
+    assert main(['stats']) == 0
+    assert main(['list-brands']) == 0
+    assert main(['partitions', '--vacuum']) == 0
+
+    monkeypatch.setenv('DB_NAME', 'no_such_database')
+    clear_settings_cache()
+    assert main(['init-db']) == 1
+    assert main(['import-brands', BRANDS_CSV]) == 1
+
+
+def test_profiler_does_not_rerun_writes(db, caplog):
+    import watches
+
+    watches.create_tables()
+    watches.enable_profiling(0)
+    try:
+        conn = watches.connect_to_db()
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO Brand (BrandName, BrandKey) VALUES ('Profiled', 'profiled')")
+            cur.execute("SELECT count(*) FROM Brand")
+        conn.commit()
+        conn.close()
+    finally:
+        watches.disable_profiling()
+    insert_log, select_log = [record.getMessage() for record in caplog.records][:2]
+    assert 'INSERT' in insert_log and 'actual time' not in insert_log
+    assert 'actual time' in select_log
+    # Only the real insert drew a BrandID.
+    assert scalar(db, "SELECT last_value FROM pg_sequences WHERE sequencename = 'brand_brandid_seq'") == 1
+
+
+def test_replica_lag_on_primary(db):
+    from watches import REPLICA_LAG_SQL
+
+    assert scalar(db, REPLICA_LAG_SQL) == 0
+
+
+def test_stats_ignore_malformed_specs(db):
+    from sketches import rebuild_catalog_sketches
+    from snapshot import CatalogSnapshot
+    from watches import AVG_CASE_DIAMETER_SQL, create_tables
+
+    create_tables()
+    with db.cursor() as cur:
+        cur.execute("INSERT INTO Brand (BrandName, BrandKey) VALUES ('Rolex', 'rolex')")
+        cur.execute("""
+            INSERT INTO Watch (BrandID, ModelName, CaseDiameter, WaterResistance)
+            SELECT BrandID, m, d, w FROM Brand,
+                   (VALUES ('A', '40mm', '100m'), ('B', '40-42mm', '..'), ('C', '..', '1-2m')) v(m, d, w)
+        """)
+    db.commit()
+    assert scalar(db, AVG_CASE_DIAMETER_SQL) == 40
+    snapshot = CatalogSnapshot.load()
+    assert snapshot.count(case_diameter__isnull=True) == 2
+    assert snapshot.count(water_resistance__isnull=True) == 2
+    assert rebuild_catalog_sketches().stats({})['avg_case_diameter'] == 40
+
+
+@pytest.mark.parametrize('flags', [[], ['--staged']])
+def test_unchanged_reimport_keeps_versions(db, flags):
+    from changes import read_changes
+    from watches import create_tables
+
+    create_tables()
+    import_catalog()
+    versions = scalar(db, "SELECT array_agg(Version ORDER BY WatchID) FROM Watch")
+    watermark, changes = read_changes()
+    list(changes)
+
+    import_catalog('--dedup', 'last', *flags)
+    assert scalar(db, "SELECT array_agg(Version ORDER BY WatchID) FROM Watch") == versions
+    _, changes = read_changes(watermark)
+    assert [change for change in changes if change.table == 'Watch'] == []
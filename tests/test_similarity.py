@@ -0,0 +1,41 @@
+import math
+
+import numpy as np
+import pytest
+
+from similarity import SimilarityIndex
+from watches import Watch
+
+
+def brute_force(index, model_name, k):
+    (movement_type, case_material), point = index._watches[model_name]
+    distances = []
+    for name, (key, other) in index._watches.items():
+        if name != model_name:
+            penalty = (key[0] != movement_type) + (key[1] != case_material)
+            distances.append((float(np.linalg.norm(point - other)) + penalty, name))
+    return sorted(distances)[:k]
+
+
+def test_similar_matches_brute_force(snapshot):
+    index = SimilarityIndex.from_snapshot(snapshot)
+    for model_name in ('Model 0', 'Model 17', 'Model 250'):
+        result = index.similar(model_name, k=8)
+        expected = brute_force(index, model_name, 8)
+        assert [distance for _, distance in result] == pytest.approx(
+            [distance for distance, _ in expected])
+
+
+def test_similarity_add_and_remove(snapshot):
+    index = SimilarityIndex.from_snapshot(snapshot)
+    for i in range(200):
+        index.add(Watch(None, 1, f"New {i}", None, 'Automatic', None, 'Steel',
+                        '40mm', f"{100 + i}m"))
+    index.remove('Model 1')
+    assert len(index) == 499
+    with pytest.raises(KeyError):
+        index.similar('Model 1')
+    result = index.similar('New 0', k=3)
+    assert all(name.startswith('New') for name, _ in result)
+    assert result == sorted(result, key=lambda item: item[1])
+    assert not any(math.isnan(distance) for _, distance in result)
@@ -0,0 +1,61 @@
+import random
+
+from sketches import CatalogSketches, CountMinSketch, HyperLogLog, SpaceSaving
+from watches import Watch
+
+
+def test_hyperloglog_estimate():
+    for n in (100, 50000):
+        hll = HyperLogLog()
+        for i in range(n):
+            hll.add(f"model {i}")
+            hll.add(f"model {i}")
+        assert abs(hll.count() - n) <= 0.03 * n
+
+
+def test_hyperloglog_merge_is_union():
+    left, right, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        (left if i % 2 else right).add(i)
+        both.add(i)
+    left.merge(right)
+    assert left.count() == both.count()
+
+
+def test_count_min_never_undercounts():
+    sketch = CountMinSketch(width=64, depth=4)
+    counts = {}
+    rng = random.Random(1)
+    for _ in range(5000):
+        key = rng.randrange(500)
+        counts[key] = counts.get(key, 0) + 1
+        sketch.add(key)
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
+
+
+def test_space_saving_exact_under_capacity():
+    top = SpaceSaving(capacity=10)
+    for key, count in [('a', 5), ('b', 3), ('c', 9)]:
+        top.add(key, count)
+    assert top.top(2) == [('c', 9), ('a', 5)]
+
+
+def test_space_saving_keeps_heavy_hitters():
+    top = SpaceSaving(capacity=5)
+    for i in range(1000):
+        top.add('heavy')
+        top.add(f"rare {i}")
+    assert top.top(1)[0][0] == 'heavy'
+
+
+def test_catalog_sketches_round_trip():
+    sketches = CatalogSketches()
+    for i in range(200):
+        sketches.add_watch(Watch(None, i % 7, f"model {i}", None,
+                                 'Automatic' if i % 3 else 'Quartz', None, None, 40.0, None))
+    restored = CatalogSketches.from_bytes(sketches.to_bytes())
+    names = {brand_id: f"Brand {brand_id}" for brand_id in range(7)}
+    assert restored.stats(names) == sketches.stats(names)
+    stats = restored.stats(names)
+    assert stats['avg_case_diameter'] == 40.0
+    assert dict(stats['movement_types']) == {'Automatic': 133, 'Quartz': 67}
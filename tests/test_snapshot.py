@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from snapshot import CatalogSnapshot
+
+
+@pytest.mark.parametrize('filters', [
+    {'case_diameter__between': (38, 41)},
+    {'water_resistance__gte': 200, 'movement_type': 'Automatic'},
+    {'case_diameter__lt': 36, 'water_resistance__lte': 90, 'brand_name': 'Seiko'},
+    {'case_material__isnull': True},
+    {'movement_type__in': ['Quartz', 'Manual'], 'case_diameter__gt': 44},
+])
+def test_select_matches_mask(snapshot, filters):
+    assert list(snapshot.select(**filters)) == list(np.flatnonzero(snapshot.mask(**filters)))
+
+
+def test_stats(snapshot):
+    stats = snapshot.stats()
+    assert stats['brand_count'] == 2 and stats['watch_count'] == 300
+    assert dict(stats['top_brands']) == {'Rolex': 150, 'Seiko': 150}
+
+
+def test_save_and_open_round_trip(snapshot, tmp_path):
+    path = tmp_path / 'catalog.snap'
+    snapshot.sorted_index('water_resistance')
+    snapshot.save(path)
+    reopened = CatalogSnapshot.open(path)
+    assert len(reopened) == len(snapshot)
+    assert list(reopened.column('model_name')) == list(snapshot.column('model_name'))
+    assert reopened.stats() == snapshot.stats()
+    np.testing.assert_array_equal(reopened.column('case_diameter'),
+                                  snapshot.column('case_diameter'))
+    assert list(reopened.select(water_resistance__gte=300)) == list(
+        snapshot.select(water_resistance__gte=300))
+
+
+def test_open_rejects_other_files(tmp_path):
+    path = tmp_path / 'not.snap'
+    path.write_bytes(b'x' * 64)
+    with pytest.raises(ValueError):
+        CatalogSnapshot.open(path)
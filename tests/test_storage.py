@@ -0,0 +1,114 @@
+import csv
+
+import pytest
+
+from conftest import BRANDS_CSV, MODELS_CSV
+from storage import import_brands, import_watches
+from watches import WATCH_CSV_COLUMNS, BrandResolver, Watch, main
+
+
+def write_models(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(WATCH_CSV_COLUMNS)
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_import_brands_seeds_aliases(backend):
+    rows, created = import_brands(backend, BRANDS_CSV)
+    assert created == rows == len(backend.list_brands())
+
+    resolver = BrandResolver(backend.brand_keys())
+    assert resolver.resolve('Nomos') == resolver.resolve('NOMOS Glashütte') is not None
+    assert import_brands(backend, BRANDS_CSV) == (rows, 0)
+
+
+def test_import_watches_matches_brands_by_prefix(backend):
+    import_brands(backend, BRANDS_CSV)
+    stats = import_watches(backend, MODELS_CSV)
+    assert stats['rows'] == 100
+    assert stats['imported'] + stats['skipped'] + stats['duplicates'] == 100
+
+    resolver = BrandResolver(backend.brand_keys())
+    brand_ids = dict(backend.conn.execute("SELECT ModelName, BrandID FROM Watch"))
+    assert brand_ids['Nomos Tangente Neomatik'] == resolver.resolve('NOMOS Glashütte')
+    assert brand_ids['A. Lange & Söhne Saxonia Thin'] == resolver.resolve('A.Lange & Söhne')
+
+
+def test_rerun_imports_nothing(backend):
+    import_brands(backend, BRANDS_CSV)
+    import_watches(backend, MODELS_CSV)
+    assert import_watches(backend, MODELS_CSV)['imported'] == 0
+
+
+def test_dedup_policies(backend, tmp_path):
+    rows = [('Rolex Test', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+            ('Rolex Test', 'Blue', 'Automatic', '3135', 'Steel', '41mm', '100m')]
+    path = write_models(tmp_path / 'models.csv', rows)
+
+    stats = import_watches(backend, path, dedup='first')
+    assert (stats['imported'], stats['duplicates']) == (1, 1)
+    assert backend.conn.execute("SELECT DialColor FROM Watch").fetchall() == [('Black',)]
+
+    import_watches(backend, path, dedup='last')
+    assert backend.conn.execute("SELECT DialColor, CaseDiameter FROM Watch").fetchall() == [
+        ('Blue', 41.0)]
+
+
+def test_bad_rows_are_skipped_not_the_batch(backend, tmp_path):
+    rows = [('Rolex Good', 'Black', 'Automatic', '3135', 'Steel', '40mm', '300m'),
+            ('Rolex Long', 'X' * 51, 'Automatic', '3135', 'Steel', '40mm', '300m'),
+            ('Rolex Bad', 'Black', 'Automatic', '3135', 'Steel', '4x0mm', '300m'),
+            ('Omega Good', 'White', 'Quartz', '', 'Steel', 'n/a', '')]
+    stats = import_watches(backend, write_models(tmp_path / 'models.csv', rows))
+    assert (stats['imported'], stats['skipped']) == (2, 2)
+
+
+def test_write_watches_falls_back_to_single_rows(backend, tmp_path, capsys):
+    backend.conn.execute("""
+        CREATE TRIGGER no_pink BEFORE INSERT ON Watch WHEN NEW.DialColor = 'Pink'
+        BEGIN SELECT RAISE(ABORT, 'pink dial'); END
+    """)
+    rows = [('Rolex A', 'Pink', 'Automatic', '', 'Steel', '40mm', '100m'),
+            ('Rolex B', 'Black', 'Automatic', '', 'Steel', '40mm', '100m')]
+    stats = import_watches(backend, write_models(tmp_path / 'models.csv', rows))
+    assert (stats['imported'], stats['skipped']) == (1, 1)
+    assert 'pink dial' in capsys.readouterr().out
+
+
+def test_catalog_stats(backend):
+    import_brands(backend, BRANDS_CSV)
+    backend.write_watches([
+        Watch(None, 1, 'A', None, 'Automatic', None, None, 40.0, 100),
+        Watch(None, 1, 'B', None, 'Automatic', None, None, 42.0, 200),
+        Watch(None, 2, 'C', None, 'Quartz', None, None, None, None),
+    ])
+    stats = backend.catalog_stats()
+    assert stats['watch_count'] == 3
+    assert stats['avg_case_diameter'] == 41.0
+    assert stats['top_brands'][0][1] == 2
+    assert dict(stats['movement_types']) == {'Automatic': 2, 'Quartz': 1}
+
+
+def test_cli_round_trip(sqlite_url, capsys):
+    assert main(['--db', sqlite_url, 'init-db']) == 0
+    assert main(['--db', sqlite_url, 'import-brands', BRANDS_CSV]) == 0
+    assert main(['--db', sqlite_url, 'import-watches', MODELS_CSV]) == 0
+    assert main(['--db', sqlite_url, 'add-alias', 'Zzz', 'Rolex']) == 0
+    assert main(['--db', sqlite_url, 'add-alias', 'Zzz', 'No Such Brand']) == 1
+    capsys.readouterr()
+    assert main(['--db', sqlite_url, 'stats']) == 0
+    assert 'Total number of brands' in capsys.readouterr().out
+
+
+def test_cli_missing_file_fails(sqlite_url):
+    main(['--db', sqlite_url, 'init-db'])
+    assert main(['--db', sqlite_url, 'import-watches', '/nonexistent/models.csv']) == 1
+
+
+@pytest.mark.parametrize('flags', [['--workers', '4'], ['--staged']])
+def test_cli_rejects_postgres_only_flags(sqlite_url, flags):
+    with pytest.raises(SystemExit) as exc:
+        main(['--db', sqlite_url, 'import-watches', MODELS_CSV, *flags])
+    assert exc.value.code == 2
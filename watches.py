@@ -1,91 +1,1146 @@
-import psycopg2  # type: ignore
+"""Watch catalog: Postgres schema, CSV importers, reporting and a command line.
+
+Run ``python watches.py --help`` for the subcommands. psycopg2, dotenv and
+the optional NumPy/pyarrow modules are imported only by the code paths that
+need them, so quick commands start fast.
+"""
+import argparse
+import bz2
 import csv
+import functools
+import glob
+import gzip
+import hashlib
+import io
+import logging
+import lzma
+import math
 import os
+import random
 import re
-from dotenv import load_dotenv  # type: ignore
+import sys
+import time
+import unicodedata
+import zlib
 
-load_dotenv()
 
-# Database connection parameters
-DB_PARAMS = {
-    "dbname": os.getenv('DB_NAME'),
-    "user": os.getenv('DB_USER'),
-    "password": os.getenv('DB_PASSWORD'),
-    "host": os.getenv('DB_HOST')
-}
+@functools.lru_cache(maxsize=None)
+def get_db_params():
+    """Database connection parameters, from the environment or a .env file."""
+    from dotenv import load_dotenv  # type: ignore
+
+    load_dotenv()
+    return {
+        "dbname": os.getenv('DB_NAME'),
+        "user": os.getenv('DB_USER'),
+        "password": os.getenv('DB_PASSWORD'),
+        "host": os.getenv('DB_HOST')
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def get_read_hosts():
+    """Read replicas from DB_READ_HOSTS ("host[:port],..."), as (host, port or None) pairs."""
+    get_db_params()  # loads .env
+    hosts = []
+    for entry in os.getenv('DB_READ_HOSTS', '').split(','):
+        host, _, port = entry.strip().partition(':')
+        if host:
+            hosts.append((host, int(port) if port else None))
+    return hosts
+
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this many milliseconds get their plan logged.
+# Profiling is off unless DB_PROFILE_THRESHOLD_MS is set or enable_profiling()
+# is called; _FROM_ENV defers to the environment.
+_FROM_ENV = object()
+_profile_threshold_ms = _FROM_ENV
+
+# Only plain DML/queries can be EXPLAINed; DDL, COPY and utility statements
+# are timed but never re-run.
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|VALUES)\b',
+                          re.IGNORECASE)
+
+# Statements that may write (including WITH ... UPDATE and SELECT ... FOR
+# UPDATE) are explained without ANALYZE, which would run them a second time.
+_MAY_WRITE = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE)\b', re.IGNORECASE)
+
+
+def enable_profiling(threshold_ms=100.0):
+    """Time every statement on new connections and EXPLAIN the slow ones."""
+    global _profile_threshold_ms
+    _profile_threshold_ms = float(threshold_ms)
+
+
+def disable_profiling():
+    global _profile_threshold_ms
+    _profile_threshold_ms = None
+
+
+def _profiling_threshold():
+    if _profile_threshold_ms is _FROM_ENV:
+        get_db_params()  # loads .env
+        value = os.getenv('DB_PROFILE_THRESHOLD_MS')
+        return float(value) if value else None
+    return _profile_threshold_ms
+
+
+def _loggable_params(vars):
+    """vars with bytes-like values replaced by '<N bytes>'; vars itself if it has none."""
+    def shown(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return f"<{len(value)} bytes>"
+        return value
+
+    if isinstance(vars, dict):
+        loggable = {key: shown(value) for key, value in vars.items()}
+        changed = any(loggable[key] is not vars[key] for key in vars)
+    elif isinstance(vars, (tuple, list)):
+        loggable = type(vars)(shown(value) for value in vars)
+        changed = any(new is not old for new, old in zip(loggable, vars))
+    else:
+        return vars
+    return loggable if changed else vars
+
+
+@functools.lru_cache(maxsize=None)
+def _profiling_cursor_class():
+    """Build ProfilingCursor on first use, so psycopg2 is only imported when connecting."""
+    import psycopg2  # type: ignore
+    import psycopg2.extensions  # type: ignore
+
+    class ProfilingCursor(psycopg2.extensions.cursor):
+        """Cursor that logs the plan of statements over the threshold.
+
+        Queries are run a second time under EXPLAIN (ANALYZE, BUFFERS) inside
+        a savepoint that is rolled back, so a slow query costs about twice
+        its time. INSERT, UPDATE and DELETE get a plain EXPLAIN (estimates
+        only) instead: running them again would double the write work and
+        use up sequence values that the rollback does not return.
+        """
+
+        def execute(self, query, vars=None):
+            start = time.perf_counter()
+            result = super().execute(query, vars)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            threshold_ms = _profiling_threshold()
+            if threshold_ms is not None and elapsed_ms >= threshold_ms:
+                self._log_slow_statement(query, vars, elapsed_ms)
+            return result
+
+        def copy_expert(self, sql, file, size=8192):
+            start = time.perf_counter()
+            result = super().copy_expert(sql, file, size)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            threshold_ms = _profiling_threshold()
+            if threshold_ms is not None and elapsed_ms >= threshold_ms:
+                logger.warning("Slow COPY (%.1f ms):\n%s", elapsed_ms, sql)
+            return result
+
+        def _mogrify_text(self, query, vars):
+            return self.mogrify(query, vars).decode(
+                psycopg2.extensions.encodings[self.connection.encoding])
+
+        def _log_slow_statement(self, query, vars, elapsed_ms):
+            statement = self._mogrify_text(query, vars)
+            # Binary parameters (sketch blobs and the like) are logged by size.
+            shown_vars = _loggable_params(vars)
+            shown = statement if shown_vars is vars else self._mogrify_text(query, shown_vars)
+            if not _EXPLAINABLE.match(statement):
+                logger.warning("Slow statement (%.1f ms) params=%r:\n%s",
+                               elapsed_ms, shown_vars, shown)
+                return
+
+            if self.connection.autocommit:
+                begin, rollback = "BEGIN", "ROLLBACK"
+            else:
+                begin, rollback = ("SAVEPOINT profiling_explain",
+                                   "ROLLBACK TO SAVEPOINT profiling_explain")
+
+            # A plain cursor, so the EXPLAIN itself is not profiled.
+            cur = self.connection.cursor(cursor_factory=psycopg2.extensions.cursor)
+            try:
+                cur.execute(begin)
+                try:
+                    explain = "EXPLAIN " if _MAY_WRITE.search(statement) else "EXPLAIN (ANALYZE, BUFFERS) "
+                    cur.execute(explain + statement)
+                    plan = "\n".join(row[0] for row in cur.fetchall())
+                finally:
+                    cur.execute(rollback)
+            except psycopg2.Error as e:
+                plan = f"<EXPLAIN failed: {e}>"
+            finally:
+                cur.close()
+
+            logger.warning("Slow statement (%.1f ms) params=%r:\n%s\n%s",
+                           elapsed_ms, shown_vars, shown, plan)
+
+    return ProfilingCursor
+
+
+def _connect(**params):
+    import psycopg2  # type: ignore
+
+    if _profiling_threshold() is None:
+        return psycopg2.connect(**params)
+    return psycopg2.connect(**params, cursor_factory=_profiling_cursor_class())
+
+
+# Replay lag of a standby in seconds; 0 on a primary or on a standby that
+# is streaming and has replayed everything it received (the replay
+# timestamp goes stale while the primary is idle). A standby whose WAL
+# receiver is not streaming may have received nothing new for a long
+# time, so its lag is the age of the last replayed transaction, or
+# infinite if it has replayed none. Roles without pg_read_all_stats see
+# a NULL status, which counts as streaming while the receiver runs.
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN EXISTS (SELECT 1 FROM pg_stat_wal_receiver
+                     WHERE status = 'streaming' OR status IS NULL)
+             AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8,
+                      'Infinity')
+    END
+"""
+
+# Replicas further behind than this many seconds are passed over.
+DEFAULT_MAX_REPLICA_LAG = 30.0
+
+# How long a replica that failed or lagged is skipped before being tried again.
+REPLICA_RETRY_SECONDS = 30.0
+
+_replica_skip_until = {}
+
+
+def _connect_to_replica():
+    """A read-only connection to a healthy replica from get_read_hosts(), or None."""
+    hosts = get_read_hosts()
+    if not hosts:
+        return None
+    max_lag = float(os.getenv('DB_MAX_REPLICA_LAG', DEFAULT_MAX_REPLICA_LAG))
+    timeout = int(os.getenv('DB_READ_CONNECT_TIMEOUT', 3))
+    now = time.monotonic()
+
+    # Start at a random replica to spread readers; unhealthy ones are skipped.
+    start = random.randrange(len(hosts))
+    for host, port in hosts[start:] + hosts[:start]:
+        if _replica_skip_until.get((host, port), 0) > now:
+            continue
+        params = dict(get_db_params(), host=host, connect_timeout=timeout)
+        if port is not None:
+            params['port'] = port
+        try:
+            conn = _connect(**params)
+        except Exception as e:
+            logger.warning("Read replica %s unavailable: %s", host, e)
+            _replica_skip_until[(host, port)] = now + REPLICA_RETRY_SECONDS
+            continue
+        try:
+            with conn.cursor() as cur:
+                cur.execute(REPLICA_LAG_SQL)
+                lag = float(cur.fetchone()[0])
+            conn.rollback()
+        except Exception as e:
+            conn.close()
+            logger.warning("Read replica %s failed its lag check: %s", host, e)
+            _replica_skip_until[(host, port)] = now + REPLICA_RETRY_SECONDS
+            continue
+        if lag > max_lag:
+            conn.close()
+            logger.warning("Read replica %s is %.1fs behind; skipping it", host, lag)
+            _replica_skip_until[(host, port)] = now + REPLICA_RETRY_SECONDS
+            continue
+        return conn
+    return None
+
 
+def connect_to_db(readonly=False):
+    """Connect to the primary, or with readonly=True to a read replica if one is usable.
 
-def connect_to_db():
-    return psycopg2.connect(**DB_PARAMS)
+    Read replicas come from DB_READ_HOSTS. One is used only if it answers
+    within DB_READ_CONNECT_TIMEOUT seconds (default 3) and lags at most
+    DB_MAX_REPLICA_LAG seconds (default 30); otherwise the read goes to the
+    primary. Read-only connections reject writes either way.
+    """
+    conn = _connect_to_replica() if readonly else None
+    if conn is None:
+        conn = _connect(**get_db_params())
+    if readonly:
+        conn.set_session(readonly=True)
+    return conn
 
 
-def create_tables():
+# SQLSTATEs worth retrying: the transaction lost a race (serialization
+# failure, deadlock) or the server went away (admin/crash shutdown, still
+# starting up), plus the whole connection exception class 08.
+TRANSIENT_SQLSTATES = frozenset({'40001', '40P01', '57P01', '57P02', '57P03'})
+TRANSIENT_SQLSTATE_CLASSES = frozenset({'08'})
+
+# libpq messages for a connection that was lost, or refused while the
+# server restarts. Errors raised without a SQLSTATE are only retried when
+# they carry one of these: a bad password, an unknown host or a missing
+# database fail the same way every time.
+CONNECTION_LOST_MESSAGES = (
+    'server closed the connection unexpectedly',
+    'connection already closed',
+    'could not receive data from server',
+    'could not send data to server',
+    'no connection to the server',
+    'terminating connection',
+    'ssl connection has been closed unexpectedly',
+    'connection refused',
+    'the database system is starting up',
+    'the database system is shutting down',
+)
+
+RETRY_MAX_ATTEMPTS = 8
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+
+def is_transient_error(error):
+    """True if error may go away on retry, possibly over a new connection."""
+    import psycopg2  # type: ignore
+
+    if not isinstance(error, psycopg2.Error):
+        return False
+    if error.pgcode is None:
+        if not isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+            return False
+        message = str(error).lower()
+        return any(lost in message for lost in CONNECTION_LOST_MESSAGES)
+    return (error.pgcode in TRANSIENT_SQLSTATES
+            or error.pgcode[:2] in TRANSIENT_SQLSTATE_CLASSES)
+
+
+def _retry_delay(attempt):
+    """Exponential backoff with full jitter, so restarted workers do not reconnect in step."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class RetryingConnection:
+    """A connect_to_db() connection that survives transient failures.
+
+    run(operation, ...) calls operation(conn, ...), which must commit its
+    own work. On a transient error the transaction is rolled back, the
+    connection replaced if it was lost, and the whole operation run again
+    after a backoff. Operations must therefore be safe to replay, which
+    the importers' ON CONFLICT writes and brand lookups are.
+    """
+
+    def __init__(self, connect=connect_to_db, max_attempts=RETRY_MAX_ATTEMPTS):
+        self._connect = connect
+        self.max_attempts = max_attempts
+        self.conn = None
+
+    def run(self, operation, *args, **kwargs):
+        for attempt in range(self.max_attempts):
+            try:
+                if self.conn is None or self.conn.closed:
+                    self.conn = self._connect()
+                return operation(self.conn, *args, **kwargs)
+            except Exception as e:
+                self._discard_transaction()
+                if not is_transient_error(e) or attempt + 1 == self.max_attempts:
+                    raise
+                delay = _retry_delay(attempt)
+                print(f"Transient database error ({str(e).strip() or type(e).__name__}); "
+                      f"retrying in {delay:.1f}s.")
+                time.sleep(delay)
+
+    def _discard_transaction(self):
+        if self.conn is None or self.conn.closed:
+            return
+        try:
+            self.conn.rollback()
+        except Exception:
+            self.conn.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+_COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+_COPY_ESCAPE_RE = re.compile(r'\\(?:([0-7]{1,3})|x([0-9a-fA-F]{1,2})|(.))')
+
+
+def _unescape_copy_match(match):
+    octal, hexadecimal, char = match.groups()
+    if octal:
+        return chr(int(octal, 8))
+    if hexadecimal:
+        return chr(int(hexadecimal, 16))
+    return _COPY_ESCAPES.get(char, char)
+
+
+def copy_rows(conn, query):
+    """Run COPY (query) TO STDOUT on conn and yield each row as a list of str/None.
+
+    Uses COPY's text format, which keeps NULL (\\N) distinct from the empty
+    string. The whole result is buffered client side before parsing.
+    """
+    buf = io.StringIO()
+    with conn.cursor() as cur:
+        cur.copy_expert(f"COPY ({query}) TO STDOUT", buf)
+
+    # Rows end in a bare newline; newlines inside values are escaped.
+    for line in buf.getvalue().split('\n')[:-1]:
+        yield [None if field == '\\N'
+               else _COPY_ESCAPE_RE.sub(_unescape_copy_match, field) if '\\' in field
+               else field
+               for field in line.split('\t')]
+
+
+def _create_schema(cur, partitions=None, spec_index='btree'):
+    """Create or upgrade the Brand, BrandAlias and Watch tables; the caller commits.
+
+    With partitions=N a new Watch table is hash-partitioned on BrandID into
+    N partitions (see PARTITIONED_WATCH_TABLE_SQL). An existing Watch table
+    keeps its layout. spec_index ('btree' or 'brin') picks the index on
+    the typed CaseDiameterMM/WaterResistanceM columns.
+    """
+    if spec_index not in SPEC_INDEX_SQL:
+        raise ValueError(f"spec_index must be one of {tuple(SPEC_INDEX_SQL)}, not {spec_index!r}")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS Brand (
+            BrandID SERIAL PRIMARY KEY,
+            BrandName VARCHAR(100) NOT NULL UNIQUE,
+            BrandKey VARCHAR(100),
+            FoundingYear INTEGER,
+            CountryOfOrigin VARCHAR(50)
+        )
+    """)
+    # Databases created before brand keys existed.
+    cur.execute("ALTER TABLE Brand ADD COLUMN IF NOT EXISTS BrandKey VARCHAR(100)")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS BrandAlias (
+            AliasKey VARCHAR(100) PRIMARY KEY,
+            BrandID INTEGER NOT NULL REFERENCES Brand(BrandID),
+            Alias VARCHAR(100) NOT NULL
+        )
+    """)
+
+    cur.execute("SELECT to_regclass('watch') IS NOT NULL")
+    watch_exists = cur.fetchone()[0]
+    if partitions and not watch_exists:
+        cur.execute(PARTITIONED_WATCH_TABLE_SQL)
+        for remainder in range(partitions):
+            cur.execute(f"""
+                CREATE TABLE Watch_p{remainder} PARTITION OF Watch
+                FOR VALUES WITH (MODULUS {int(partitions)}, REMAINDER {remainder})
+            """)
+    elif partitions and not _is_watch_partitioned(cur):
+        print("Watch already exists without partitions; leaving its layout unchanged.")
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS Watch (
+                WatchID SERIAL PRIMARY KEY,
+                BrandID INTEGER REFERENCES Brand(BrandID),
+                ModelName VARCHAR(100) NOT NULL,
+                DialColor VARCHAR(50),
+                MovementType VARCHAR(50),
+                MovementCaliber VARCHAR(50),
+                CaseMaterial VARCHAR(50),
+                CaseDiameter VARCHAR(10),
+                WaterResistance VARCHAR(20),
+                UNIQUE (ModelName)
+            )
+        """)
+
+    # Typed copies of the free-text specs, kept in step by Postgres itself.
+    # Adding them rewrites an existing Watch table once.
+    cur.execute(f"""
+        ALTER TABLE Watch
+        ADD COLUMN IF NOT EXISTS CaseDiameterMM NUMERIC
+            GENERATED ALWAYS AS ({CASE_DIAMETER_MM_EXPR}) STORED,
+        ADD COLUMN IF NOT EXISTS WaterResistanceM INTEGER
+            GENERATED ALWAYS AS ({WATER_RESISTANCE_M_EXPR}) STORED
+    """)
+    cur.execute(SPEC_INDEX_SQL[spec_index])
+
+    cur.execute(TOUCH_FUNCTION_SQL)
+    for table, key in CHANGE_TRACKED_TABLES:
+        cur.execute(f"""
+            ALTER TABLE {table}
+            ADD COLUMN IF NOT EXISTS UpdatedAt TIMESTAMPTZ NOT NULL DEFAULT now(),
+            ADD COLUMN IF NOT EXISTS Version BIGINT NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS CreatedVersion BIGINT NOT NULL DEFAULT 0
+        """)
+        # The default only fills existing rows; new ones get NULL, which
+        # catalog_touch() replaces.
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN CreatedVersion DROP DEFAULT")
+        cur.execute(f"DROP TRIGGER IF EXISTS {table}_touch ON {table}")
+        cur.execute(f"""
+            CREATE TRIGGER {table}_touch BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION catalog_touch()
+        """)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_version_idx ON {table} (Version, {key})")
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_created_version_idx ON {table} (CreatedVersion)")
+
+    if _is_watch_partitioned(cur):
+        _create_watch_model_names(cur)
+    _watch_partitioned.clear()
+
+    from sketches import CREATE_SKETCH_TABLE_SQL
+
+    cur.execute(CREATE_SKETCH_TABLE_SQL)
+
+    _backfill_brand_keys(cur)
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS brand_brandkey_key ON Brand (BrandKey)")
+
+
+# Change tracking for the feed in changes.py. Every insert or update
+# stamps the row with the time and with the ID of the writing transaction
+# as its Version, whichever statement did the write. CreatedVersion keeps
+# the Version of the insert, for the catalog sketches (sketches.py); a
+# row moved to another partition is re-inserted there but keeps it. Rows
+# that predate tracking have Version and CreatedVersion 0.
+CHANGE_TRACKED_TABLES = (('Brand', 'BrandID'), ('Watch', 'WatchID'))
+
+TOUCH_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION catalog_touch() RETURNS trigger AS $$
+    BEGIN
+        NEW.UpdatedAt := now();
+        NEW.Version := pg_current_xact_id()::text::bigint;
+        IF TG_OP = 'UPDATE' THEN
+            NEW.CreatedVersion := OLD.CreatedVersion;
+        ELSE
+            NEW.CreatedVersion := coalesce(NEW.CreatedVersion, NEW.Version);
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+# Partitioned layout of Watch for very large catalogs. Postgres requires
+# the partition key in every unique constraint, so the table itself only
+# keeps ModelName unique per brand; WatchModelName below keeps it unique
+# across brands. watch_sql() adapts conflict targets. BrandID is
+# mandatory, and a brand filter prunes to one partition.
+PARTITIONED_WATCH_TABLE_SQL = """
+    CREATE TABLE Watch (
+        WatchID SERIAL,
+        BrandID INTEGER NOT NULL REFERENCES Brand(BrandID),
+        ModelName VARCHAR(100) NOT NULL,
+        DialColor VARCHAR(50),
+        MovementType VARCHAR(50),
+        MovementCaliber VARCHAR(50),
+        CaseMaterial VARCHAR(50),
+        CaseDiameter VARCHAR(10),
+        WaterResistance VARCHAR(20),
+        PRIMARY KEY (BrandID, WatchID),
+        UNIQUE (BrandID, ModelName)
+    ) PARTITION BY HASH (BrandID)
+"""
+
+# One row per ModelName of a partitioned Watch, kept by the trigger below.
+# An insert of a ModelName stored under another brand is skipped, as ON
+# CONFLICT (ModelName) DO NOTHING would skip it on the plain layout (a
+# BEFORE trigger cannot send the row to the stored brand's partition
+# instead). A rename onto a stored ModelName fails on the primary key.
+# Upserts that give a model another brand move the stored row first; see
+# MOVE_WATCH_BRANDS_SQL.
+WATCH_MODEL_NAME_TABLE_SQL = """
+    CREATE TABLE WatchModelName (
+        ModelName VARCHAR(100) PRIMARY KEY,
+        BrandID INTEGER NOT NULL
+    )
+"""
+
+# Watches that share a ModelName from before the table existed keep their
+# rows; the oldest one claims the name.
+BACKFILL_WATCH_MODEL_NAME_SQL = """
+    INSERT INTO WatchModelName (ModelName, BrandID)
+    SELECT DISTINCT ON (ModelName) ModelName, BrandID
+    FROM Watch
+    ORDER BY ModelName, WatchID
+"""
+
+WATCH_MODEL_NAME_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION watch_model_name_claim() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM WatchModelName
+            WHERE ModelName = OLD.ModelName AND BrandID = OLD.BrandID;
+            RETURN OLD;
+        END IF;
+        IF TG_OP = 'UPDATE' THEN
+            IF (NEW.ModelName, NEW.BrandID) IS DISTINCT FROM (OLD.ModelName, OLD.BrandID) THEN
+                UPDATE WatchModelName SET ModelName = NEW.ModelName, BrandID = NEW.BrandID
+                WHERE ModelName = OLD.ModelName AND BrandID = OLD.BrandID;
+            END IF;
+            RETURN NEW;
+        END IF;
+        INSERT INTO WatchModelName (ModelName, BrandID) VALUES (NEW.ModelName, NEW.BrandID)
+        ON CONFLICT (ModelName) DO NOTHING;
+        IF NOT FOUND AND NOT EXISTS (SELECT 1 FROM WatchModelName
+                                     WHERE ModelName = NEW.ModelName AND BrandID = NEW.BrandID) THEN
+            RETURN NULL;
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+# Moves stored watches to the brand an upsert gives them, with the rest of
+# the upserted values. Only needed on a partitioned Watch. Rows as in
+# UPSERT_WATCHES_SQL; returns the moved ModelNames, which the upsert that
+# follows leaves out so that each row is written and counted once.
+MOVE_WATCH_BRANDS_SQL = """
+    UPDATE Watch w
+    SET BrandID = v.BrandID, DialColor = v.DialColor, MovementType = v.MovementType,
+        MovementCaliber = v.MovementCaliber, CaseMaterial = v.CaseMaterial,
+        CaseDiameter = v.CaseDiameter, WaterResistance = v.WaterResistance
+    FROM (VALUES %s) v (BrandID, ModelName, DialColor, MovementType, MovementCaliber,
+                        CaseMaterial, CaseDiameter, WaterResistance),
+         WatchModelName m
+    WHERE m.ModelName = v.ModelName AND m.BrandID <> v.BrandID
+      AND w.BrandID = m.BrandID AND w.ModelName = m.ModelName
+    RETURNING w.ModelName
+"""
+
+IS_WATCH_PARTITIONED_SQL = """
+    SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('watch'))
+"""
+
+WATCH_CONFLICT_TARGET = "ON CONFLICT (ModelName)"
+PARTITIONED_WATCH_CONFLICT_TARGET = "ON CONFLICT (BrandID, ModelName)"
+
+
+def _is_watch_partitioned(cur):
+    cur.execute(IS_WATCH_PARTITIONED_SQL)
+    return cur.fetchone()[0]
+
+
+# Whether Watch is partitioned, by connection DSN. The layout is fixed once
+# Watch exists, so each database is asked once; _create_schema() forgets
+# the answers.
+_watch_partitioned = {}
+
+
+def _create_watch_model_names(cur):
+    cur.execute("SELECT to_regclass('watchmodelname') IS NULL")
+    if cur.fetchone()[0]:
+        cur.execute(WATCH_MODEL_NAME_TABLE_SQL)
+        cur.execute(BACKFILL_WATCH_MODEL_NAME_SQL)
+    cur.execute(WATCH_MODEL_NAME_FUNCTION_SQL)
+    cur.execute("DROP TRIGGER IF EXISTS Watch_model_name ON Watch")
+    cur.execute("""
+        CREATE TRIGGER Watch_model_name
+        BEFORE INSERT OR UPDATE OF BrandID, ModelName OR DELETE ON Watch
+        FOR EACH ROW EXECUTE FUNCTION watch_model_name_claim()
+    """)
+
+
+def _watch_partitioned_on(conn):
+    """Whether Watch on conn is hash-partitioned; looked up once per database."""
+    partitioned = _watch_partitioned.get(conn.dsn)
+    if partitioned is None:
+        with conn.cursor() as cur:
+            partitioned = _watch_partitioned[conn.dsn] = _is_watch_partitioned(cur)
+    return partitioned
+
+
+def watch_sql(conn, sql):
+    """sql with its Watch conflict target adapted to the table layout on conn."""
+    if _watch_partitioned_on(conn):
+        return sql.replace(WATCH_CONFLICT_TARGET, PARTITIONED_WATCH_CONFLICT_TARGET)
+    return sql
+
+
+def create_tables(partitions=None, spec_index='btree'):
+    """Create or upgrade the tables; returns False if that failed."""
     conn = connect_to_db()
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS Brand (
-                    BrandID SERIAL PRIMARY KEY,
-                    BrandName VARCHAR(100) NOT NULL UNIQUE,
-                    FoundingYear INTEGER,
-                    CountryOfOrigin VARCHAR(50)
-                )
-            """)
-
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS Watch (
-                    WatchID SERIAL PRIMARY KEY,
-                    BrandID INTEGER REFERENCES Brand(BrandID),
-                    ModelName VARCHAR(100) NOT NULL,
-                    DialColor VARCHAR(50),
-                    MovementType VARCHAR(50),
-                    MovementCaliber VARCHAR(50),
-                    CaseMaterial VARCHAR(50),
-                    CaseDiameter VARCHAR(10),
-                    WaterResistance VARCHAR(20)
-                    UNIQUE (ModelName)
-                )
-            """)
+            _create_schema(cur, partitions, spec_index)
         conn.commit()
         print("Tables created successfully.")
+        return True
     except Exception as e:
         print(f"An error occurred: {e}")
+        return False
     finally:
         conn.close()
 
 
-def add_brand(brand_name, founding_year=None, country_of_origin=None):
+# Partitions of a partitioned Watch with their estimated rows and on-disk
+# size including indexes.
+WATCH_PARTITIONS_SQL = """
+    SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass('watch')
+    ORDER BY c.relname
+"""
+
+
+def get_watch_partitions():
+    """[(partition name, estimated rows, total bytes)]; empty if Watch is not partitioned."""
+    conn = connect_to_db(readonly=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(WATCH_PARTITIONS_SQL)
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def maintain_watch_partitions(vacuum=True, reindex=False):
+    """VACUUM (ANALYZE) and/or REINDEX each Watch partition in turn.
+
+    Working one partition at a time keeps each pass short and its locks
+    local, instead of one long pass over the whole table. REINDEX runs
+    CONCURRENTLY, so imports can keep writing. Returns False on errors.
+    """
+    from psycopg2 import sql  # type: ignore
+
     conn = connect_to_db()
     try:
+        # VACUUM and REINDEX CONCURRENTLY cannot run inside a transaction.
+        conn.autocommit = True
         with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO Brand (BrandName, FoundingYear, CountryOfOrigin)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (BrandName) DO NOTHING
-                RETURNING BrandID
-            """, (brand_name, founding_year, country_of_origin))
-            brand_id = cur.fetchone()
-            if brand.id:
-                print(f"Brand {brand_name} added successfully with ID {
-                      brand_id[0]}")
-                return brand_id[0]
-            else:
-                cur.execute(
-                    "SELECT BrandID FROM Brand WHERE BrandName = %s", (brand_name, ))
-                brand_id = cur.fetchone()[0]
+            cur.execute(WATCH_PARTITIONS_SQL)
+            partitions = [name for name, _, _ in cur.fetchall()]
+            if not partitions:
+                print("Watch is not partitioned.")
+                return True
+            for name in partitions:
+                start = time.perf_counter()
+                if vacuum:
+                    cur.execute(sql.SQL("VACUUM (ANALYZE) {}").format(sql.Identifier(name)))
+                if reindex:
+                    cur.execute(sql.SQL("REINDEX TABLE CONCURRENTLY {}").format(sql.Identifier(name)))
+                print(f"{name}: done in {time.perf_counter() - start:.1f}s.")
+        return True
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def print_watch_partitions():
+    partitions = get_watch_partitions()
+    if not partitions:
+        print("Watch is not partitioned.")
+        return
+    for name, rows, size in partitions:
+        print(f"{name}: ~{max(rows, 0)} rows, {size / 2 ** 20:.1f} MiB")
+    print(f"Total Partitions: {len(partitions)}")
+
+
+class _Record:
+    """Base for the row types below.
+
+    Fields live in __slots__, so a record costs a fixed handful of pointers
+    instead of a per-instance dict. Records iterate in column order, which
+    keeps tuple unpacking of query rows working.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+        for name in self.__slots__[len(values):]:
+            setattr(self, name, None)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Brand(_Record):
+    __slots__ = ('brand_id', 'brand_name', 'founding_year', 'country_of_origin')
+
+
+class Watch(_Record):
+    __slots__ = ('watch_id', 'brand_id', 'model_name', 'dial_color', 'movement_type',
+                 'movement_caliber', 'case_material', 'case_diameter', 'water_resistance')
+
+    def insert_values(self):
+        """Parameters for INSERT_WATCH_SQL / INSERT_WATCHES_SQL."""
+        return (self.brand_id, self.model_name, self.dial_color, self.movement_type,
+                self.movement_caliber, self.case_material, self.case_diameter,
+                self.water_resistance)
+
+
+# SQL shared by the blocking functions below and the asyncio layer in
+# watches_async.py (psycopg 3 uses the same %s placeholders).
+INSERT_BRAND_SQL = """
+    INSERT INTO Brand (BrandName, BrandKey, FoundingYear, CountryOfOrigin)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT DO NOTHING
+    RETURNING BrandID
+"""
+
+SELECT_BRAND_ID_SQL = "SELECT BrandID FROM Brand WHERE BrandName = %s"
+
+# Takes the brand key twice: a brand's own key, else one of its aliases.
+SELECT_BRAND_BY_KEY_SQL = """
+    SELECT BrandID FROM Brand WHERE BrandKey = %s
+    UNION ALL
+    SELECT BrandID FROM BrandAlias WHERE AliasKey = %s
+    LIMIT 1
+"""
+
+# Aliases first, so a brand's own key wins if an alias collides with it.
+SELECT_BRAND_KEYS_SQL = """
+    SELECT AliasKey, BrandID FROM BrandAlias
+    UNION ALL
+    SELECT BrandKey, BrandID FROM Brand WHERE BrandKey IS NOT NULL
+"""
+
+INSERT_BRAND_ALIAS_SQL = """
+    INSERT INTO BrandAlias (AliasKey, BrandID, Alias)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (AliasKey) DO NOTHING
+"""
+
+# Transaction-scoped advisory lock serialising creation of one brand name
+# across concurrent importers; released by the commit that follows.
+BRAND_LOCK_SQL = "SELECT pg_advisory_xact_lock(%s, %s)"
+
+# First key of the two-key advisory lock form, reserving a namespace for
+# brand-name locks.
+BRAND_LOCK_NAMESPACE = 0x4252  # "BR"
+
+INSERT_WATCH_SQL = """
+    INSERT INTO Watch (BrandID, ModelName, DialColor, MovementType, MovementCaliber, CaseMaterial, CaseDiameter, WaterResistance)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (ModelName) DO NOTHING
+"""
+
+# Multi-row form of INSERT_WATCH_SQL for psycopg2.extras.execute_values.
+INSERT_WATCHES_SQL = """
+    INSERT INTO Watch (BrandID, ModelName, DialColor, MovementType, MovementCaliber, CaseMaterial, CaseDiameter, WaterResistance)
+    VALUES %s
+    ON CONFLICT (ModelName) DO NOTHING
+"""
+
+# Rows whose values are unchanged are left alone, so re-importing a file
+# neither rewrites them nor moves their Version in the change feed.
+WATCH_UPSERT_ACTION = """
+    DO UPDATE SET BrandID = EXCLUDED.BrandID, DialColor = EXCLUDED.DialColor,
+                  MovementType = EXCLUDED.MovementType, MovementCaliber = EXCLUDED.MovementCaliber,
+                  CaseMaterial = EXCLUDED.CaseMaterial, CaseDiameter = EXCLUDED.CaseDiameter,
+                  WaterResistance = EXCLUDED.WaterResistance
+    WHERE (Watch.BrandID, Watch.DialColor, Watch.MovementType, Watch.MovementCaliber,
+           Watch.CaseMaterial, Watch.CaseDiameter, Watch.WaterResistance)
+          IS DISTINCT FROM
+          (EXCLUDED.BrandID, EXCLUDED.DialColor, EXCLUDED.MovementType, EXCLUDED.MovementCaliber,
+           EXCLUDED.CaseMaterial, EXCLUDED.CaseDiameter, EXCLUDED.WaterResistance)
+"""
+
+# CaseDiameter text as the row-by-row import stores it, str() of a Python
+# float ('40.0', '42.5'), for writers that compute the number in SQL. The
+# same value must give the same text, or a re-import through another path
+# rewrites the row.
+CASE_DIAMETER_TEXT_SQL = r"regexp_replace(({})::float8::text, '^([0-9]+)$', '\1.0')"
+
+# INSERT_WATCHES_SQL for the last-wins import policy: a later row replaces
+# the stored one.
+UPSERT_WATCHES_SQL = INSERT_WATCHES_SQL.replace("DO NOTHING", WATCH_UPSERT_ACTION)
+
+SELECT_ALL_BRANDS_SQL = """
+    SELECT BrandID, BrandName, FoundingYear, CountryOfOrigin
+    FROM Brand
+    ORDER BY BrandName
+"""
+
+BRAND_COUNT_SQL = "SELECT COUNT(*) FROM Brand"
+
+WATCH_COUNT_SQL = "SELECT COUNT(*) FROM Watch"
+
+TOP_BRANDS_SQL = """
+    SELECT b.BrandName, COUNT(w.WatchID) as WatchCount
+    FROM Brand b
+    JOIN Watch w ON b.BrandID = w.BrandID
+    GROUP BY b.BrandName
+    ORDER BY WatchCount DESC
+    LIMIT 5
+"""
+
+AVG_CASE_DIAMETER_SQL = "SELECT AVG(CaseDiameterMM) FROM Watch"
+
+# CaseDiameter and WaterResistance are free text ("40mm", "300m"); these
+# expressions generate the typed CaseDiameterMM and WaterResistanceM
+# columns from them. Only well-formed values ("40mm", "42.5", "300 m")
+# convert, anything else ("40-42mm") becomes NULL instead of failing the
+# write. Queries read the typed columns, never the text.
+CASE_DIAMETER_MM_EXPR = r"""
+    CASE WHEN CaseDiameter ~* '^\s*[0-9]+(\.[0-9]+)?\s*(mm)?\s*$'
+         THEN substring(CaseDiameter from '[0-9]+(?:\.[0-9]+)?')::numeric END
+"""
+WATER_RESISTANCE_M_EXPR = r"""
+    CASE WHEN WaterResistance ~* '^\s*[0-9]+(\.[0-9]+)?\s*m?\s*$'
+         THEN round(substring(WaterResistance from '[0-9]+(?:\.[0-9]+)?')::numeric)::integer END
+"""
+
+_SPEC_NUMBER_RE = re.compile(r'\s*([0-9]+(?:\.[0-9]+)?)\s*(?:mm|m)?\s*', re.IGNORECASE)
+
+
+def spec_number(value):
+    """float for 40, '40mm' or '300 m', read as the typed columns read them.
+
+    None for blanks, 'n/a' and malformed text such as '40-42mm'.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        return float(value)
+    match = _SPEC_NUMBER_RE.fullmatch(value)
+    return float(match.group(1)) if match else None
+
+
+# Index for range filters on the typed specs: a composite B-tree by
+# default, or a much smaller BRIN index for append-mostly tables whose
+# physical order roughly follows the specs.
+SPEC_INDEX_SQL = {
+    'btree': "CREATE INDEX IF NOT EXISTS watch_specs_idx ON Watch (CaseDiameterMM, WaterResistanceM)",
+    'brin': "CREATE INDEX IF NOT EXISTS watch_specs_brin ON Watch USING brin (CaseDiameterMM, WaterResistanceM)",
+}
+
+FIND_WATCHES_SQL = """
+    SELECT WatchID, BrandID, ModelName, DialColor, MovementType, MovementCaliber,
+           CaseMaterial, CaseDiameterMM, WaterResistanceM
+    FROM Watch
+    WHERE {conditions}
+    ORDER BY CaseDiameterMM, WaterResistanceM, WatchID
+"""
+
+MOVEMENT_TYPES_SQL = """
+    SELECT MovementType, COUNT(*) as Count
+    FROM Watch
+    GROUP BY MovementType
+    ORDER BY Count DESC
+"""
+
+
+def brand_key(brand_name):
+    """Normalised lookup key for a brand name.
+
+    Accents, case, punctuation and whitespace are folded away, so
+    'A.Lange & Söhne' and ' A. Lange & Sohne' both give 'alangesohne'.
+    """
+    decomposed = unicodedata.normalize('NFKD', brand_name).casefold()
+    return ''.join(char for char in decomposed if char.isalnum())
+
+
+def brand_lock_key(key):
+    """Advisory lock key pair for a brand key (namespace, signed 32-bit hash)."""
+    digest = zlib.crc32(key.encode('utf-8'))
+    return BRAND_LOCK_NAMESPACE, digest - (1 << 32) if digest >= 1 << 31 else digest
+
+
+def _get_or_create_brand(cur, brand_name, founding_year=None, country_of_origin=None):
+    """Return (brand_id, created) for brand_name, inserting it if missing.
+
+    Brands are matched on brand_key(), against both Brand and BrandAlias,
+    so spelling variants never create a second brand. Existing brands are
+    found without locking. Otherwise the key's advisory lock is taken and
+    the lookup repeated, so two importers racing on a new brand never both
+    attempt the insert. The caller's commit releases the lock.
+    """
+    brand_name = ' '.join(brand_name.split())
+    key = brand_key(brand_name)
+    if not key:
+        raise ValueError(f"brand name {brand_name!r} has no letters or digits")
+
+    cur.execute(SELECT_BRAND_BY_KEY_SQL, (key, key))
+    row = cur.fetchone()
+    if row:
+        return row[0], False
+
+    cur.execute(BRAND_LOCK_SQL, brand_lock_key(key))
+    cur.execute(SELECT_BRAND_BY_KEY_SQL, (key, key))
+    row = cur.fetchone()
+    if row:
+        return row[0], False
+
+    cur.execute(INSERT_BRAND_SQL, (brand_name, key, founding_year, country_of_origin))
+    row = cur.fetchone()
+    if row is None:
+        # Inserted by a writer that does not take the lock, maybe without a key.
+        cur.execute(SELECT_BRAND_BY_KEY_SQL, (key, key))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute(SELECT_BRAND_ID_SQL, (brand_name,))
+            row = cur.fetchone()
+        return row[0], False
+    return row[0], True
+
+
+def _backfill_brand_keys(cur):
+    """Fill in BrandKey for older rows, merging brands whose keys collide.
+
+    A near-duplicate brand (e.g. ' Rolex' next to 'Rolex') has its watches
+    moved to the earliest brand with the same key and is then deleted.
+    """
+    cur.execute("SELECT BrandKey, BrandID FROM Brand WHERE BrandKey IS NOT NULL")
+    keepers = dict(cur.fetchall())
+    cur.execute("SELECT BrandID, BrandName FROM Brand WHERE BrandKey IS NULL ORDER BY BrandID")
+    for brand_id, brand_name in cur.fetchall():
+        key = brand_key(brand_name)
+        keeper = keepers.get(key)
+        if keeper is None:
+            cur.execute("UPDATE Brand SET BrandKey = %s WHERE BrandID = %s", (key, brand_id))
+            keepers[key] = brand_id
+        else:
+            cur.execute("UPDATE Watch SET BrandID = %s WHERE BrandID = %s", (keeper, brand_id))
+            cur.execute("UPDATE BrandAlias SET BrandID = %s WHERE BrandID = %s", (keeper, brand_id))
+            cur.execute("DELETE FROM Brand WHERE BrandID = %s", (brand_id,))
+            print(f"Merged duplicate brand '{brand_name}' into brand ID {keeper}.")
+
+
+# Spellings used by supplier feeds for brands whose catalogue name differs
+# by more than punctuation or accents. Seeded by import_brands_from_csv().
+DEFAULT_BRAND_ALIASES = {
+    'Nomos': 'NOMOS Glashütte',
+    'Lange & Söhne': 'A.Lange & Söhne',
+    'H. Moser & Cie': 'H.Moser',
+}
+
+
+class BrandResolver:
+    """In-memory brand lookup keyed by brand_key(), covering names and aliases.
+
+    Loaded once per import, after which each lookup is one dict probe.
+    Brands created through get_or_create() are added as they appear.
+    """
+
+    # Longest brand name, in words, tried when matching a model name prefix.
+    MAX_BRAND_WORDS = 4
+
+    def __init__(self, keys=()):
+        self._ids = dict(keys)
+
+    @classmethod
+    def load(cls, cur):
+        cur.execute(SELECT_BRAND_KEYS_SQL)
+        return cls(cur.fetchall())
+
+    @classmethod
+    def from_brands(cls, brands, aliases=DEFAULT_BRAND_ALIASES):
+        """Resolver over (brand_id, brand_name) pairs, without a database.
+
+        aliases maps extra spellings to brand names, as seeded by
+        import_brands_from_csv().
+        """
+        resolver = cls()
+        for brand_id, brand_name in brands:
+            resolver._ids.setdefault(brand_key(brand_name), brand_id)
+        for alias, brand_name in aliases.items():
+            brand_id = resolver.resolve(brand_name)
+            if brand_id is not None:
+                resolver._ids.setdefault(brand_key(alias), brand_id)
+        return resolver
+
+    def resolve(self, brand_name):
+        """BrandID for a brand name or alias, or None."""
+        return self._ids.get(brand_key(brand_name))
+
+    def resolve_model(self, model_name):
+        """BrandID of the longest known brand the model name starts with, or None."""
+        words = model_name.split()
+        for count in range(min(len(words), self.MAX_BRAND_WORDS), 0, -1):
+            brand_id = self._ids.get(brand_key(' '.join(words[:count])))
+            if brand_id is not None:
+                return brand_id
+        return None
+
+    def get_or_create(self, conn, brand_name, founding_year=None, country_of_origin=None):
+        """Return (brand_id, created).
+
+        A new brand is committed before its ID is cached, so a failed
+        commit leaves the resolver as it was and the call can be replayed.
+        """
+        brand_id = self.resolve(brand_name)
+        if brand_id is not None:
+            return brand_id, False
+        with conn.cursor() as cur:
+            brand_id, created = _get_or_create_brand(
+                cur, brand_name, founding_year, country_of_origin)
         conn.commit()
+        self.remember(brand_name, brand_id)
+        return brand_id, created
+
+    def remember(self, brand_name, brand_id):
+        self._ids[brand_key(brand_name)] = brand_id
+
+    def add_alias(self, conn, alias, brand_id):
+        """Store alias for brand_id and commit, like get_or_create()."""
+        key = brand_key(alias)
+        with conn.cursor() as cur:
+            cur.execute(INSERT_BRAND_ALIAS_SQL, (key, brand_id, alias))
+        conn.commit()
+        self._ids.setdefault(key, brand_id)
+
+
+def _load_resolver(conn):
+    with conn.cursor() as cur:
+        resolver = BrandResolver.load(cur)
+    conn.commit()
+    return resolver
+
+
+def _seed_brand_aliases(conn, resolver):
+    for alias, brand_name in DEFAULT_BRAND_ALIASES.items():
+        brand_id = resolver.resolve(brand_name)
+        if brand_id is not None and resolver.resolve(alias) is None:
+            resolver.add_alias(conn, alias, brand_id)
+
 
-        if brand_id:
-            print(f"Brand '{brand_name}' added successfully with ID {
-                  brand_id[0]}.")
-            return brand_id[0]
+def add_brand_alias(alias, brand_name):
+    """Record alias as another spelling of an existing brand.
 
+    Returns the brand's BrandID, or None if the brand is unknown or the
+    insert failed.
+    """
+    conn = connect_to_db()
+    try:
+        resolver = _load_resolver(conn)
+        brand_id = resolver.resolve(brand_name)
+        if brand_id is None:
+            print(f"Error: Brand '{brand_name}' not found.")
+            return
+        resolver.add_alias(conn, alias, brand_id)
+        print(f"Alias '{alias}' added for brand '{brand_name}'.")
+        return brand_id
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        conn.close()
+
+
+def add_brand(brand_name, founding_year=None, country_of_origin=None):
+    conn = connect_to_db()
+    try:
+        with conn.cursor() as cur:
+            brand_id, created = _get_or_create_brand(
+                cur, brand_name, founding_year, country_of_origin)
+        conn.commit()
+        if created:
+            print(f"Brand '{brand_name}' added successfully with ID {brand_id}.")
         else:
-            cur.execute(
-                "SELECT BrandID FROM Brand WHERE BrandName = %s", (brand_name,))
-            brand_id = cur.fetchone()[0]
             print(f"Brand '{brand_name}' already exists with ID {brand_id}.")
-            return brand_id
+        return brand_id
     except Exception as e:
         print(f"An error occurred:\n{e}")
     finally:
@@ -96,7 +1151,7 @@ def extract_brand_from_model(model_name):
     """Extract the brand name from the model name."""
     # Match common brand names at the beginning of the model name
     brand_patterns = [
-        r'^(Rolex|Omega|Tag Heuer|Audemars Piguet|Patek Philippe|Seiko|IWC|Panerai|Casio|Hublot|Cartier|Tudor|Breitling|Grand Seiko|Bell & Ross|Zenith|Bulova|Longines|Jaeger-LeCoultre|Maurice Lacroix|Mido|Chopard|Montblanc|Girard-Perregaux|Glashütte Original|Ulysse Nardin|Vacheron Constantin|Blancpain|A. Lange & Söhne|Bremont|Zenith|Rado|Bulgari|Nomos|Tissot)$'
+        r'^(Rolex|Omega|Tag Heuer|Audemars Piguet|Patek Philippe|Seiko|IWC|Panerai|Casio|Hublot|Cartier|Tudor|Breitling|Grand Seiko|Bell & Ross|Zenith|Bulova|Longines|Jaeger-LeCoultre|Maurice Lacroix|Mido|Chopard|Montblanc|Girard-Perregaux|Glashütte Original|Ulysse Nardin|Vacheron Constantin|Blancpain|A. Lange & Söhne|Bremont|Zenith|Rado|Bulgari|Nomos|Tissot)\b'
     ]
 
     for pattern in brand_patterns:
@@ -107,179 +1162,1390 @@ def extract_brand_from_model(model_name):
     return "Unknown"  # Default if no brand found
 
 
+# Callables run with the new Watch record after add_watch() commits one,
+# e.g. similarity.SimilarityIndex.add to keep an in-memory index current.
+watch_added_hooks = []
+
+
 def add_watch(brand_id, model_name, dial_color, movement_type, movement_caliber, case_material, case_diameter, water_resistance):
     conn = connect_to_db()
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                    INSERT INTO Watch (BrandID, ModelName, DialColor, MovementType, MovementCaliber, CaseMaterial, CaseDiameter, WaterResistance)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (ModelName) DO NOTHING
-                """, (brand_id, model_name, dial_color, movement_type, movement_caliber, case_material, case_diameter, water_resistance)
-            )
+            cur.execute(watch_sql(conn, INSERT_WATCH_SQL),
+                        (brand_id, model_name, dial_color, movement_type,
+                         movement_caliber, case_material, case_diameter, water_resistance))
+            inserted = cur.rowcount
         conn.commit()
         print(f"Watch '{model_name}' added successfully")
+        if inserted:
+            watch = Watch(None, brand_id, model_name, dial_color, movement_type, movement_caliber,
+                          case_material, case_diameter, water_resistance)
+            from sketches import count_added_watch, update_catalog_sketches
+
+            if count_added_watch():
+                update_catalog_sketches(conn)
+            for hook in watch_added_hooks:
+                hook(watch)
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
         conn.close()
 
 
-def explore_database():
-    conn = connect_to_db()
+def get_catalog_stats(approximate=False):
+    """Return the figures shown by explore_database() as a dict.
+
+    approximate=True reads the stored sketches instead (see sketches.py):
+    about 1% off, in time proportional to the rows created since they were
+    last updated, and falls back to the exact queries when no sketches are
+    stored yet.
+    """
+    if approximate:
+        from sketches import get_approximate_stats
+
+        stats = get_approximate_stats()
+        if stats is not None:
+            return stats
+        print("No catalog sketches stored yet; computing exact statistics.")
+    conn = connect_to_db(readonly=True)
     try:
         with conn.cursor() as cur:
-            # Count of watch brands
-            cur.execute("SELECT COUNT(*) FROM Brand")
-            brand_count = cur.fetchone()[0]
-            print(f"Total number of brands:  {brand_count}")
-
-            # Count of watch brands
-            cur.execute("SELECT COUNT(*) FROM Watch")
-            watch_count = cur.fetchone()[0]
-            print(f"Total number of watches:  {watch_count}")
-
-            # Brands with the most watches
-            cur.execute(
-                """
-                    SELECT b.BrandName, COUNT(w.WatchID) as WatchCount
-                    FROM Brand b
-                    JOIN Watch w ON b.BrandID = w.BrandID
-                    GROUP BY b.BrandName
-                    ORDER BY WatchCount DESC
-                    LIMIT 5
-                """
-            )
-            print(f"\nTop 5 brands by number of watches:")
-            for row in cur.fetchall():
-                print(f"{row[0]}: {row[1]} watches")
-
-            # Average case diameter
-            cur.execute("SELECT AVG(CaseDiameter) FROM Watch")
-            avg_diameter = cur.fetchall()[0]
-            print(f"\nAverage case diameter: {avg_diameter:.2f}")
-
-            # Distribution of movement types
-            cur.execute("""
-                SELECT MovementType, COUNT(*) as Count
-                FROM Watch
-                GROUP BY MovementType
-                ORDER BY Count DESC
-            """)
-            print("\nDistribution of movement types:")
-            for row in cur.fetchall():
-                print(f"{row[0]}: {row[1]} watches")
+            return _catalog_stats(cur)
+    finally:
+        conn.close()
+
+
+def _catalog_stats(cur, avg_case_diameter_sql=AVG_CASE_DIAMETER_SQL):
+    cur.execute(BRAND_COUNT_SQL)
+    brand_count = cur.fetchone()[0]
+    cur.execute(WATCH_COUNT_SQL)
+    watch_count = cur.fetchone()[0]
+    cur.execute(TOP_BRANDS_SQL)
+    top_brands = cur.fetchall()
+    cur.execute(avg_case_diameter_sql)
+    avg_diameter = cur.fetchone()[0]
+    cur.execute(MOVEMENT_TYPES_SQL)
+    movement_types = cur.fetchall()
+
+    return {
+        "brand_count": brand_count,
+        "watch_count": watch_count,
+        "top_brands": top_brands,
+        "avg_case_diameter": float(avg_diameter) if avg_diameter is not None else None,
+        "movement_types": movement_types,
+    }
+
 
+def print_catalog_stats(stats):
+    print(f"Total number of brands:  {stats['brand_count']}")
+    print(f"Total number of watches:  {stats['watch_count']}")
+
+    print(f"\nTop 5 brands by number of watches:")
+    for brand_name, watch_count in stats['top_brands']:
+        print(f"{brand_name}: {watch_count} watches")
+
+    if stats['avg_case_diameter'] is not None:
+        print(f"\nAverage case diameter: {stats['avg_case_diameter']:.2f}")
+
+    print("\nDistribution of movement types:")
+    for movement_type, count in stats['movement_types']:
+        print(f"{movement_type}: {count} watches")
+
+
+def explore_database(approximate=False):
+    """Print the catalog statistics; returns False if they could not be read."""
+    try:
+        stats = get_catalog_stats(approximate)
     except Exception as e:
         print(f"An error occured: {e}")
+        return False
+    print_catalog_stats(stats)
+    return True
+
+
+def get_all_brands():
+    conn = connect_to_db(readonly=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SELECT_ALL_BRANDS_SQL)
+            return [Brand(*row) for row in cur]
     finally:
         conn.close()
 
 
-def get_all_brands():
-    conn = connect_to_db()
+def find_watches(case_diameter=None, water_resistance=None, movement_type=None, limit=None,
+                 brand=None):
+    """Watches whose specs fall in the given ranges, as Watch records.
+
+    case_diameter (mm) and water_resistance (m) are (low, high) pairs,
+    inclusive, with None for an open end; e.g. divers over 200m between 38
+    and 41mm are find_watches((38, 41), (200, None)). The ranges are
+    answered from the typed columns and their spec index, on a read replica
+    where one is configured. Results are ordered by diameter.
+
+    brand (a name or alias) is resolved to its BrandID first, so on a
+    partitioned Watch the query only scans that brand's partition.
+    """
+    conditions, params = [], []
+    for column, bounds in (('CaseDiameterMM', case_diameter),
+                           ('WaterResistanceM', water_resistance)):
+        if bounds is None:
+            continue
+        low, high = bounds
+        if low is not None:
+            conditions.append(f"{column} >= %s")
+            params.append(low)
+        if high is not None:
+            conditions.append(f"{column} <= %s")
+            params.append(high)
+    if movement_type is not None:
+        conditions.append("MovementType = %s")
+        params.append(movement_type)
+
+    conn = connect_to_db(readonly=True)
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT * FROM Brand ORDER BY BrandName")
-            return cur.fetchall()
+            if brand is not None:
+                key = brand_key(brand)
+                cur.execute(SELECT_BRAND_BY_KEY_SQL, (key, key))
+                row = cur.fetchone()
+                if row is None:
+                    return []
+                # A literal BrandID lets the planner prune the other partitions.
+                conditions.insert(0, "BrandID = %s")
+                params.insert(0, row[0])
+            sql = FIND_WATCHES_SQL.format(conditions=" AND ".join(conditions) or "true")
+            if limit is not None:
+                sql += " LIMIT %s"
+                params.append(limit)
+            cur.execute(sql, params)
+            watches = [Watch(*row) for row in cur]
     finally:
         conn.close()
+    for watch in watches:
+        if watch.case_diameter is not None:
+            watch.case_diameter = float(watch.case_diameter)
+    return watches
 
 
-def print_all_brands():
-    brands = get_all_brands()
+def print_all_brands(brands=None):
+    if brands is None:
+        brands = get_all_brands()
     for brand in brands:
-        print(f"ID: {brand[0]}, Name: {brand[1]}, Founded: {
-              brand[2]}, Origin: {brand[3]}")
+        print(f"ID: {brand.brand_id}, Name: {brand.brand_name}, Founded: {
+              brand.founding_year}, Origin: {brand.country_of_origin}")
     print(f"Total Brands: {len(brands)}")
 
 
+WATCH_CSV_COLUMNS = ('ModelName', 'DialColor', 'MovementType', 'MovementCaliber',
+                     'CaseMaterial', 'CaseDiameter', 'WaterResistance')
+
+BRAND_CSV_COLUMNS = ('Brand', 'Founded', 'Country Of Origin')
+
+
+# Compressed inputs are recognised by their leading bytes, whatever the file
+# is called; the suffixes only decide what directory ingestion picks up.
+_COMPRESSION_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+
+INPUT_SUFFIXES = ('.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.csv.zst')
+
+
+def _open_zstd(filename):
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        raise RuntimeError(
+            f"{filename} is zstd-compressed; install the 'zstandard' package to read it") from None
+    return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)
+
+
+def open_input(filename):
+    """Open a CSV for reading as text, decompressing gzip/bz2/xz/zstd on the fly.
+
+    Nothing is written to disk; decompression happens as the reader pulls
+    data through the returned stream.
+    """
+    with open(filename, 'rb') as f:
+        head = f.read(6)
+
+    for magic, compression in _COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            break
+    else:
+        return open(filename, 'r', encoding='utf-8', newline='')
+
+    if compression == 'gzip':
+        raw = gzip.open(filename, 'rb')
+    elif compression == 'bz2':
+        raw = bz2.open(filename, 'rb')
+    elif compression == 'xz':
+        raw = lzma.open(filename, 'rb')
+    else:
+        raw = _open_zstd(filename)
+    return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+
+def _csv_columns(header, names):
+    """Positions of the named columns in a CSV header; KeyError if one is missing."""
+    header = [name.strip() for name in header]
+    positions = []
+    for name in names:
+        if name not in header:
+            raise KeyError(name)
+        positions.append(header.index(name))
+    return positions
+
+
+def parse_brand_row(fields, columns):
+    """Turn a brand CSV row into a Brand record (without an ID), or None if it has no name."""
+    brand_name, founded_str, country_of_origin = (
+        fields[i].strip() if i < len(fields) else '' for i in columns)
+    if not brand_name:
+        return None
+
+    # Founded years like "1791 - 1852" are not a single year; leave them out.
+    founded_year = int(founded_str) if founded_str.isdigit() else None
+    return Brand(None, brand_name, founded_year, country_of_origin or None)
+
+
 def import_brands_from_csv(filename):
-    """Import brands from a CSV file."""
+    """Import brands from a CSV file; returns how many were created, or None on failure."""
     if not os.path.exists(filename):
         print(f"Error: File {filename} not found.")
         return
 
-    with open(filename, 'r', encoding='utf-8') as csvfile:
-        csvreader = csv.DictReader(csvfile)
+    with open_input(filename) as csvfile:
+        csvreader = csv.reader(csvfile)
+        try:
+            columns = _csv_columns(next(csvreader, []), BRAND_CSV_COLUMNS)
+        except KeyError as e:
+            print(f"Error: {filename} is missing column {e}.")
+            return
+
+        from sketches import update_catalog_sketches
+
+        db = RetryingConnection()
+        created_count = 0
+        try:
+            resolver = db.run(_load_resolver)
+
+            for fields in csvreader:
+                try:
+                    brand = parse_brand_row(fields, columns)
+                    if brand is None:
+                        print(f"Skipping row due to missing brand name.")
+                        continue
+
+                    brand_id, created = db.run(resolver.get_or_create, brand.brand_name,
+                                               brand.founding_year, brand.country_of_origin)
+                    if created:
+                        created_count += 1
+                        print(f"Brand '{brand.brand_name}' added successfully with ID {brand_id}.")
+                    else:
+                        print(f"Brand '{brand.brand_name}' already exists with ID {brand_id}.")
+
+                except Exception as e:
+                    if is_transient_error(e):
+                        raise
+                    print(f"An error occurred while importing brand '{
+                          fields[columns[0]].strip() if columns[0] < len(fields) else 'Unknown'}': {e}")
+
+            db.run(_seed_brand_aliases, resolver)
+            db.run(update_catalog_sketches)
+        finally:
+            db.close()
+
+        print("Brand import completed.")
+        return created_count
+
+
+# Number of watch rows sent to the database per INSERT by the importers.
+BATCH_SIZE = 500
+
+# How the importers treat repeated ModelNames: keep the first row seen, or
+# let later rows replace earlier ones.
+DEDUP_POLICIES = ('first', 'last')
+
+# ModelNames remembered exactly per import before switching to a Bloom filter.
+DEDUP_MAX_EXACT_KEYS = 1_000_000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    The k bit positions come from one blake2b digest by double hashing.
+    False positives happen at roughly error_rate once capacity keys are in;
+    false negatives never happen.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key):
+        """Add key; returns True if it was (probably) present already."""
+        present = True
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                present = False
+                self._bits[byte] |= 1 << bit
+        return present
+
+    def __contains__(self, key):
+        return all(self._bits[position // 8] & (1 << (position % 8))
+                   for position in self._positions(key))
+
+
+class SeenSet:
+    """Set of keys whose memory stays bounded on huge inputs.
+
+    Keys are held exactly until max_exact of them have been added. After
+    that they move into a BloomFilter sized for bloom_capacity keys, and a
+    new key is misreported as seen with probability about error_rate.
+    """
+
+    def __init__(self, max_exact=DEDUP_MAX_EXACT_KEYS, bloom_capacity=None, error_rate=0.001):
+        self.max_exact = max_exact
+        self.bloom_capacity = bloom_capacity or 10 * max_exact
+        self.error_rate = error_rate
+        self._exact = set()
+        self._bloom = None
+
+    def __contains__(self, key):
+        if self._bloom is not None:
+            return key in self._bloom
+        return key in self._exact
 
-        for row in csvreader:
+    def add(self, key):
+        """Add key; returns True if it had been added before."""
+        if self._bloom is not None:
+            return self._bloom.add(key)
+        if key in self._exact:
+            return True
+        self._exact.add(key)
+        if len(self._exact) > self.max_exact:
+            self._bloom = BloomFilter(self.bloom_capacity, self.error_rate)
+            for seen in self._exact:
+                self._bloom.add(seen)
+            self._exact = None
+        return False
+
+
+# Widths of the Watch text columns, in parse_watch_row() field order, so
+# that overlong values are rejected per row instead of failing a batch.
+WATCH_TEXT_LIMITS = (('model name', 100), ('dial color', 50), ('movement type', 50),
+                     ('movement caliber', 50), ('case material', 50))
+
+# Longest parsed numbers, as text: CaseDiameter is VARCHAR(10), and water
+# resistance must also fit the INTEGER WaterResistanceM generated from it.
+CASE_DIAMETER_MAX_LENGTH = 10
+WATER_RESISTANCE_MAX_LENGTH = 9
+
+
+def _parse_measurement(value, unit, cast, label, max_length):
+    """Parse values like '40mm' or '300m' into numbers; 'n/a' and blanks become None."""
+    text = value.strip().lower()
+    if not text or text == 'n/a':
+        return None
+    try:
+        number = cast(text.replace(unit, '').strip())
+    except ValueError:
+        raise ValueError(f"invalid {label} {value.strip()!r}") from None
+    if not math.isfinite(number) or number < 0 or len(str(number)) > max_length:
+        raise ValueError(f"invalid {label} {value.strip()!r}")
+    return number
+
+
+def parse_watch_row(fields, columns):
+    """Validate a watch CSV row and return (brand_name, Watch).
+
+    columns are the positions of WATCH_CSV_COLUMNS in the row. The Watch
+    has no BrandID yet. Raises ValueError for bad values, including any
+    that would not fit their Watch column.
+    """
+    if len(fields) <= max(columns):
+        raise ValueError(f"expected {max(columns) + 1} fields, got {len(fields)}")
+    (model_name, dial_color, movement_type, movement_caliber, case_material,
+     case_diameter, water_resistance) = (fields[i] for i in columns)
+
+    model_name = model_name.strip()
+    if not model_name:
+        raise ValueError("missing model name")
+    texts = (model_name, dial_color, movement_type, movement_caliber, case_material)
+    for (label, max_length), text in zip(WATCH_TEXT_LIMITS, texts):
+        if len(text) > max_length:
+            raise ValueError(f"{label} longer than {max_length} characters")
+
+    return extract_brand_from_model(model_name), Watch(
+        None, None, model_name, dial_color, movement_type, movement_caliber, case_material,
+        _parse_measurement(case_diameter, 'mm', float, 'case diameter', CASE_DIAMETER_MAX_LENGTH),
+        _parse_measurement(water_resistance, 'm', int, 'water resistance',
+                           WATER_RESISTANCE_MAX_LENGTH))
+
+
+def _resolve_brand_id(conn, resolver, model_name, brand_name):
+    """BrandID for a watch: the known brand its model name starts with, else brand_name.
+
+    brand_name (from extract_brand_from_model) is created if the resolver
+    does not know it. New brands are committed straight away so concurrent
+    importers never wait on a brand row held by another worker's open
+    transaction.
+    """
+    brand_id = resolver.resolve_model(model_name)
+    if brand_id is None:
+        brand_id, _ = resolver.get_or_create(conn, brand_name)
+    return brand_id
+
+
+def _write_watch_batch(conn, batch, sql=INSERT_WATCHES_SQL):
+    """Insert a batch of watch rows in one statement; returns the number written.
+
+    Rows are sorted by the conflict key, so concurrent importers take row
+    locks in the same order and cannot deadlock each other. On a
+    partitioned Watch that key starts with BrandID, which also sends the
+    rows to each partition in one contiguous run. The batch must not repeat
+    a ModelName when sql is UPSERT_WATCHES_SQL.
+    """
+    import psycopg2.extras  # type: ignore
+
+    adapted_sql = watch_sql(conn, sql)
+    partitioned = adapted_sql != sql
+    if partitioned:
+        batch = sorted(batch, key=lambda watch: (watch.brand_id, watch.model_name))
+    else:
+        batch = sorted(batch, key=lambda watch: watch.model_name)
+
+    written = 0
+    with conn.cursor() as cur:
+        if partitioned and WATCH_UPSERT_ACTION in sql:
+            moved = {model_name for model_name, in psycopg2.extras.execute_values(
+                cur, MOVE_WATCH_BRANDS_SQL, [watch.insert_values() for watch in batch],
+                page_size=len(batch), fetch=True)}
+            written += len(moved)
+            batch = [watch for watch in batch if watch.model_name not in moved]
+        if batch:
+            psycopg2.extras.execute_values(
+                cur, adapted_sql, [watch.insert_values() for watch in batch],
+                page_size=len(batch))
+            written += cur.rowcount
+    conn.commit()
+    return written
+
+
+def _import_watch_file(db, filename, resolver=None, dedup='first', seen=None):
+    """Import one watch CSV over a RetryingConnection and return its counts.
+
+    Brands are looked up through resolver, a BrandResolver loaded from the
+    database by default. Brand creation and batch writes are replayed on
+    transient errors; once retries run out the error propagates, with all
+    earlier batches committed. Repeated ModelNames are dropped before they reach the database. With
+    dedup='first', the first accepted row wins across the whole file: seen (a
+    SeenSet, new by default) tracks every accepted ModelName, and rows
+    matching an existing Watch are left alone. With dedup='last', the last
+    parseable row of each ModelName wins across the whole file (see
+    _last_row_numbers()) and overwrites rows stored by earlier runs.
+    Raises KeyError if the header lacks one of WATCH_CSV_COLUMNS.
+    """
+    if dedup not in DEDUP_POLICIES:
+        raise ValueError(f"dedup must be one of {DEDUP_POLICIES}, not {dedup!r}")
+    if seen is None:
+        seen = SeenSet()
+    if resolver is None:
+        resolver = db.run(_load_resolver)
+    sql = INSERT_WATCHES_SQL if dedup == 'first' else UPSERT_WATCHES_SQL
+
+    stats = {"rows": 0, "imported": 0, "skipped": 0, "duplicates": 0}
+    _read_watch_file(db, filename, resolver, dedup, seen, sql, stats)
+    return stats
+
+
+def _last_row_numbers(filename):
+    """Map each ModelName in a watch CSV to its last row that parse_watch_row() accepts.
+
+    Rows are numbered from 0 after the header. This is the first pass of a
+    dedup='last' import, so it holds every distinct ModelName in memory.
+    """
+    last_rows = {}
+    with open_input(filename) as csvfile:
+        csvreader = csv.reader(csvfile)
+        columns = _csv_columns(next(csvreader, []), WATCH_CSV_COLUMNS)
+        for number, fields in enumerate(csvreader):
+            try:
+                _, watch = parse_watch_row(fields, columns)
+            except ValueError:
+                continue
+            last_rows[watch.model_name] = number
+    return last_rows
+
+
+def _read_watch_file(db, filename, resolver, dedup, seen, sql, stats):
+    last_rows = _last_row_numbers(filename) if dedup == 'last' else None
+    batch = []
+    with open_input(filename) as csvfile:
+        csvreader = csv.reader(csvfile)
+        columns = _csv_columns(next(csvreader, []), WATCH_CSV_COLUMNS)
+        for number, fields in enumerate(csvreader):
+            stats["rows"] += 1
             try:
-                brand_name = row['Brand'].strip()
-                founded_str = row['Founded'].strip()
-                country_of_origin = row['Country Of Origin'].strip(
-                ) if row['Country Of Origin'] else None
-
-                # Check if the brand name is not empty
-                if not brand_name:
-                    print(f"Skipping row due to missing brand name.")
+                brand_name, watch = parse_watch_row(fields, columns)
+                if dedup == 'first' and watch.model_name in seen:
+                    stats["duplicates"] += 1
                     continue
+                if dedup == 'last' and last_rows[watch.model_name] != number:
+                    stats["duplicates"] += 1
+                    continue
+                watch.brand_id = db.run(_resolve_brand_id, resolver, watch.model_name, brand_name)
+            except Exception as e:
+                if is_transient_error(e):
+                    raise
+                model_name = fields[columns[0]] if columns[0] < len(fields) else 'Unknown'
+                print(f"An error occurred while importing watch {model_name}: {e}")
+                stats["skipped"] += 1
+                continue
 
-                # Convert founded year to an integer, or None if invalid
-                founded_year = None
-                if founded_str and founded_str.isdigit():
-                    founded_year = int(founded_str)
+            # Only an accepted row claims its ModelName.
+            if dedup == 'first':
+                seen.add(watch.model_name)
+            batch.append(watch)
+            if len(batch) >= BATCH_SIZE:
+                stats["imported"] += _write_watch_rows(db, batch, sql, stats)
+                batch = []
 
-                # Insert the brand into the database
-                add_brand(brand_name, founded_year, country_of_origin)
+    if batch:
+        stats["imported"] += _write_watch_rows(db, batch, sql, stats)
 
-            except Exception as e:
-                print(f"An error occurred while importing brand '{
-                      row.get('Brand', 'Unknown')}': {e}")
 
-        print("Brand import completed.")
+def _write_watch_rows(db, batch, sql, stats):
+    """_write_watch_batch() over db, falling back to one row at a time if the batch fails.
+
+    A row the database still rejects on its own is reported and counted as
+    skipped, as a row that fails parse_watch_row() is. Transient errors
+    propagate once db's retries run out.
+    """
+    try:
+        return db.run(_write_watch_batch, batch, sql)
+    except Exception as e:
+        if is_transient_error(e):
+            raise
+    written = 0
+    for watch in batch:
+        try:
+            written += db.run(_write_watch_batch, [watch], sql)
+        except Exception as e:
+            if is_transient_error(e):
+                raise
+            print(f"An error occurred while importing watch {watch.model_name}: {e}")
+            stats["skipped"] += 1
+    return written
+
+
+# Accepted spellings of CaseDiameter ("40mm", "42.5 mm") and
+# WaterResistance ("300m") once lower-cased and trimmed. The braces are
+# doubled to survive STAGED_NORMALIZE_SQL.format().
+_STAGED_DIAMETER_RE = r'^[0-9]+(\.[0-9]+)? *(mm)?$'
+_STAGED_WATER_RE = rf'^0*[0-9]{{{{1,{WATER_RESISTANCE_MAX_LENGTH}}}}} *m?$'
+
+# Rejects values wider than their Watch column, as parse_watch_row() does.
+_STAGED_LENGTH_CHECKS = "\n               ".join(
+    f"WHEN length(p.{column}) > {max_length} "
+    f"THEN '{label} longer than {max_length} characters'"
+    for column, (label, max_length) in zip(
+        ('ModelName', 'DialColor', 'MovementType', 'MovementCaliber', 'CaseMaterial'),
+        WATCH_TEXT_LIMITS))
+
+# brand_key() in SQL, for the first n words of a staged ModelName. NFKD
+# splits accented letters into a base letter and a mark, which the
+# [:alnum:] filter then drops, as brand_key() does.
+_STAGED_PREFIX_KEY = (
+    "regexp_replace(normalize(lower(array_to_string(p.Words[1:n], ' ')), NFKD), "
+    "'[^[:alnum:]]', '', 'g')")
+
+# Normalises the raw staging rows, resolves each model's brand the way
+# BrandResolver.resolve_model() does (the most leading words whose key is
+# a BrandKey or an alias), and records why a row is rejected.
+STAGED_NORMALIZE_SQL = f"""
+    CREATE TEMP TABLE watch_staged ON COMMIT DROP AS
+    WITH parsed AS (
+        SELECT LineNo, FieldCount, NULLIF(btrim(ModelName), '') AS ModelName, DialColor, MovementType,
+               MovementCaliber, CaseMaterial,
+               lower(btrim(coalesce(CaseDiameter, ''))) AS DiameterText,
+               lower(btrim(coalesce(WaterResistance, ''))) AS WaterText,
+               regexp_split_to_array(btrim(ModelName), '\\s+') AS Words
+        FROM {{staging}}
+    )
+    SELECT p.LineNo, p.ModelName, p.DialColor, p.MovementType, p.MovementCaliber, p.CaseMaterial,
+           CASE WHEN p.DiameterText ~ '{_STAGED_DIAMETER_RE}'
+                THEN regexp_replace(p.DiameterText, ' *mm$', '')::numeric END AS CaseDiameter,
+           CASE WHEN p.WaterText ~ '{_STAGED_WATER_RE}'
+                THEN regexp_replace(p.WaterText, ' *m$', '')::integer END AS WaterResistance,
+           b.BrandID,
+           CASE
+               WHEN p.FieldCount < {{min_fields}}
+                   THEN 'expected {{min_fields}} fields, got ' || p.FieldCount
+               WHEN p.ModelName IS NULL THEN 'missing model name'
+               {_STAGED_LENGTH_CHECKS}
+               WHEN p.DiameterText NOT IN ('', 'n/a') AND p.DiameterText !~ '{_STAGED_DIAMETER_RE}'
+                   THEN 'invalid case diameter'
+               WHEN p.WaterText NOT IN ('', 'n/a') AND p.WaterText !~ '{_STAGED_WATER_RE}'
+                   THEN 'invalid water resistance'
+               WHEN length(regexp_replace(p.DiameterText, ' *mm$', ''))
+                    > {CASE_DIAMETER_MAX_LENGTH} THEN 'invalid case diameter'
+               WHEN b.BrandID IS NULL THEN 'unknown brand'
+           END AS RejectReason
+    FROM parsed p
+    LEFT JOIN LATERAL (
+        SELECT k.BrandID
+        FROM generate_series(least(cardinality(p.Words), {BrandResolver.MAX_BRAND_WORDS}), 1, -1) n
+        JOIN (SELECT BrandKey AS Key, BrandID FROM Brand WHERE BrandKey IS NOT NULL
+              UNION ALL
+              SELECT AliasKey, BrandID FROM BrandAlias) k
+          ON k.Key = {_STAGED_PREFIX_KEY}
+        ORDER BY n DESC
+        LIMIT 1
+    ) b ON true
+"""
+
+# One row per ModelName: the first in the file (line_order ASC, with
+# DO NOTHING) or the last (DESC, with WATCH_UPSERT_ACTION). Sorted by
+# ModelName for a consistent lock order.
+STAGED_MERGE_SQL = f"""
+    INSERT INTO Watch (BrandID, ModelName, DialColor, MovementType, MovementCaliber, CaseMaterial, CaseDiameter, WaterResistance)
+    SELECT DISTINCT ON (ModelName)
+           BrandID, ModelName, DialColor, MovementType, MovementCaliber, CaseMaterial,
+           {CASE_DIAMETER_TEXT_SQL.format('CaseDiameter')}, WaterResistance::text
+    FROM watch_staged
+    WHERE RejectReason IS NULL {{moved_filter}}
+    ORDER BY ModelName, LineNo {{line_order}}
+    ON CONFLICT (ModelName) {{conflict_action}}
+"""
+
+# moved_filter for STAGED_MERGE_SQL after STAGED_MOVE_BRANDS_SQL.
+STAGED_NOT_MOVED_SQL = "AND ModelName NOT IN (SELECT ModelName FROM watch_moved)"
+
+STAGED_MOVED_TABLE_SQL = """
+    CREATE TEMP TABLE watch_moved (ModelName VARCHAR(100) PRIMARY KEY) ON COMMIT DROP
+"""
+
+# MOVE_WATCH_BRANDS_SQL for the staged rows that STAGED_MERGE_SQL would
+# upsert (line_order DESC), recording the moved ModelNames in watch_moved.
+STAGED_MOVE_BRANDS_SQL = f"""
+    WITH moved AS (
+        UPDATE Watch w
+        SET BrandID = s.BrandID, DialColor = s.DialColor, MovementType = s.MovementType,
+            MovementCaliber = s.MovementCaliber, CaseMaterial = s.CaseMaterial,
+            CaseDiameter = {CASE_DIAMETER_TEXT_SQL.format('s.CaseDiameter')},
+            WaterResistance = s.WaterResistance::text
+        FROM (SELECT DISTINCT ON (ModelName) *
+              FROM watch_staged
+              WHERE RejectReason IS NULL
+              ORDER BY ModelName, LineNo DESC) s,
+             WatchModelName m
+        WHERE m.ModelName = s.ModelName AND m.BrandID <> s.BrandID
+          AND w.BrandID = m.BrandID AND w.ModelName = m.ModelName
+        RETURNING w.ModelName
+    )
+    INSERT INTO watch_moved SELECT ModelName FROM moved
+"""
+
+STAGED_COUNTS_SQL = """
+    SELECT COUNT(*),
+           COUNT(*) FILTER (WHERE RejectReason IS NOT NULL),
+           COUNT(*) FILTER (WHERE RejectReason IS NULL)
+               - COUNT(DISTINCT ModelName) FILTER (WHERE RejectReason IS NULL)
+    FROM watch_staged
+"""
+
+STAGED_REJECTS_SQL = """
+    SELECT LineNo, ModelName, RejectReason
+    FROM watch_staged
+    WHERE RejectReason IS NOT NULL
+    ORDER BY LineNo
+    LIMIT %s
+"""
+
+
+class _CsvCopySource:
+    """Readable file of CSV rows, re-written by csv.writer, for COPY ... FROM STDIN.
+
+    COPY's CSV parser treats a quote inside an unquoted field as the start
+    of a quoted section (Grand Seiko SBGA211G "Snowflake" loses its
+    quotes), while the csv module keeps it. Rows parsed by the csv module
+    and written back out quote such fields, so COPY reads the same values
+    as the row-by-row import. Blank lines are dropped, as COPY rejects them.
+
+    Rows are padded or cut to width fields, since COPY fails the whole
+    load on a row of another length, and the original field count is
+    appended so the validation SQL can reject short rows.
+    """
+
+    def __init__(self, rows, width):
+        self._rows = rows
+        self._width = width
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+
+    def read(self, size=-1):
+        for row in self._rows:
+            if row:
+                fields = (row + [''] * self._width)[:self._width]
+                self._writer.writerow(fields + [len(row)])
+                if 0 <= size <= self._buffer.tell():
+                    break
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def _import_watch_file_staged(conn, filename, dedup='first', max_reported=20):
+    """Import one watch CSV by bulk-loading it and validating it in SQL.
+
+    The file is COPYed into an UNLOGGED staging table, parsed by the csv
+    module on the way (see _CsvCopySource) so fields match the other path.
+    Normalisation, brand resolution against Brand and de-duplication then
+    run as set-based SQL, followed by a single INSERT ... SELECT into
+    Watch. Unlike the row-by-row path, models whose brand is not already
+    in Brand or BrandAlias are rejected, not filed under a new brand. Everything happens
+    in one transaction, and the staging table is dropped before commit.
+    dedup has the same meaning as for _import_watch_file(). Raises KeyError
+    if the header lacks one of WATCH_CSV_COLUMNS.
+    """
+    if dedup not in DEDUP_POLICIES:
+        raise ValueError(f"dedup must be one of {DEDUP_POLICIES}, not {dedup!r}")
+    with open_input(filename) as csvfile:
+        header = [name.strip() for name in next(csv.reader(csvfile), [])]
+    positions = _csv_columns(header, WATCH_CSV_COLUMNS)
+    columns = [name if name in WATCH_CSV_COLUMNS else f"Extra{position}"
+               for position, name in enumerate(header)]
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_backend_pid()")
+        staging = f"watch_staging_{cur.fetchone()[0]}"
+        cur.execute(f"""
+            CREATE UNLOGGED TABLE {staging} (
+                LineNo BIGINT GENERATED ALWAYS AS IDENTITY,
+                {", ".join(f"{column} TEXT" for column in columns)},
+                FieldCount INTEGER
+            )
+        """)
+        with open_input(filename) as csvfile:
+            csvreader = csv.reader(csvfile)
+            next(csvreader, None)
+            cur.copy_expert(
+                f"COPY {staging} ({', '.join(columns)}, FieldCount) FROM STDIN WITH (FORMAT csv)",
+                _CsvCopySource(csvreader, len(columns)))
+
+        # As in parse_watch_row(), a row must reach the last watch column.
+        cur.execute(STAGED_NORMALIZE_SQL.format(staging=staging, min_fields=max(positions) + 1))
+        imported = 0
+        moved_filter = ''
+        if dedup == 'last' and _watch_partitioned_on(conn):
+            cur.execute(STAGED_MOVED_TABLE_SQL)
+            cur.execute(STAGED_MOVE_BRANDS_SQL)
+            imported += cur.rowcount
+            moved_filter = STAGED_NOT_MOVED_SQL
+        if dedup == 'first':
+            merge_sql = STAGED_MERGE_SQL.format(line_order='ASC', conflict_action='DO NOTHING',
+                                                moved_filter=moved_filter)
+        else:
+            merge_sql = STAGED_MERGE_SQL.format(line_order='DESC', conflict_action=WATCH_UPSERT_ACTION,
+                                                moved_filter=moved_filter)
+        cur.execute(watch_sql(conn, merge_sql))
+        imported += cur.rowcount
+        cur.execute(STAGED_COUNTS_SQL)
+        rows, rejected, duplicates = cur.fetchone()
+        cur.execute(STAGED_REJECTS_SQL, (max_reported,))
+        rejects = cur.fetchall()
+        cur.execute(f"DROP TABLE {staging}")
+    conn.commit()
+
+    for line_no, model_name, reason in rejects:
+        print(f"Rejected data row {line_no} ({model_name or 'no model name'}): {reason}")
+    if rejected > len(rejects):
+        print(f"... and {rejected - len(rejects)} more rejected rows.")
 
+    return {"rows": rows, "imported": imported, "skipped": rejected, "duplicates": duplicates}
 
-def import_watches_from_csv(filename):
+
+def import_watches_from_csv(filename, staged=False, dedup='first'):
+    """Import a watch CSV.
+
+    staged=True validates and merges the file in SQL instead of Python.
+    dedup ('first' or 'last') decides which of several rows sharing a
+    ModelName is kept.
+    """
     if not os.path.exists(filename):
         print(f"Error: File {filename} not found.")
         return
 
-    with open(filename, 'r', encoding='utf-8') as csvfile:
-        csvreader = csv.DictReader(csvfile)
-        next(csvreader)
-        for row in csvreader:
-            try:
-                model_name = row.get('ModelName', '')
-                brand_name = extract_brand_from_model(model_name)
+    from sketches import update_catalog_sketches
 
-                if not brand_name:
-                    print(f"Skipping watch model {
-                          row['ModelName']} due to missing brand.")
-                    continue
+    db = RetryingConnection()
+    try:
+        if staged:
+            stats = db.run(_import_watch_file_staged, filename, dedup)
+        else:
+            stats = _import_watch_file(db, filename, dedup=dedup)
+        db.run(update_catalog_sketches)
+    except KeyError as e:
+        print(f"Error: {filename} is missing column {e}.")
+        return
+    except Exception as e:
+        if not is_transient_error(e):
+            print(f"An error occurred: {e}")
+            return
+        print(f"Import of {filename} aborted after {db.max_attempts} attempts: {e}")
+        print("Batches written before the failure are kept; rerunning the import is safe.")
+        return
+    finally:
+        db.close()
 
-                brand_id = add_brand(brand_name)
+    print(f"Watch import completed: {stats['imported']} of {stats['rows']} rows imported, "
+          f"{stats['skipped']} skipped, {stats['duplicates']} duplicates dropped.")
+    return stats
 
-                dial_color = row['DialColor']
-                movement_type = row['MovementType']
-                movement_caliber = row['MovementCaliber']
-                case_material = row['CaseMaterial']
-                case_diameter_str = row['CaseDiameter']
-                case_diameter = float(case_diameter_str.replace(
-                    'mm', '')) if case_diameter_str.lower() != 'n/a' else None
-                water_resistance_str = row['WaterResistance']
-                water_resistance = int(water_resistance_str.replace(
-                    'm', '')) if water_resistance_str.lower() != 'n/a' else None
 
-                add_watch(model_name, dial_color, movement_type, movement_caliber,
-                          case_material, case_diameter, water_resistance)
+def _import_watch_file_worker(filename, staged=False, dedup='first'):
+    """Process-pool entry point: import one file over the worker's own connection."""
+    db = RetryingConnection()
+    try:
+        if staged:
+            return db.run(_import_watch_file_staged, filename, dedup)
+        return _import_watch_file(db, filename, dedup=dedup)
+    finally:
+        db.close()
+
+
+def _input_files(path):
+    """Watch CSVs in a directory (by INPUT_SUFFIXES) or matching a glob, largest first."""
+    if os.path.isdir(path):
+        filenames = [os.path.join(path, name) for name in os.listdir(path)
+                     if name.lower().endswith(INPUT_SUFFIXES)]
+    else:
+        filenames = glob.glob(path)
+    filenames.sort(key=os.path.getsize, reverse=True)
+    return filenames
+
+
+def import_watches_from_directory(path, workers=None, staged=False, dedup='first'):
+    """Import every watch CSV in a directory (or matching a glob) in parallel.
+
+    A directory contributes its files ending in one of INPUT_SUFFIXES, so
+    compressed feeds are picked up alongside plain CSVs. Files are spread
+    over a bounded pool of worker processes, largest first, each worker
+    using its own database connection. Duplicate ModelNames are dropped
+    within each file; across files the database conflict rule decides.
+    """
+    filenames = _input_files(path)
+    if not filenames:
+        print(f"Error: No input files found at {path}.")
+        return
 
-            except KeyError as e:
-                print(f"An error occurred while importing watch '{
-                      row.get('ModelName', 'Unknown')}': Missing column {e}")
+    workers = min(workers or os.cpu_count() or 1, len(filenames))
+    totals = {"files": 0, "failed_files": 0, "rows": 0, "imported": 0, "skipped": 0,
+              "duplicates": 0}
+    start = time.perf_counter()
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_import_watch_file_worker, filename, staged, dedup): filename
+                   for filename in filenames}
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                stats = future.result()
             except Exception as e:
-                print(f"An error occurred while importing watch {
-                      row.get('ModelName', 'Unknown')}: {e}")
+                print(f"An error occurred while importing {filename}: {e}")
+                totals["failed_files"] += 1
                 continue
-        print("Watch import completed")
 
+            totals["files"] += 1
+            for key in ("rows", "imported", "skipped", "duplicates"):
+                totals[key] += stats[key]
+            print(f"{filename}: {stats['imported']} of {stats['rows']} rows imported, "
+                  f"{stats['skipped']} skipped.")
 
-if __name__ == "__main__":
-    # create_tables()
-    import_watches_from_csv('data/watch_models.csv')
-    # explore_database()
-    # import_brands_from_csv('data/watch_brands.csv')
-    # get_all_brands()
+    from sketches import update_catalog_sketches
+
+    update_catalog_sketches()
+    elapsed = time.perf_counter() - start
+    totals["elapsed"] = elapsed
+    print(f"Imported {totals['imported']} of {totals['rows']} watch rows from {totals['files']} files "
+          f"in {elapsed:.1f}s ({totals['rows'] / elapsed:.0f} rows/s, {workers} workers).")
+    if totals["failed_files"]:
+        print(f"{totals['failed_files']} files failed.")
+    return totals
+
+
+def load_brand_snapshot(filename):
+    """BrandResolver from a local copy of the brand table, for dry runs.
+
+    filename is either a brand CSV in the import_brands_from_csv() format
+    (any of INPUT_SUFFIXES) or a binary catalog snapshot written by
+    snapshot.export_snapshot(). Brands in a CSV are numbered in file order.
+    Returns (resolver, existing ModelNames or None for a CSV).
+    """
+    if filename.lower().endswith(INPUT_SUFFIXES):
+        brands = []
+        with open_input(filename) as csvfile:
+            csvreader = csv.reader(csvfile)
+            columns = _csv_columns(next(csvreader, []), BRAND_CSV_COLUMNS)
+            for fields in csvreader:
+                brand = parse_brand_row(fields, columns)
+                if brand is not None:
+                    brands.append((len(brands) + 1, brand.brand_name))
+        return BrandResolver.from_brands(brands), None
+
+    from snapshot import CatalogSnapshot
+
+    snapshot = CatalogSnapshot.open(filename)
+    brands = zip(snapshot.brands['brand_id'].tolist(), snapshot.brands['brand_name'])
+    return BrandResolver.from_brands(brands), set(snapshot.columns['model_name'])
+
+
+def validate_watch_file(filename, resolver, existing=None, max_reported=20):
+    """Run a watch CSV through the import pipeline without a database.
+
+    Rows are parsed, normalised and matched to brands exactly as
+    _import_watch_file() does, against resolver (see load_brand_snapshot()).
+    parse_watch_row() applies the import's checks, column widths included,
+    so a row skipped here would be skipped by the import too.
+    Returns counts of rows, accepted, skipped (rejected) and duplicates
+    (every repeated ModelName in the file, whichever dedup policy picks the
+    winner), plus existing (accepted rows whose ModelName is in existing),
+    new_brands (brand name -> rows that would create it) and the first
+    max_reported rejects as (data row, model name, reason).
+    Raises KeyError if the header lacks one of WATCH_CSV_COLUMNS.
+    """
+    report = {"rows": 0, "accepted": 0, "skipped": 0, "duplicates": 0, "existing": 0,
+              "new_brands": {}, "rejects": []}
+    seen = SeenSet()
+
+    with open_input(filename) as csvfile:
+        csvreader = csv.reader(csvfile)
+        columns = _csv_columns(next(csvreader, []), WATCH_CSV_COLUMNS)
+        for fields in csvreader:
+            report["rows"] += 1
+            try:
+                brand_name, watch = parse_watch_row(fields, columns)
+            except ValueError as e:
+                report["skipped"] += 1
+                if len(report["rejects"]) < max_reported:
+                    model_name = fields[columns[0]].strip() if columns[0] < len(fields) else ''
+                    report["rejects"].append((report["rows"], model_name, str(e)))
+                continue
+
+            if seen.add(watch.model_name):
+                report["duplicates"] += 1
+                continue
+            report["accepted"] += 1
+            if existing is not None and watch.model_name in existing:
+                report["existing"] += 1
+
+            if resolver.resolve_model(watch.model_name) is None and resolver.resolve(brand_name) is None:
+                new_brands = report["new_brands"]
+                new_brands[brand_name] = new_brands.get(brand_name, 0) + 1
+    return report
+
+
+def dry_run_watches(path, brands_filename, max_reported=20):
+    """Validate watch CSVs (a file, directory or glob) against a local brand snapshot.
+
+    Prints a report per file and returns the summed counts, or None if no
+    input was found. Nothing is written anywhere.
+    """
+    filenames = [path] if os.path.isfile(path) else _input_files(path)
+    if not filenames:
+        print(f"Error: No input files found at {path}.")
+        return
+    try:
+        resolver, existing = load_brand_snapshot(brands_filename)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: Could not load brands from {brands_filename}: {e}")
+        return
+
+    totals = {"files": 0, "failed_files": 0, "rows": 0, "accepted": 0, "skipped": 0,
+              "duplicates": 0, "existing": 0}
+    start = time.perf_counter()
+    for filename in filenames:
+        try:
+            report = validate_watch_file(filename, resolver, existing, max_reported)
+        except KeyError as e:
+            print(f"Error: {filename} is missing column {e}.")
+            totals["failed_files"] += 1
+            continue
+        except Exception as e:
+            print(f"An error occurred while reading {filename}: {e}")
+            totals["failed_files"] += 1
+            continue
+
+        totals["files"] += 1
+        for key in ("rows", "accepted", "skipped", "duplicates", "existing"):
+            totals[key] += report[key]
+
+        print(f"{filename}: {report['rows']} rows, {report['accepted']} accepted, "
+              f"{report['skipped']} skipped, {report['duplicates']} duplicates.")
+        if existing is not None:
+            print(f"  {report['existing']} accepted rows match watches already in the catalog.")
+        for line_no, model_name, reason in report["rejects"]:
+            print(f"  Rejected data row {line_no} ({model_name or 'no model name'}): {reason}")
+        if report["skipped"] > len(report["rejects"]):
+            print(f"  ... and {report['skipped'] - len(report['rejects'])} more rejected rows.")
+        for brand_name, count in sorted(report["new_brands"].items()):
+            print(f"  New brand '{brand_name}' would be created ({count} rows).")
+
+    elapsed = time.perf_counter() - start
+    totals["elapsed"] = elapsed
+    if len(filenames) > 1:
+        print(f"Checked {totals['rows']} rows in {totals['files']} files in {elapsed:.1f}s: "
+              f"{totals['accepted']} accepted, {totals['skipped']} skipped, "
+              f"{totals['duplicates']} duplicates.")
+    if totals["failed_files"]:
+        print(f"{totals['failed_files']} files failed.")
+    return totals
+
+
+# Subcommands that can run through a storage.StorageBackend chosen by --db.
+BACKEND_COMMANDS = ('init-db', 'import-brands', 'import-watches', 'add-alias', 'stats',
+                    'list-brands')
+
+
+def _run_on_backend(args):
+    from storage import import_brands, import_watches, open_backend
+
+    with open_backend(args.db) as backend:
+        if args.command == 'init-db':
+            backend.create_schema()
+            print("Tables created successfully.")
+        elif args.command == 'import-brands':
+            rows, created = import_brands(backend, args.path)
+            print(f"Brand import completed: {created} of {rows} brands added.")
+        elif args.command == 'import-watches':
+            filenames = [args.path] if os.path.isfile(args.path) else _input_files(args.path)
+            if not filenames:
+                print(f"Error: No input files found at {args.path}.")
+                return 1
+            for filename in filenames:
+                stats = import_watches(backend, filename, args.dedup)
+                print(f"{filename}: {stats['imported']} of {stats['rows']} rows imported, "
+                      f"{stats['skipped']} skipped, {stats['duplicates']} duplicates dropped.")
+        elif args.command == 'add-alias':
+            brand_id = BrandResolver(backend.brand_keys()).resolve(args.brand)
+            if brand_id is None:
+                print(f"Error: Brand '{args.brand}' not found.")
+                return 1
+            backend.add_alias(args.alias, brand_id)
+            print(f"Alias '{args.alias}' added for brand '{args.brand}'.")
+        elif args.command == 'stats':
+            print_catalog_stats(backend.catalog_stats())
+        elif args.command == 'list-brands':
+            print_all_brands(backend.list_brands())
+    return 0
+
+
+# CLI handlers; each returns the exit status, 0 on success and 1 on failure.
+
+def _init_db(args):
+    return 0 if create_tables(args.partitions, args.spec_index) else 1
 
-    # print("\nAll watches imported into the database.")
+
+def _import_brands(args):
+    return 0 if import_brands_from_csv(args.path) is not None else 1
+
+
+def _add_alias(args):
+    return 0 if add_brand_alias(args.alias, args.brand) is not None else 1
+
+
+def _list_brands(args):
+    print_all_brands()
+    return 0
+
+
+def _partitions(args):
+    if args.vacuum or args.reindex:
+        if not maintain_watch_partitions(vacuum=args.vacuum, reindex=args.reindex):
+            return 1
+    print_watch_partitions()
+    return 0
+
+
+def _similar(args):
+    from similarity import SimilarityIndex
+
+    if args.snapshot:
+        from snapshot import CatalogSnapshot
+
+        index = SimilarityIndex.from_snapshot(CatalogSnapshot.open(args.snapshot))
+    else:
+        index = SimilarityIndex.load()
+    try:
+        matches = index.similar(args.model_name, args.k)
+    except KeyError:
+        print(f"Error: Watch '{args.model_name}' not found.")
+        return 1
+    for model_name, distance in matches:
+        print(f"{model_name} (distance {distance:.2f})")
+    return 0
+
+
+def _range_arg(text):
+    low, separator, high = text.partition(':')
+    if not separator:
+        raise argparse.ArgumentTypeError(f"expected LOW:HIGH, not {text!r}")
+    try:
+        return (float(low) if low.strip() else None, float(high) if high.strip() else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected numbers in {text!r}") from None
+
+
+def _find(args):
+    if args.snapshot:
+        from snapshot import CatalogSnapshot
+
+        filters = {}
+        if args.diameter:
+            filters['case_diameter__between'] = args.diameter
+        if args.water:
+            filters['water_resistance__between'] = args.water
+        if args.movement:
+            filters['movement_type'] = args.movement
+        if args.brand:
+            filters['brand_name'] = args.brand
+        watches = CatalogSnapshot.open(args.snapshot).watches(**filters)[:args.limit]
+    else:
+        watches = find_watches(args.diameter, args.water, args.movement, args.limit, args.brand)
+    for watch in watches:
+        print(f"{watch.model_name}: {watch.case_diameter}mm, {watch.water_resistance}m, "
+              f"{watch.movement_type}")
+    print(f"Total Watches: {len(watches)}")
+    return 0
+
+
+def _export(args):
+    fmt = args.format
+    if fmt is None:
+        extension = os.path.splitext(args.path)[1].lower()
+        fmt = {'.parquet': 'parquet', '.pq': 'parquet', '.arrow': 'arrow', '.ipc': 'arrow',
+               '.feather': 'arrow', '.ndjson': 'ndjson', '.jsonl': 'ndjson',
+               '.csv': 'csv'}.get(extension, 'snapshot')
+    if args.table != 'watches' and fmt not in ('ndjson', 'csv'):
+        print("Error: --table only applies to ndjson and csv exports.")
+        return 1
+
+    if fmt in ('ndjson', 'csv'):
+        from stream_export import export_rows
+
+        rows = export_rows(args.path, args.table, fmt)
+        if args.path != '-':
+            print(f"Exported {rows} rows to {args.path}.")
+    elif fmt == 'snapshot':
+        from snapshot import export_snapshot
+
+        snapshot = export_snapshot(args.path)
+        print(f"Exported {len(snapshot)} watches to {args.path}.")
+    else:
+        from arrow_io import export_watches
+
+        export_watches(args.path)
+    return 0
+
+
+def _stats(args):
+    if args.snapshot:
+        from snapshot import CatalogSnapshot
+
+        print_catalog_stats(CatalogSnapshot.open(args.snapshot).stats())
+        return 0
+    if args.rebuild_sketches:
+        from sketches import rebuild_catalog_sketches
+
+        rebuild_catalog_sketches()
+    return 0 if explore_database(approximate=args.approximate or args.rebuild_sketches) else 1
+
+
+def _changes(args):
+    from changes import print_changes
+
+    watermark = print_changes(args.since)
+    print(f"Next watermark: {watermark}", file=sys.stderr)
+    return 0
+
+
+def _serve(args):
+    from service import serve
+
+    serve(args.host, args.port, args.interval)
+    return 0
+
+
+def _import_watches(args):
+    if args.dry_run:
+        totals = dry_run_watches(args.path, args.brands)
+        return 1 if totals is None or totals["skipped"] or totals["failed_files"] else 0
+    if os.path.isdir(args.path) or glob.has_magic(args.path):
+        stats = import_watches_from_directory(args.path, workers=args.workers,
+                                              staged=args.staged, dedup=args.dedup)
+    else:
+        stats = import_watches_from_csv(args.path, staged=args.staged, dedup=args.dedup)
+    return 1 if stats is None else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='watches.py', description="Watch catalog tools.")
+    parser.add_argument('--profile-ms', type=float, metavar='MS',
+                        help="log the plan of statements slower than MS milliseconds (EXPLAIN ANALYZE for reads)")
+    parser.add_argument('--db', metavar='URL',
+                        help="storage backend, e.g. sqlite:///path/catalog.db "
+                             "(default: $WATCH_DB, else Postgres from the DB_* settings)")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='COMMAND')
+
+    command = commands.add_parser('init-db', help="create or upgrade the tables")
+    command.add_argument('--partitions', type=int, metavar='N',
+                         help="create a new Watch table hash-partitioned on BrandID into N parts")
+    command.add_argument('--spec-index', choices=tuple(SPEC_INDEX_SQL), default='btree',
+                         help="index for diameter/water-resistance ranges (default: btree; "
+                              "brin suits append-only tables)")
+    command.set_defaults(handler=_init_db)
+
+    command = commands.add_parser('partitions',
+                                  help="list Watch partitions, optionally vacuum or reindex them")
+    command.add_argument('--vacuum', action='store_true',
+                         help="VACUUM (ANALYZE) each partition in turn")
+    command.add_argument('--reindex', action='store_true',
+                         help="REINDEX each partition CONCURRENTLY in turn")
+    command.set_defaults(handler=_partitions)
+
+    command = commands.add_parser('import-brands', help="import brands from a CSV file")
+    command.add_argument('path')
+    command.set_defaults(handler=_import_brands)
+
+    command = commands.add_parser(
+        'import-watches', help="import watches from a CSV file, a directory or a glob")
+    command.add_argument('path')
+    command.add_argument('--workers', type=int,
+                         help="worker processes for directory/glob imports (default: CPU count)")
+    command.add_argument('--staged', action='store_true',
+                         help="validate and merge in SQL through a staging table")
+    command.add_argument('--dedup', choices=DEDUP_POLICIES, default='first',
+                         help="which row wins when a ModelName repeats (default: first)")
+    command.add_argument('--dry-run', action='store_true',
+                         help="validate only, against --brands, without a database; "
+                              "exits 1 if any row is rejected")
+    command.add_argument('--brands', metavar='FILE',
+                         help="brand CSV or catalog snapshot used by --dry-run")
+    command.set_defaults(handler=_import_watches)
+
+    command = commands.add_parser('add-alias', help="add another spelling for a brand")
+    command.add_argument('alias')
+    command.add_argument('brand')
+    command.set_defaults(handler=_add_alias)
+
+    command = commands.add_parser('stats', help="print catalog statistics")
+    source = command.add_mutually_exclusive_group()
+    source.add_argument('--snapshot', metavar='PATH',
+                        help="read a binary snapshot file instead of the database")
+    source.add_argument('--approximate', action='store_true',
+                        help="read the sketches kept up to date by the importers")
+    source.add_argument('--rebuild-sketches', action='store_true',
+                        help="recompute the sketches from the catalog, then print them")
+    command.set_defaults(handler=_stats)
+
+    command = commands.add_parser('similar', help="list the watches most similar to a model")
+    command.add_argument('model_name')
+    command.add_argument('-k', type=int, default=5, help="number of watches to list (default: 5)")
+    command.add_argument('--snapshot', metavar='PATH',
+                         help="read a binary snapshot file instead of the database")
+    command.set_defaults(handler=_similar)
+
+    command = commands.add_parser('find', help="list watches by diameter and water-resistance range")
+    command.add_argument('--diameter', type=_range_arg, metavar='LOW:HIGH',
+                         help="case diameter range in mm, e.g. 38:41 or 40: (either end optional)")
+    command.add_argument('--water', type=_range_arg, metavar='LOW:HIGH',
+                         help="water resistance range in m, e.g. 200:")
+    command.add_argument('--movement', help="movement type, e.g. Automatic")
+    command.add_argument('--brand', help="brand name or alias, e.g. Rolex (the exact name with --snapshot)")
+    command.add_argument('--limit', type=int)
+    command.add_argument('--snapshot', metavar='PATH',
+                         help="read a binary snapshot file instead of the database")
+    command.set_defaults(handler=_find)
+
+    command = commands.add_parser('list-brands', help="list all brands")
+    command.set_defaults(handler=_list_brands)
+
+    command = commands.add_parser('export', help="export the catalog to a file")
+    command.add_argument('path', help="output file, or - for stdout (ndjson and csv only)")
+    command.add_argument('--format', choices=('snapshot', 'parquet', 'arrow', 'ndjson', 'csv'),
+                         help="output format (default: from the file extension, else snapshot)")
+    command.add_argument('--table', choices=('watches', 'brands', 'joined'), default='watches',
+                         help="rows to export as ndjson or csv; joined adds BrandName to watches")
+    command.set_defaults(handler=_export)
+
+    command = commands.add_parser('serve', help="serve the catalog as JSON over HTTP")
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8080)
+    command.add_argument('--interval', type=float, default=5.0,
+                         help="seconds between change-feed polls (default: 5)")
+    command.set_defaults(handler=_serve)
+
+    command = commands.add_parser('changes', help="print brands and watches written since a watermark")
+    command.add_argument('--since', type=int, default=0, metavar='WATERMARK',
+                         help="watermark printed by the previous run (default: 0, everything)")
+    command.set_defaults(handler=_changes)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.db is None:
+        get_db_params()  # loads .env, which may set WATCH_DB
+        args.db = os.getenv('WATCH_DB')
+    if getattr(args, 'dry_run', False) and not args.brands:
+        parser.error("--dry-run needs --brands FILE")
+    if args.db and args.command not in BACKEND_COMMANDS:
+        parser.error(f"{args.command} only works with Postgres; drop --db")
+    if args.db and (getattr(args, 'partitions', None) or getattr(args, 'spec_index', 'btree') != 'btree'):
+        parser.error("--partitions and --spec-index only work with Postgres; drop --db")
+    if args.db and getattr(args, 'staged', False):
+        parser.error("--staged only works with Postgres; drop --db")
+    if args.db and getattr(args, 'workers', None):
+        parser.error("--workers only works with Postgres; drop --db")
+    if args.db and (getattr(args, 'approximate', False) or getattr(args, 'rebuild_sketches', False)):
+        parser.error("--approximate and --rebuild-sketches only work with Postgres; drop --db")
+    if args.profile_ms is not None:
+        logging.basicConfig(level=logging.WARNING)
+        enable_profiling(args.profile_ms)
+    # Dry runs and snapshot stats never touch a database.
+    if args.db and not getattr(args, 'dry_run', False) and not getattr(args, 'snapshot', None):
+        try:
+            return _run_on_backend(args)
+        except KeyError as e:
+            print(f"Error: {args.path} is missing column {e}.")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+        return 1
+    try:
+        return args.handler(args)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
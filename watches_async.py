@@ -0,0 +1,186 @@
+"""Asyncio access to the watch catalog.
+
+Mirrors add_brand, add_watch, get_all_brands and explore_database from
+watches.py on a bounded psycopg 3 connection pool, so a single event loop
+can serve many concurrent requests without a thread per call. Unlike the
+blocking functions, errors are raised to the caller instead of printed.
+
+Pool size is read from DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE (default 1 / 10).
+"""
+import asyncio
+import os
+import weakref
+
+from watches import (
+    AVG_CASE_DIAMETER_SQL,
+    BRAND_COUNT_SQL,
+    BRAND_LOCK_SQL,
+    INSERT_BRAND_SQL,
+    INSERT_WATCH_SQL,
+    IS_WATCH_PARTITIONED_SQL,
+    MOVEMENT_TYPES_SQL,
+    PARTITIONED_WATCH_CONFLICT_TARGET,
+    SELECT_ALL_BRANDS_SQL,
+    SELECT_BRAND_BY_KEY_SQL,
+    SELECT_BRAND_ID_SQL,
+    TOP_BRANDS_SQL,
+    WATCH_CONFLICT_TARGET,
+    WATCH_COUNT_SQL,
+    Brand,
+    Watch,
+    brand_key,
+    brand_lock_key,
+    get_db_params,
+    print_catalog_stats,
+    watch_added_hooks,
+)
+
+# The pool and its lock belong to one event loop, so a process that runs
+# several loops one after another (asyncio.run() twice) gets a fresh pool
+# in each.
+_pool = None
+_pool_loop = None
+_pool_locks = weakref.WeakKeyDictionary()  # event loop -> asyncio.Lock
+
+# Whether Watch is partitioned in the pool's database; asked once per pool.
+_watch_partitioned = None
+
+
+def _pool_lock():
+    loop = asyncio.get_running_loop()
+    lock = _pool_locks.get(loop)
+    if lock is None:
+        lock = _pool_locks[loop] = asyncio.Lock()
+    return lock
+
+
+async def get_pool():
+    """Return the shared connection pool, opening it on first use in this event loop.
+
+    A pool left open by an earlier loop cannot be used or closed from this
+    one and is dropped; call close_pool() before a loop ends to close its
+    connections cleanly.
+    """
+    global _pool, _pool_loop
+    loop = asyncio.get_running_loop()
+    async with _pool_lock():
+        if _pool is not None and _pool_loop is not loop:
+            _pool = None
+        if _pool is None:
+            from psycopg.conninfo import make_conninfo  # type: ignore
+            from psycopg_pool import AsyncConnectionPool  # type: ignore
+
+            conninfo = make_conninfo(
+                **{key: value for key, value in get_db_params().items() if value})
+            pool = AsyncConnectionPool(
+                conninfo,
+                min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+                max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                open=False,
+            )
+            await pool.open()
+            _pool, _pool_loop = pool, loop
+    return _pool
+
+
+async def close_pool():
+    global _pool, _watch_partitioned
+    async with _pool_lock():
+        if _pool is not None:
+            if _pool_loop is asyncio.get_running_loop():
+                await _pool.close()
+            _pool = None
+            _watch_partitioned = None
+
+
+async def _fetchall(sql, params=None):
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(sql, params)
+            return await cur.fetchall()
+
+
+async def add_brand(brand_name, founding_year=None, country_of_origin=None):
+    brand_name = ' '.join(brand_name.split())
+    key = brand_key(brand_name)
+    if not key:
+        raise ValueError(f"brand name {brand_name!r} has no letters or digits")
+
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            # Same locking protocol as watches._get_or_create_brand().
+            await cur.execute(SELECT_BRAND_BY_KEY_SQL, (key, key))
+            row = await cur.fetchone()
+            if row is None:
+                await cur.execute(BRAND_LOCK_SQL, brand_lock_key(key))
+                await cur.execute(SELECT_BRAND_BY_KEY_SQL, (key, key))
+                row = await cur.fetchone()
+            if row is None:
+                await cur.execute(INSERT_BRAND_SQL,
+                                  (brand_name, key, founding_year, country_of_origin))
+                row = await cur.fetchone()
+            if row is None:
+                await cur.execute(SELECT_BRAND_ID_SQL, (brand_name,))
+                row = await cur.fetchone()
+    return row[0]
+
+
+async def add_watch(brand_id, model_name, dial_color, movement_type, movement_caliber, case_material, case_diameter, water_resistance):
+    """Insert a watch; like watches.add_watch(), a new one goes to the sketches and watch_added_hooks."""
+    global _watch_partitioned
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        # Same conflict target choice as watches.watch_sql().
+        if _watch_partitioned is None:
+            cur = await conn.execute(IS_WATCH_PARTITIONED_SQL)
+            _watch_partitioned = (await cur.fetchone())[0]
+        sql = INSERT_WATCH_SQL
+        if _watch_partitioned:
+            sql = sql.replace(WATCH_CONFLICT_TARGET, PARTITIONED_WATCH_CONFLICT_TARGET)
+        cur = await conn.execute(sql, (brand_id, model_name, dial_color, movement_type,
+                                       movement_caliber, case_material, case_diameter,
+                                       water_resistance))
+        inserted = cur.rowcount
+    # Leaving pool.connection() committed the insert.
+    if inserted:
+        watch = Watch(None, brand_id, model_name, dial_color, movement_type, movement_caliber,
+                      case_material, case_diameter, water_resistance)
+        from sketches import count_added_watch, update_catalog_sketches
+
+        if count_added_watch():
+            await asyncio.to_thread(update_catalog_sketches)
+        for hook in watch_added_hooks:
+            hook(watch)
+
+
+async def get_all_brands():
+    return [Brand(*row) for row in await _fetchall(SELECT_ALL_BRANDS_SQL)]
+
+
+async def get_catalog_stats():
+    """Async counterpart of watches.get_catalog_stats().
+
+    The queries are independent, so they run concurrently on separate pool
+    connections.
+    """
+    brand_rows, watch_rows, top_brands, avg_rows, movement_types = await asyncio.gather(
+        _fetchall(BRAND_COUNT_SQL),
+        _fetchall(WATCH_COUNT_SQL),
+        _fetchall(TOP_BRANDS_SQL),
+        _fetchall(AVG_CASE_DIAMETER_SQL),
+        _fetchall(MOVEMENT_TYPES_SQL),
+    )
+    avg_diameter = avg_rows[0][0]
+    return {
+        "brand_count": brand_rows[0][0],
+        "watch_count": watch_rows[0][0],
+        "top_brands": top_brands,
+        "avg_case_diameter": float(avg_diameter) if avg_diameter is not None else None,
+        "movement_types": movement_types,
+    }
+
+
+async def explore_database():
+    print_catalog_stats(await get_catalog_stats())